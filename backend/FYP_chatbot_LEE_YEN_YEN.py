@@ -5,13 +5,84 @@
 
 
 import sqlite3
-import spacy
 import re
 from datetime import datetime
 import time, random, sys
 import os
+import json
+import csv
+import io
+import hashlib
+import math
+import threading
+import urllib.parse
+import atexit
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Callable
+
+from convlog import ConversationLog
+from records import Order, OrderItem, Pattern, Product
+
+logger = logging.getLogger(__name__)
 
 DB_FILE = os.getenv("DB_FILE", os.path.join(os.path.dirname(__file__), "data", "chatbot_db.db"))
+# Pre-lemmatized rule artifact built from faq_db_pattern (see build_rules.py)
+RULES_ARTIFACT_FILE = os.getenv("RULES_ARTIFACT_FILE",
+                                os.path.join(os.path.dirname(__file__), "data", "rules_artifact.json"))
+# 2: regex rules carry their build-time benchmark ("cost"); older artifacts are rebuilt
+RULES_ARTIFACT_VERSION = 2
+# How often (seconds) a worker re-checks faq_db_pattern for edits made through SQLite
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "30"))
+# Regex rules only see the first REGEX_MAX_INPUT characters of a message. When rules are
+# built, a regex whose search time on adversarial input grows faster than n^REGEX_MAX_DEGREE
+# is rejected: up to cubic stays bounded at that length, exponential backtracking doesn't
+REGEX_MAX_INPUT = int(os.getenv("REGEX_MAX_INPUT", "500"))
+REGEX_MAX_DEGREE = float(os.getenv("REGEX_MAX_DEGREE", "3.3"))
+# Workers loading the artifact report (but keep) rules now this many times slower than at build
+REGEX_DRIFT_FACTOR = float(os.getenv("REGEX_DRIFT_FACTOR", "4"))
+# Word → lemma lookup table exported from spaCy (see build_rules.py --lemmas)
+LEMMA_TABLE_FILE = os.getenv("LEMMA_TABLE_FILE",
+                             os.path.join(os.path.dirname(__file__), "data", "lemma_table.json"))
+LEMMA_TABLE_MAX = int(os.getenv("LEMMA_TABLE_MAX", "50000"))
+# Per-email open-order cache: users re-ask "where is my order" several times a session
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "30"))
+ORDER_CACHE_MAX = int(os.getenv("ORDER_CACHE_MAX", "10000"))
+# email → (user_id, name), resolved on almost every session start
+IDENTITY_CACHE_MAX = int(os.getenv("IDENTITY_CACHE_MAX", "10000"))
+# get_intent results for repeated messages (cleared whenever the rules reload)
+INTENT_CACHE_MAX = int(os.getenv("INTENT_CACHE_MAX", "10000"))
+INTENT_CACHE_MAX_LEN = 200   # longer messages are too unlikely to repeat to be worth caching
+# Start-up warm-up: replay the most frequent recent messages from this log (plain text
+# lines, or JSON lines with a "message" field); defaults to the conversation log, which
+# only has message text with CONVERSATION_LOG_MESSAGES=1
+WARMUP_LOG_FILE = os.getenv("WARMUP_LOG_FILE", "") or os.getenv("CONVERSATION_LOG_FILE", "")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "500"))
+WARMUP_SCAN_LINES = int(os.getenv("WARMUP_SCAN_LINES", "100000"))
+# In-memory product catalog snapshot is reloaded after this many seconds
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "60"))
+# Change feed: poll faq_db_changes this often (seconds), keeping the newest
+# CHANGE_LOG_KEEP entries for workers that fall behind. Opt-in (default 0 = off):
+# turning it on adds faq_db_changes and triggers to the databases (see install_change_log)
+CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", "0"))
+CHANGE_POLL_BATCH = 10000
+CHANGE_LOG_KEEP = int(os.getenv("CHANGE_LOG_KEEP", "100000"))
+# Bulk catalog imports commit this many rows per transaction (see upsert_products)
+CATALOG_IMPORT_CHUNK = int(os.getenv("CATALOG_IMPORT_CHUNK", "500"))
+# Extra storefronts hosted by this process: "storeA=/data/a.db,storeB=/data/b.db"
+# A tenant may keep its writable tables in a second file: "storeA=/data/a.db|/data/a_writes.db"
+KB_TENANTS = os.getenv("KB_TENANTS", "")
+DEFAULT_TENANT = "default"
+# Writable tables (user_profile, orders, feedback) can live apart from the
+# read-only knowledge base (faq_db, faq_db_pattern, faq_db_products).
+WRITE_DB_FILE = os.getenv("WRITE_DB_FILE", "") or DB_FILE
+# "0" (default): open the knowledge base normally; "1": read-only URI mode;
+# "immutable": also skip all locking (only if the file never changes while running)
+KB_READONLY = os.getenv("KB_READONLY", "0").strip().lower()
+KB_MMAP_SIZE = int(os.getenv("KB_MMAP_SIZE", str(256 * 1024 * 1024)))
 EMAIL_REGEX = r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$"
 FEEDBACK_PROMPT = (
     "Thanks for your support! How do you feel about our service?\n"
@@ -30,60 +101,242 @@ CLOSING_MSG = ("Thanks for your support! If anything else comes up, "
 # DB_FILE = r"D:\DB Browser for SQLite\chatbot_db.db" # Updated to your file path
 # Load the small English model for SpaCy.
 # You need to download it first by running: python -m spacy download en_core_web_sm
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("Spacy model 'en_core_web_sm' not found.")
-    print("Please run: !python -m spacy download en_core_web_sm in a Jupyter cell or")
-    print("python -m spacy download en_core_web_sm in your terminal.")
-    exit()
+# The model is loaded lazily: rules come pre-lemmatized from the artifact, so
+# workers don't pay for spaCy until the first free-text message arrives.
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """Return the shared spaCy pipeline, loading it on first use."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                try:
+                    import spacy
+                    _nlp = spacy.load("en_core_web_sm")
+                except OSError:
+                    raise RuntimeError("spaCy model 'en_core_web_sm' not found; install it with: "
+                                       "python -m spacy download en_core_web_sm") from None
+    return _nlp
+
+
+
+# --- KNOWLEDGE BASES (one per storefront, sharing the spaCy pipeline) ---
+
+class KnowledgeBase:
+    """
+    One storefront's databases plus the per-process caches built from them:
+    compiled rules, answers, catalog snapshot and order caches. Tenants hosted
+    in the same process share the spaCy pipeline and the lemma table.
 
+    `db_file` holds the knowledge base (rules, answers, catalog), which is only
+    read at runtime; `write_db_file` holds user_profile, orders and feedback.
+    They may be the same file.
+    """
 
+    def __init__(self, name: str, db_file: str, rules_artifact_file: str | None = None,
+                 write_db_file: str | None = None):
+        self.name = name
+        self.db_file = db_file
+        self.write_db_file = write_db_file or db_file
+        self.readonly = KB_READONLY in ("1", "true", "ro", "immutable")
+        self.immutable = KB_READONLY == "immutable"
+        if self.immutable and os.path.abspath(self.write_db_file) == os.path.abspath(db_file):
+            logger.warning("KB_READONLY=immutable needs a separate WRITE_DB_FILE; "
+                           "opening %s in read-only mode instead.", db_file)
+            self.immutable = False
+        self._readers = threading.local()
+        self.rules_artifact_file = rules_artifact_file or os.path.join(
+            os.path.dirname(db_file) or ".", f"rules_artifact.{name}.json")
+        self.rules = None          # see compile_rules()
+        self.answers = None        # {"loaded_at": float, "by_intent": {intent: answer}}
+        self.catalog = None        # {"loaded_at": float, "by_id": {id: product}, "ordered": [product]}
+        self.order_cache = {}      # email → (expires_at, open_orders, has_any)
+        self.order_summaries = {}  # order id → (expires_at, rendered summary)
+        self.intent_cache = {}     # lowercased message → (intent, entity)
+        self.regex_stats = {}      # (intent, pattern) → [calls, total_s, max_s], kept across rule reloads
+        self.feedback_ready = False
+        self.order_indexes_ready = False
+        self.identities = {}       # lower(email) → (user_id, name)
+        self.user_upsert = None    # unique lower(email) index usable for ON CONFLICT? (None = not checked)
+        self.unique_emails = None  # unique lower(email) index in place, i.e. one user_profile row per email?
+        self.orders_watch = None   # connection polled for PRAGMA data_version (see _drop_stale_orders)
+        self.orders_version = None
+        self.change_versions = {}  # db file → last applied faq_db_changes version (see start_change_feed)
+        self.change_stats = {"polls": 0, "changes": 0, "resets": 0}
+        self.lock = threading.RLock()
+
+    def connect_readonly(self) -> sqlite3.Connection:
+        """
+        Per-thread connection opened with SQLite's read-only (or immutable) URI
+        so readers never take write locks, with a large mmap window.
+        """
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            flag = "immutable=1" if self.immutable else "mode=ro"
+            uri = f"file:{urllib.parse.quote(os.path.abspath(self.db_file))}?{flag}"
+            conn = sqlite3.connect(uri, uri=True)
+            conn.execute(f"PRAGMA mmap_size = {KB_MMAP_SIZE:d}")
+            conn.execute("PRAGMA query_only = 1")
+            self._readers.conn = conn
+        conn.row_factory = None
+        return conn
+
+_KBS: dict[str, KnowledgeBase] = {
+    DEFAULT_TENANT: KnowledgeBase(DEFAULT_TENANT, DB_FILE, RULES_ARTIFACT_FILE, WRITE_DB_FILE),
+}
+for _entry in filter(None, (e.strip() for e in KB_TENANTS.split(","))):
+    _name, _, _paths = _entry.partition("=")
+    _path, _, _write_path = _paths.partition("|")
+    _KBS[_name.strip()] = KnowledgeBase(_name.strip(), _path.strip(), write_db_file=_write_path.strip() or None)
 
-def capture_user_profile():
-    """
-    Ask for name and email in a single prompt like:
-    'Jane Doe jane@example.com'
-    Extracts the email via regex; uses the remaining text as name.
-    If the email exists in DB, keeps the stored name.
-    """
-    while True:
-        raw = input("Hi! please give me your name and email: ").strip()
-        m = re.search(EMAIL_REGEX, raw)
-        if not m:
-            print("I couldn't find a valid email. Try again (e.g., Jane Doe jane@example.com).")
-            continue
+_current_kb: ContextVar[KnowledgeBase | None] = ContextVar("current_kb", default=None)
 
-        email = m.group(0)
-        # Remove the email token from the input to get the name
-        name = raw.replace(email, "").strip(" ,;<>\"'")
+def get_kb(name: str | None = None) -> KnowledgeBase | None:
+    """Knowledge base for a tenant name (None → default), or None if unknown."""
+    return _KBS.get(name or DEFAULT_TENANT)
 
-        if not name:
-            name = input("Got your email. What's your name? ").strip()
-            if not name:
-                print("Name can't be empty.")
-                continue
+def list_tenants() -> list[str]:
+    return list(_KBS)
 
-        # Save to DB (insert if new, keep existing if email found)
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM user_profile WHERE email = ?", (email,))
-        row = cursor.fetchone()
+def current_kb() -> KnowledgeBase:
+    return _current_kb.get() or _KBS[DEFAULT_TENANT]
 
-        if row is None:
-            cursor.execute(
-                "INSERT INTO user_profile (name, email, created_at) VALUES (?, ?, ?)",
-                (name, email, datetime.utcnow().isoformat())
-            )
-            conn.commit()
-            user_id = cursor.lastrowid
+@contextmanager
+def use_kb(kb: KnowledgeBase):
+    """Route every DB read and cache lookup in this block to `kb`."""
+    token = _current_kb.set(kb)
+    try:
+        yield kb
+    finally:
+        _current_kb.reset(token)
+
+# What the engine decided on the current turn (state, intent, entity, scores,
+# stage timings); only collected inside trace_turn(), e.g. for the profiler or
+# the conversation log
+_turn_trace: ContextVar[dict | None] = ContextVar("turn_trace", default=None)
+
+@contextmanager
+def trace_turn():
+    trace = _turn_trace.get()
+    if trace is not None:   # nested: share the outer turn's trace
+        yield trace
+        return
+    trace = {}
+    token = _turn_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _turn_trace.reset(token)
+
+def note_turn(**fields):
+    trace = _turn_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+def connect_kb() -> sqlite3.Connection:
+    """Connection for the knowledge-base tables (faq_db, faq_db_pattern, faq_db_products)."""
+    kb = current_kb()
+    if kb.readonly:
+        return kb.connect_readonly()
+    return sqlite3.connect(kb.db_file)
+
+def connect_db() -> sqlite3.Connection:
+    """Connection for the writable tables (user_profile, orders, feedback)."""
+    return sqlite3.connect(current_kb().write_db_file)
+
+
+# --- 0a. IDENTITY (email → user_id) ---
+
+def _ensure_user_email_index(kb: KnowledgeBase, conn: sqlite3.Connection):
+    """
+    Unique index on lower(email) so identify_user can upsert. Sets kb.unique_emails,
+    and kb.user_upsert to False if duplicates (or an old SQLite) prevent the upsert.
+    """
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_profile_email ON user_profile(lower(email))")
+    except sqlite3.IntegrityError:
+        logger.warning("user_profile has duplicate emails; identify_user falls back to a locked select+insert")
+        kb.unique_emails = kb.user_upsert = False
+        return
+    kb.unique_emails = True
+    kb.user_upsert = sqlite3.sqlite_version_info >= (3, 35)   # upsert ... RETURNING
+
+def _remember_identity(kb: KnowledgeBase, key: str, user_id: int, name: str):
+    with kb.lock:
+        if len(kb.identities) >= IDENTITY_CACHE_MAX:
+            kb.identities.clear()
+        kb.identities[key] = (user_id, name)
+
+def identify_user(email: str, name: str = "") -> dict:
+    """
+    Resolve an email to its user_profile row, creating it if new, in one atomic
+    statement (INSERT ... ON CONFLICT on the unique lower(email) index). An
+    existing user keeps their stored name. Results are cached per knowledge base.
+    """
+    kb = current_kb()
+    email = email.strip()
+    key = email.lower()
+    hit = kb.identities.get(key)
+    if hit is not None:
+        return {"user_id": hit[0], "name": hit[1], "email": email}
+
+    with connect_db() as conn:
+        if kb.user_upsert is None:
+            _ensure_user_email_index(kb, conn)
+        if kb.user_upsert:
+            user_id, stored_name = conn.execute("""
+                INSERT INTO user_profile (name, email, created_at) VALUES (?, ?, ?)
+                ON CONFLICT (lower(email)) DO UPDATE SET name = user_profile.name
+                RETURNING id, name
+            """, (name, email, datetime.utcnow().isoformat())).fetchone()
         else:
-            user_id, existing_name = row
-            # Keep the existing name and ignore the newly typed one
-            name = existing_name
+            # no usable unique index: take the write lock before looking, so two
+            # sessions can't both miss and insert the same email
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id, name FROM user_profile WHERE lower(email) = lower(?) ORDER BY id LIMIT 1",
+                               (email,)).fetchone()
+            if row is None:
+                cur = conn.execute("INSERT INTO user_profile (name, email, created_at) VALUES (?, ?, ?)",
+                                   (name, email, datetime.utcnow().isoformat()))
+                row = (cur.lastrowid, name)
+            user_id, stored_name = row
+    _remember_identity(kb, key, user_id, stored_name)
+    return {"user_id": user_id, "name": stored_name, "email": email}
+
+def lookup_user_id(email: str) -> int | None:
+    """user_id for an email without creating one (None if unknown); cached like identify_user."""
+    kb = current_kb()
+    key = email.strip().lower()
+    hit = kb.identities.get(key)
+    if hit is not None:
+        return hit[0]
+    with connect_db() as conn:
+        row = conn.execute("SELECT id, name FROM user_profile WHERE lower(email) = ? ORDER BY id LIMIT 1",
+                           (key,)).fetchone()
+    if row is None:
+        return None
+    _remember_identity(kb, key, row[0], row[1])
+    return row[0]
 
-        conn.close()
-        return {"user_id": user_id, "name": name, "email": email}
+def lookup_user_ids(email: str) -> list[int]:
+    """
+    Every user_profile id for an email. Once the unique lower(email) index is in
+    place that is the one cached lookup_user_id; until duplicate or case-variant
+    rows are merged, all of them are returned so none of their orders go missing.
+    """
+    kb = current_kb()
+    if kb.unique_emails is None:
+        with connect_db() as conn:
+            _ensure_user_email_index(kb, conn)
+    if kb.unique_emails:
+        user_id = lookup_user_id(email)
+        return [] if user_id is None else [user_id]
+    with connect_db() as conn:
+        rows = conn.execute("SELECT id FROM user_profile WHERE lower(email) = ? ORDER BY id",
+                            (email.strip().lower(),)).fetchall()
+    return [r[0] for r in rows]
 
 
 
@@ -93,48 +346,475 @@ def setup_database():
     """
     Connects to the existing database to ensure it is accessible and contains the required tables.
     This function no longer creates tables or populates data.
+    Raises RuntimeError with a friendly message if it isn't usable.
     """
+    db_file = current_kb().db_file
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect_kb()   # may be a shared read-only connection: don't close it
         cursor = conn.cursor()
 
         # Check if the required tables exist to provide a helpful error message.
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='faq_db'")
-        if cursor.fetchone() is None:
-            print(f"Error: Table 'faq_db' not found in {DB_FILE}.")
-            print("Please ensure your database has the correct table schema.")
-            exit()
-
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='faq_db_pattern'")
-        if cursor.fetchone() is None:
-            print(f"Error: Table 'faq_db_pattern' not found in {DB_FILE}.")
-            print("Please ensure your database has the correct table schema.")
-            exit()
-
-        conn.close()
-        print("Database connection successful. Using existing data.")
+        for table in ("faq_db", "faq_db_pattern"):
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if cursor.fetchone() is None:
+                raise RuntimeError(f"Table '{table}' not found in {db_file}. "
+                                   f"Please ensure your database has the correct table schema.")
     except sqlite3.Error as e:
-        print(f"Database error: {e}")
-        exit()
+        raise RuntimeError(f"Database error: {e}") from None
 
 
 # --- 2. NLP & INTENT RECOGNITION ---
 
-def preprocess_text(text):
+# Lemma lookup table: whitespace-separated chunk (lowercased, punctuation kept)
+# → tuple of lemmas spaCy produced for it. spaCy's tokenizer splits on
+# whitespace first, so a chunk always maps to the same tokens.
+# Writes go through _lemma_lock; only chunks from rule patterns and offline
+# exports (_lemmas_persist) are saved back, user input stays in memory.
+_LEMMAS = None
+_lemma_lock = threading.Lock()
+_lemmas_persist: set[str] = set()
+_lemmas_dirty = False
+_EMAIL_CHUNK_RE = re.compile(r"[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}")
+
+def get_lemma_table() -> dict:
+    global _LEMMAS
+    if _LEMMAS is None:
+        with _lemma_lock:
+            if _LEMMAS is None:
+                _LEMMAS = read_lemma_table()
+    return _LEMMAS
+
+def read_lemma_table(path: str | None = None) -> dict:
+    try:
+        with open(path or LEMMA_TABLE_FILE, encoding="utf-8") as f:
+            return {k: tuple(v) for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        return {}
+
+def save_lemma_table(path: str | None = None) -> str | None:
+    """
+    Persist entries learned at runtime. Merges with what is already on disk
+    (other workers may have saved their own misses) and writes atomically.
+    """
+    global _lemmas_dirty
+    if _LEMMAS is None or not (_lemmas_dirty or path):
+        return None
+    with _lemma_lock:
+        learned = {key: _LEMMAS[key] for key in _lemmas_persist}
+        _lemmas_dirty = False
+    path = path or LEMMA_TABLE_FILE
+    merged = read_lemma_table(path)
+    merged.update(learned)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({k: list(v) for k, v in merged.items()}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+@atexit.register
+def _save_lemma_table_on_exit():
+    try:
+        save_lemma_table()
+    except OSError:
+        pass
+
+def _spacy_lemmas(text: str, persist: bool = False) -> list[str]:
+    """
+    Run spaCy on lowercased text and add every unseen chunk to the lookup table.
+    With `persist`, the chunks are also saved by save_lemma_table.
+    """
+    global _lemmas_dirty
+    table = get_lemma_table()
+    lemmas, chunk, chunk_lemmas, learned = [], [], [], {}
+    for token in get_nlp()(text):
+        if not token.is_space:
+            chunk.append(token.text)
+            if not token.is_punct:
+                chunk_lemmas.append(token.lemma_)
+                lemmas.append(token.lemma_)
+        if chunk and (token.whitespace_ or token.is_space):
+            learned["".join(chunk)] = tuple(chunk_lemmas)
+            chunk, chunk_lemmas = [], []
+    if chunk:
+        learned["".join(chunk)] = tuple(chunk_lemmas)
+    with _lemma_lock:
+        for key, value in learned.items():
+            if key not in table:
+                if not persist and len(table) >= LEMMA_TABLE_MAX:
+                    continue
+                table[key] = value
+            if persist and key not in _lemmas_persist:
+                _lemmas_persist.add(key)
+                _lemmas_dirty = True
+    return lemmas
+
+def preprocess_text(text, persist=False):
     """
     Processes user input by converting to lowercase, removing punctuation,
-    and lemmatizing tokens.
+    and lemmatizing tokens. Known words are a plain dict lookup; spaCy only
+    runs when the message contains an out-of-vocabulary word.
 
     Args:
         text (str): The raw user input.
+        persist (bool): Also save the words to the lemma table file (rule
+            patterns only; user input is cached in memory but never saved).
 
     Returns:
         list: A list of lemmatized tokens.
     """
-    doc = nlp(text.lower())
-    lemmas = [token.lemma_ for token in doc if not token.is_punct and not token.is_space]
+    text = text.lower()
+    if persist:
+        return _spacy_lemmas(text, persist)
+    table = get_lemma_table()
+    lemmas = []
+    for chunk in text.split():
+        hit = table.get(chunk)
+        if hit is None:
+            # Numbers and emails lemmatize to themselves; don't let them fill the table
+            if chunk.isdigit() or _EMAIL_CHUNK_RE.fullmatch(chunk):
+                hit = (chunk,)
+            else:
+                return _spacy_lemmas(text)
+        lemmas.extend(hit)
     return lemmas
 
+def build_lemma_table(texts) -> dict:
+    """Offline export: lemmatize texts with spaCy and return the resulting table."""
+    for text in texts:
+        _spacy_lemmas(text.lower(), persist=True)
+    return get_lemma_table()
+
+
+# --- 2a. COMPILED RULES (on-disk artifact) ---
+
+def _fetch_rule_rows() -> list[Pattern]:
+    with connect_kb() as conn:
+        cur = conn.cursor()
+        cur.row_factory = Pattern.row_factory
+        cur.execute(f"SELECT {Pattern.COLUMNS} FROM faq_db_pattern ORDER BY rowid")
+        return cur.fetchall()
+
+def rules_source_hash(rows: list[Pattern]) -> str:
+    """Content hash of the faq_db_pattern rows; the artifact is keyed by it."""
+    h = hashlib.sha256()
+    for row in rows:
+        h.update(json.dumps(list(row), ensure_ascii=False).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+def build_rules_artifact(rows: list[Pattern] | None = None) -> dict:
+    """
+    Compile faq_db_pattern rows into a JSON-serialisable artifact:
+    keywords are lemmatized once with spaCy and every regex is test-compiled
+    and benchmarked (see regex_profile). Rules whose regex doesn't compile or
+    grows faster than n^REGEX_MAX_DEGREE are left out and listed under "invalid";
+    the others keep their benchmark as "cost". This is the only place a regex
+    is judged, so every worker loading the artifact serves the same rules.
+    """
+    if rows is None:
+        rows = _fetch_rule_rows()
+    rules, invalid = [], []
+    for intent, type, pattern, weight in rows:
+        rule = {"intent": intent, "type": type, "pattern": pattern, "weight": weight}
+        if type == 'keyword':
+            rule["lemmas"] = preprocess_text(pattern, persist=True)
+        elif type == 'regex':
+            error, profile = _regex_verdict(pattern)
+            if error:
+                invalid.append({"intent": intent, "pattern": pattern, "error": error})
+                continue
+            rule["cost"] = {k: profile[k] for k in ("degree", "ms", "probe", "chars")}
+        rules.append(rule)
+    return {
+        "version": RULES_ARTIFACT_VERSION,
+        "source_hash": rules_source_hash(rows),
+        "built_at": datetime.utcnow().isoformat(),
+        "rules": rules,
+        "invalid": invalid,
+    }
+
+# Input lengths for the regex benchmark: doubling up to REGEX_MAX_INPUT, so
+# exponential backtracking shows up while it is still cheap to observe
+def _probe_lengths() -> list[int]:
+    lengths, n = [], 8
+    while n < REGEX_MAX_INPUT:
+        lengths.append(n)
+        n *= 2
+    return lengths + [REGEX_MAX_INPUT]
+
+# Searches faster than this are too short to time reliably (and too cheap to matter)
+_REGEX_TIMING_FLOOR_MS = 0.05
+
+def _time_search(regex: re.Pattern, text: str, repeat: int = 1) -> float:
+    """
+    CPU time of one search in ms (this thread's, so other processes and threads
+    competing for the CPU don't inflate it). With repeat > 1, the best of
+    `repeat` rounds, each long enough to read off the clock.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        runs = 1
+        while True:
+            t = time.thread_time()
+            for _ in range(runs):
+                regex.search(text)
+            ms = (time.thread_time() - t) * 1000
+            if repeat == 1 or ms >= 4 * _REGEX_TIMING_FLOOR_MS or runs >= 256:
+                break
+            runs *= 4
+        best = min(best, ms / runs)
+    return best
+
+# Sample text for the character classes a pattern's escapes stand for
+_ESCAPE_SAMPLES = {"s": " ", "d": "1", "w": "a", "S": "a", "D": "a", "W": "-"}
+_REGEX_SYNTAX = set("()[]{}?*+|^$.")
+
+def _pattern_alphabet(pattern: str) -> tuple[list[str], list[str]]:
+    """Literal words and punctuation characters of a pattern (\\s, \\d, \\w become a sample character)."""
+    words, puncts, word = [], [], ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == "\\" and i < len(pattern):
+            c = pattern[i]
+            i += 1
+            if c.isalnum():
+                c = _ESCAPE_SAMPLES.get(c, "")
+        elif c in _REGEX_SYNTAX:
+            c = ""
+        if c.isalnum():
+            word += c.lower()
+            continue
+        if word:
+            words.append(word)
+            word = ""
+        if c and not c.isspace():
+            puncts.append(c)
+    if word:
+        words.append(word)
+    return list(dict.fromkeys(words))[:8], list(dict.fromkeys(puncts))[:8]
+
+def _probe_end(puncts: list[str]) -> str:
+    """A last character the pattern doesn't mention, so adversarial probes fail to match."""
+    return next((c for c in "!#~%" if c not in puncts), "\x00")
+
+def _probe_text(unit: str, n: int, end: str) -> str:
+    return (unit * n)[:n] + end
+
+def regex_profile(regex: re.Pattern) -> dict:
+    """
+    How a regex's search time grows on adversarial inputs. Inputs repeat a short
+    unit (a letter, a digit, a space, words and punctuation taken from the
+    pattern) and end in a character the pattern doesn't use, so the match fails;
+    that is what drives nested quantifiers into catastrophic backtracking.
+    Each input is timed at doubling lengths, and the growth per doubling gives a
+    degree: linear scans come out near 1, `.*x.*y` near 2, exponential
+    backtracking far above any polynomial. Because it compares a pattern with
+    itself, the degree is about the same on a fast or a busy machine.
+
+    Returns {"degree", "at": length, "ms", "probe", "chars"}: the steepest growth
+    seen and where, plus the slowest search at full length (the probe unit and
+    length to repeat it). Probing stops once the degree passes REGEX_MAX_DEGREE,
+    before the next doubling could hang the build.
+    """
+    words, puncts = _pattern_alphabet(regex.pattern)
+    units = list(dict.fromkeys(["a", "1", " ", "a ", "1 ", "ab", *words, *(w + " " for w in words),
+                                *puncts, *(p + " " for p in puncts), *(" " + p for p in puncts),
+                                *("a" + p for p in puncts)]))
+    end = _probe_end(puncts)
+    degree, degree_at = 0.0, 0
+    slowest, slowest_unit = -1.0, units[0]
+    for unit in units:
+        prev_n = prev_ms = None
+        for n in _probe_lengths():
+            ms = _time_search(regex, _probe_text(unit, n, end))
+            if prev_n is not None and ms >= _REGEX_TIMING_FLOOR_MS:
+                d = math.log(ms / max(prev_ms, 1e-6)) / math.log(n / prev_n)
+                if d > REGEX_MAX_DEGREE:
+                    # re-time both lengths before blaming the pattern for a GC pause or a busy CPU
+                    ms = _time_search(regex, _probe_text(unit, n, end), repeat=3)
+                    prev_ms = _time_search(regex, _probe_text(unit, prev_n, end), repeat=3)
+                    d = math.log(ms / max(prev_ms, 1e-6)) / math.log(n / prev_n)
+                if d > degree:
+                    degree, degree_at = d, n
+                if d > REGEX_MAX_DEGREE:
+                    return {"degree": round(degree, 2), "at": degree_at, "ms": round(ms, 3),
+                            "probe": unit, "chars": n}
+            prev_n, prev_ms = n, ms
+        if prev_ms > slowest:
+            slowest, slowest_unit = prev_ms, unit
+    ms = _time_search(regex, _probe_text(slowest_unit, REGEX_MAX_INPUT, end), repeat=3)
+    return {"degree": round(degree, 2), "at": degree_at, "ms": round(ms, 3),
+            "probe": slowest_unit, "chars": REGEX_MAX_INPUT}
+
+# pattern → (check_regex_rule verdict, regex_profile), so each pattern is benchmarked once per process
+_regex_verdicts: dict[str, tuple[str | None, dict | None]] = {}
+
+def _regex_verdict(pattern: str) -> tuple[str | None, dict | None]:
+    if pattern in _regex_verdicts:
+        return _regex_verdicts[pattern]
+    try:
+        regex = re.compile(pattern)
+    except re.error as e:
+        verdict = (str(e), None)
+    else:
+        profile = regex_profile(regex)
+        error = None
+        if profile["degree"] > REGEX_MAX_DEGREE:
+            error = (f"too slow: search time grows like n^{profile['degree']:.1f} around "
+                     f"{profile['at']} characters (limit n^{REGEX_MAX_DEGREE:g})")
+        verdict = (error, profile)
+    if len(_regex_verdicts) >= 10000:
+        _regex_verdicts.clear()
+    _regex_verdicts[pattern] = verdict
+    return verdict
+
+def check_regex_rule(pattern: str) -> str | None:
+    """Why a regex rule can't be used (doesn't compile, or too slow), or None if it's fine."""
+    return _regex_verdict(pattern)[0]
+
+def regex_drift(regex: re.Pattern, cost: dict) -> float | None:
+    """
+    Re-time a rule's slowest build-time probe (its artifact "cost"). Returns the
+    time now if it is over REGEX_DRIFT_FACTOR times the recorded one, else None.
+    """
+    end = _probe_end(_pattern_alphabet(regex.pattern)[1])
+    ms = _time_search(regex, _probe_text(cost["probe"], cost["chars"], end), repeat=3)
+    if ms > REGEX_DRIFT_FACTOR * max(cost["ms"], _REGEX_TIMING_FLOOR_MS):
+        return ms
+    return None
+
+def get_regex_stats(limit: int = 20) -> dict:
+    """
+    Per tenant, the loaded regex rules with the most cumulative runtime since
+    start-up, and the rules that were slower at load than at build time.
+    Shows patterns: admin only.
+    """
+    report = {}
+    for name, kb in _KBS.items():
+        if kb.rules is None:
+            continue
+        rows = []
+        for intent, rules in kb.rules["by_intent"].items():
+            for type, payload, _, stats in rules:
+                if type != 'regex':
+                    continue
+                calls, total, worst = stats
+                rows.append({"intent": intent, "pattern": payload.pattern, "calls": calls,
+                             "total_ms": round(total * 1000, 3),
+                             "avg_us": round(total / calls * 1e6, 2) if calls else 0.0,
+                             "max_ms": round(worst * 1000, 3)})
+        report[name] = {"slowest": sorted(rows, key=lambda r: -r["total_ms"])[:limit],
+                        "drifted": kb.rules["drifted"]}
+    return report
+
+def get_regex_summary() -> dict:
+    """Per tenant regex counts and total runtime, without patterns (safe for public /metrics)."""
+    report = {}
+    for name, kb in _KBS.items():
+        if kb.rules is None:
+            continue
+        stats = [st for rules in kb.rules["by_intent"].values() for type, _, _, st in rules if type == 'regex']
+        report[name] = {"rules": len(stats), "drifted": len(kb.rules["drifted"]),
+                        "calls": sum(st[0] for st in stats),
+                        "total_ms": round(sum(st[1] for st in stats) * 1000, 3)}
+    return report
+
+def write_rules_artifact(artifact: dict, path: str | None = None) -> str:
+    """Atomically write the artifact so workers never read a half-written file."""
+    path = path or current_kb().rules_artifact_file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+def read_rules_artifact(path: str | None = None) -> dict | None:
+    try:
+        with open(path or current_kb().rules_artifact_file, encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != RULES_ARTIFACT_VERSION:
+        return None
+    return artifact
+
+def compile_rules(artifact: dict) -> dict:
+    """
+    Turn artifact rules into ready-to-match tuples grouped by intent:
+    {"source_hash": str, "checked_at": float, "by_intent": {intent: [(type, payload, weight, stats)]},
+     "drifted": [{"intent", "pattern", "built_ms", "ms"}]}
+    `stats` is the rule's runtime counter in kb.regex_stats (None for keywords).
+    Regexes were judged when the artifact was built; here each one's slowest
+    probe is re-timed and rules over REGEX_DRIFT_FACTOR times their build-time
+    cost are logged and listed under "drifted", but stay enabled.
+    """
+    regex_stats = current_kb().regex_stats
+    by_intent: dict[str, list[tuple]] = {}
+    drifted = []
+    for r in artifact["rules"]:
+        stats = None
+        if r["type"] == 'keyword':
+            payload = frozenset(r["lemmas"])
+        elif r["type"] == 'regex':
+            payload = re.compile(r["pattern"])
+            stats = regex_stats.setdefault((r["intent"], r["pattern"]), [0, 0.0, 0.0])
+            ms = regex_drift(payload, r["cost"]) if "cost" in r else None
+            if ms is not None:
+                logger.warning("regex for intent '%s' is slower than at build time: %r (%.2f ms, was %.2f ms)",
+                               r["intent"], r["pattern"], ms, r["cost"]["ms"])
+                drifted.append({"intent": r["intent"], "pattern": r["pattern"],
+                                "built_ms": r["cost"]["ms"], "ms": round(ms, 3)})
+        else:
+            payload = None
+        by_intent.setdefault(r["intent"], []).append((r["type"], payload, r["weight"], stats))
+    return {"source_hash": artifact["source_hash"], "checked_at": time.time(), "by_intent": by_intent,
+            "drifted": drifted}
+
+def load_rules(force_rebuild: bool = False) -> dict:
+    """
+    Load the compiled rules for the current knowledge base. The on-disk artifact is used as-is when
+    its hash matches the current faq_db_pattern contents; otherwise it is rebuilt
+    (this is the only path that needs spaCy) and written back for other workers.
+    """
+    rows = _fetch_rule_rows()
+    source_hash = rules_source_hash(rows)
+    artifact = None if force_rebuild else read_rules_artifact()
+    if artifact is None or artifact.get("source_hash") != source_hash:
+        artifact = build_rules_artifact(rows)
+        for bad in artifact["invalid"]:
+            logger.warning("skipping invalid regex for intent '%s': %r (%s)", bad['intent'], bad['pattern'], bad['error'])
+        try:
+            write_rules_artifact(artifact)
+        except OSError as e:
+            logger.warning("could not write rules artifact %s: %s", current_kb().rules_artifact_file, e)
+    return compile_rules(artifact)
+
+def get_rules() -> dict:
+    """
+    Compiled rules for the current knowledge base. The table hash is re-checked at most every
+    RULES_CHECK_INTERVAL seconds so edits made directly in SQLite still go live.
+    """
+    kb = current_kb()
+    rules = kb.rules
+    if rules is not None and time.time() - rules["checked_at"] < RULES_CHECK_INTERVAL:
+        return rules
+    with kb.lock:
+        if kb.rules is None:
+            kb.rules = load_rules()
+            kb.intent_cache = {}
+        elif time.time() - kb.rules["checked_at"] >= RULES_CHECK_INTERVAL:
+            if rules_source_hash(_fetch_rule_rows()) == kb.rules["source_hash"]:
+                kb.rules["checked_at"] = time.time()
+            else:
+                kb.rules = load_rules()
+                kb.answers = None
+                kb.intent_cache = {}
+        return kb.rules
+
 def get_intent(user_input):
     """
     Determines the user's intent by matching their preprocessed input against
@@ -148,40 +828,57 @@ def get_intent(user_input):
         tuple: A tuple containing the best intent (str) and any extracted entity (like an order number).
     """
 
-    lemmas = preprocess_text(user_input)
-    lemmatized_input_str = " ".join(lemmas)
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT intent, type, pattern, weight FROM faq_db_pattern")
-    all_patterns = cursor.fetchall()
-    conn.close()
+    lowered = user_input.lower()
+    kb = current_kb()
+    # Reloads install the new rules before swapping in an empty cache, so a cache
+    # taken before reading the rules is only still current if no reload happened since.
+    cache = kb.intent_cache
+    by_intent = get_rules()["by_intent"]   # may reload the rules and clear the intent cache
+    trace = _turn_trace.get()
+    hit = kb.intent_cache.get(lowered)
+    if hit is not None:
+        if trace is not None:
+            trace["cached"] = True
+        return hit
+
+    if trace is not None:
+        t0 = time.perf_counter()
+    lemmas = set(preprocess_text(user_input))
+    if trace is not None:
+        t1 = time.perf_counter()
 
     intent_scores = {}
     extracted_entity = None
-
-    for intent, type, pattern, weight in all_patterns:
-        if intent not in intent_scores:
-            intent_scores[intent] = 0.0
-
-        if type == 'keyword':
-            # For keywords, we also lemmatize the pattern for a fair comparison
-            pattern_lemmas = preprocess_text(pattern)
-            # Check if all words in the pattern are in the user's input
-            if all(p_lemma in lemmas for p_lemma in pattern_lemmas):
-                intent_scores[intent] += weight
-                # print(f"[MATCH] intent={intent}, type=keyword, pattern='{pattern}', +{weight} → total={intent_scores[intent]}")
-
-        elif type == 'regex':
-            # For regex, we match against the original (lowercased) input
-            match = re.search(pattern, user_input.lower())
-            if match:
-                intent_scores[intent] += weight
-                # print(f"[MATCH] intent={intent}, type=regex, pattern='{pattern}', +{weight} → total={intent_scores[intent]}")
-                # If the regex has a capturing group, we extract it as an entity
-                if match.groups():
-                    extracted_entity = match.group(1)
-                    # print(f"   [ENTITY] extracted → {extracted_entity}")
+    regex_input = lowered[:REGEX_MAX_INPUT]
+
+    for intent, rules in by_intent.items():
+        score = 0.0
+        for type, payload, weight, stats in rules:
+            if type == 'keyword':
+                # Keyword lemmas were pre-computed in the artifact;
+                # check if all words in the pattern are in the user's input
+                if lemmas.issuperset(payload):
+                    score += weight
+                    # print(f"[MATCH] intent={intent}, type=keyword, pattern={sorted(payload)}, +{weight}")
+
+            elif type == 'regex':
+                # For regex, we match against the original (lowercased) input, capped in length
+                t = time.perf_counter()
+                match = payload.search(regex_input)
+                elapsed = time.perf_counter() - t
+                # unlocked on purpose: concurrent turns may rarely lose an update
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+                if match:
+                    score += weight
+                    # print(f"[MATCH] intent={intent}, type=regex, pattern='{payload.pattern}', +{weight}")
+                    # If the regex has a capturing group, we extract it as an entity
+                    if match.groups():
+                        extracted_entity = match.group(1)
+                        # print(f"   [ENTITY] extracted → {extracted_entity}")
+        intent_scores[intent] = score
 
     # Show all final scores before picking
     # print("\n--- Final intent scores ---")
@@ -195,6 +892,17 @@ def get_intent(user_input):
     else:
         best_intent = max(intent_scores, key=intent_scores.get)
 
+    if trace is not None:
+        trace["lemmatize_ms"] = round((t1 - t0) * 1000, 3)
+        trace["match_ms"] = round((time.perf_counter() - t1) * 1000, 3)
+        trace["scores"] = sorted(([i, s] for i, s in intent_scores.items() if s > 0), key=lambda x: -x[1])[:3]
+
+    if len(lowered) <= INTENT_CACHE_MAX_LEN:
+        with kb.lock:
+            if kb.intent_cache is cache:   # else matched with rules a reload has replaced
+                if len(cache) >= INTENT_CACHE_MAX:
+                    cache.pop(next(iter(cache)))   # oldest first
+                cache[lowered] = (best_intent, extracted_entity)
     return best_intent, extracted_entity
 
 
@@ -208,89 +916,51 @@ def get_answer_for_intent(intent):
     Returns:
         str: The answer text.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT answer FROM faq_db WHERE intent = ?", (intent,))
-    result = cursor.fetchone()
-    conn.close()
+    kb = current_kb()
+    answers = kb.answers
+    if answers is None or time.time() - answers["loaded_at"] >= RULES_CHECK_INTERVAL:
+        with kb.lock:
+            if kb.answers is None or time.time() - kb.answers["loaded_at"] >= RULES_CHECK_INTERVAL:
+                kb.answers = load_answers()
+            answers = kb.answers
+    result = answers["by_intent"].get(intent)
 
     # It's good practice to have a default fallback answer in your database
     # but this handles cases where an intent might not have a matching answer.
     if result is None:
         # Plain safe fallback (do NOT call fallback_menu here)
         return "Sorry, I couldn't understand your request. Please choose an option:"
-    return result[0]
-
-
-def fallback_menu():
-    """
-    Presents a menu when fallback is triggered.
-    Returns the selected intent slug, or None after 3 invalid tries.
-    """
-    menu = [
-        ("1) Track Your Order", "track_order"),
-        ("2) Create Your Account", "create_account"),
-        ("3) Return & Refund", "return_policy"),
-        ("4) Product Damage", "package_lost_damaged"),
-        ("5) Contact Us", "contact_customer_support"),
-        ("6) Need agent support", "send_glink"),
-    ]
-
-    print("\nSorry, I couldn't understand your request. Please choose an option:")
-    for i, (label, _) in enumerate(menu, 1):
-        print(f"{i}. {label}")
-
-    attempts = 0
-    while attempts < 3:
-        choice = input("Enter the number of your choice (1-5): ").strip()
-        try:
-            idx = int(choice)
-            if 1 <= idx <= len(menu):
-                return menu[idx - 1][1]   # return the intent slug
-        except ValueError:
-            pass
-        attempts += 1
-        print("Invalid input. Please enter a number between 1 and 5.")
+    return result
 
-    # After 3 invalid attempts
-    print("It seems you're having trouble. Please fill out this form and our team will assist you: #")
-    return None
+def load_answers() -> dict:
+    """All faq_db answers in one query (the first row wins for duplicate intents)."""
+    by_intent = {}
+    with connect_kb() as conn:
+        for intent, answer in conn.execute("SELECT intent, answer FROM faq_db ORDER BY rowid"):
+            by_intent.setdefault(intent, answer)
+    return {"loaded_at": time.time(), "by_intent": by_intent}
 
-def confirm_before_end(conversation_context):
-    """
-    Ask user if they want to continue before ending the session.
-    Returns: (updated_context, should_end: bool)
-    """
-    while True:
-        reply = input("Bot: Is there anything else I can help you with before ending the session? (yes/no) ").strip().lower()
-        if reply in ("y", "yes"):
-            # reset flags but keep user for name-echo
-            bot_send("Sure—how else can I help you?", min_delay=0.8, max_delay=1.2)
-            return {'user': conversation_context.get('user')}, False
-        elif reply in ("n", "no"):
-            bot_send("Goodbye!", min_delay=0.8, max_delay=1.2)
-            return conversation_context, True
-        else:
-            print("Bot: Please answer yes or no.")
 
 # Accept 5+ digits as a plausible order number. Change to r'\b([A-Za-z0-9-]{5,})\b' if you use alphanumeric order codes.
 ORDER_NO_RE = re.compile(r'\b(\d{5,})\b')
+# A message that is nothing but an order number ("184533", "#184533", "order 184533.")
+ORDER_NO_ONLY_RE = re.compile(r'\s*(?:order\s*)?(?:no\.?\s*|number\s*)?#?\s*(\d{5,})\s*[.!?]*\s*', re.IGNORECASE)
 
 def ensure_order_tables():
-    """Fail fast with a friendly message if order tables are missing."""
-    with sqlite3.connect(DB_FILE) as conn:
+    """Fail fast (RuntimeError with a friendly message) if order tables are missing."""
+    with connect_db() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='faq_db_orders'")
-        if cur.fetchone() is None:
-            print("Error: Table 'faq_db_orders' not found. Please create it or update the table name in code.")
-            sys.exit(1)
-        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='faq_db_order_items'")
-        if cur.fetchone() is None:
-            print("Error: Table 'faq_db_order_items' not found. Please create it or update the table name in code.")
-            sys.exit(1)
+        for table in ("faq_db_orders", "faq_db_order_items"):
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,))
+            if cur.fetchone() is None:
+                raise RuntimeError(f"Table '{table}' not found. "
+                                   f"Please create it or update the table name in code.")
 
 def ensure_feedback_table():
-    with sqlite3.connect(DB_FILE) as conn:
+    kb = current_kb()
+    if kb.feedback_ready:
+        return
+    with connect_db() as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS faq_db_chatbot_feedback (
               id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -302,15 +972,171 @@ def ensure_feedback_table():
               created_at TEXT NOT NULL
             )
         """)
+    ensure_feedback_analytics()
+    kb.feedback_ready = True
+
+def ensure_feedback_analytics():
+    """
+    Daily feedback counts per (rating, category), kept current by triggers on
+    faq_db_chatbot_feedback so reports never scan the feedback table. Missing
+    rating/category are stored as 0 / ''. The first run backfills existing rows
+    in the same transaction that installs the triggers; so does the first run on
+    a database whose counts predate the UPDATE trigger and may have drifted.
+    """
+    with connect_db() as conn:
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='faq_db_feedback_daily'").fetchone()
+            has_update = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_feedback_daily_update'").fetchone()
+            if not exists:
+                conn.execute("""
+                    CREATE TABLE faq_db_feedback_daily (
+                      day TEXT NOT NULL,
+                      rating INTEGER NOT NULL,
+                      category TEXT NOT NULL,
+                      n INTEGER NOT NULL,
+                      PRIMARY KEY (day, rating, category)
+                    ) WITHOUT ROWID
+                """)
+            if not exists or not has_update:
+                conn.execute("DELETE FROM faq_db_feedback_daily")
+                conn.execute("""
+                    INSERT INTO faq_db_feedback_daily (day, rating, category, n)
+                    SELECT substr(created_at, 1, 10), COALESCE(rating, 0), COALESCE(category, ''), COUNT(*)
+                    FROM faq_db_chatbot_feedback
+                    GROUP BY 1, 2, 3
+                """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_insert
+                AFTER INSERT ON faq_db_chatbot_feedback
+                BEGIN
+                    INSERT INTO faq_db_feedback_daily (day, rating, category, n)
+                    VALUES (substr(NEW.created_at, 1, 10), COALESCE(NEW.rating, 0), COALESCE(NEW.category, ''), 1)
+                    ON CONFLICT (day, rating, category) DO UPDATE SET n = n + 1;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_delete
+                AFTER DELETE ON faq_db_chatbot_feedback
+                BEGIN
+                    UPDATE faq_db_feedback_daily SET n = n - 1
+                    WHERE day = substr(OLD.created_at, 1, 10)
+                      AND rating = COALESCE(OLD.rating, 0) AND category = COALESCE(OLD.category, '');
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_feedback_daily_update
+                AFTER UPDATE OF created_at, rating, category ON faq_db_chatbot_feedback
+                BEGIN
+                    UPDATE faq_db_feedback_daily SET n = n - 1
+                    WHERE day = substr(OLD.created_at, 1, 10)
+                      AND rating = COALESCE(OLD.rating, 0) AND category = COALESCE(OLD.category, '');
+                    INSERT INTO faq_db_feedback_daily (day, rating, category, n)
+                    VALUES (substr(NEW.created_at, 1, 10), COALESCE(NEW.rating, 0), COALESCE(NEW.category, ''), 1)
+                    ON CONFLICT (day, rating, category) DO UPDATE SET n = n + 1;
+                END
+            """)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+# Bucket → SQL expression over faq_db_feedback_daily.day (YYYY-MM-DD)
+FEEDBACK_BUCKETS = {
+    "day": "day",
+    "week": "date(day, '-6 days', 'weekday 1')",   # Monday of that week
+    "month": "substr(day, 1, 7)",
+    "all": "'all'",
+}
+
+def feedback_analytics(bucket: str = "day", start: str | None = None, end: str | None = None) -> list[dict]:
+    """
+    Feedback counts per time bucket, read from the daily aggregates only.
+    `start`/`end` are inclusive YYYY-MM-DD dates. Raises ValueError for bad arguments.
+    """
+    if bucket not in FEEDBACK_BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(FEEDBACK_BUCKETS)}")
+    for value in (start, end):
+        if value is not None:
+            datetime.strptime(value, "%Y-%m-%d")   # ValueError on a bad date
+    ensure_feedback_table()
+    where, params = ["n > 0"], []
+    if start:
+        where.append("day >= ?")
+        params.append(start)
+    if end:
+        where.append("day <= ?")
+        params.append(end)
+    with connect_db() as conn:
+        rows = conn.execute(f"""
+            SELECT {FEEDBACK_BUCKETS[bucket]} AS bucket, rating, category, SUM(n)
+            FROM faq_db_feedback_daily
+            WHERE {" AND ".join(where)}
+            GROUP BY 1, 2, 3
+            ORDER BY 1
+        """, params).fetchall()
+    out: dict[str, dict] = {}
+    for key, rating, category, n in rows:
+        b = out.setdefault(key, {"bucket": key, "total": 0, "by_rating": {}, "by_category": {}})
+        b["total"] += n
+        b["by_rating"][str(rating or "none")] = b["by_rating"].get(str(rating or "none"), 0) + n
+        b["by_category"][category or "none"] = b["by_category"].get(category or "none", 0) + n
+    return list(out.values())
+
+def ensure_order_indexes():
+    """Index faq_db_orders by order_number and customer_id once per knowledge base."""
+    kb = current_kb()
+    if kb.order_indexes_ready:
+        return
+    try:
+        with connect_db() as conn:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_faq_db_orders_order_number ON faq_db_orders(order_number)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_faq_db_orders_customer_id ON faq_db_orders(customer_id)")
+    except sqlite3.OperationalError as e:
+        logger.warning("Could not index faq_db_orders.order_number: %s", e)
+    kb.order_indexes_ready = True
 
 def find_order_number(text: str) -> str | None:
     """Pull an order number from free text."""
     m = ORDER_NO_RE.search(text)
     return m.group(1) if m else None
 
-def fetch_open_orders_for_user(email: str) -> list[dict]:
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
+def fetch_order_by_number(order_number: str, email: str) -> tuple[Order | None, list[OrderItem]]:
+    """
+    Indexed lookup of one order by its number, only if it belongs to `email`.
+    Returns (order, items), or (None, []) when there is no such order for that user.
+    """
+    user_ids = lookup_user_ids(email)
+    if not user_ids:
+        return None, []
+    ensure_order_indexes()
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.row_factory = Order.row_factory
+        order = cur.execute(f"""
+            SELECT {Order.COLUMNS}
+            FROM faq_db_orders
+            WHERE order_number = ?
+              AND customer_id IN ({",".join("?" * len(user_ids))})
+            LIMIT 1
+        """, (order_number, *user_ids)).fetchone()
+        if not order:
+            return None, []
+        cur.row_factory = OrderItem.row_factory
+        items = cur.execute(f"""
+            SELECT {OrderItem.COLUMNS}
+            FROM faq_db_order_items
+            WHERE order_id = ?
+            ORDER BY id
+        """, (order.id,)).fetchall()
+        return order, items
+
+def fetch_open_orders_for_user(email: str) -> list[Order]:
+    with connect_db() as conn:
+        conn.row_factory = Order.row_factory
         cur = conn.cursor()
         cur.execute("""
             SELECT o.id, o.customer_id, o.order_number, o.placed_at, o.status,
@@ -321,10 +1147,10 @@ def fetch_open_orders_for_user(email: str) -> list[dict]:
               AND lower(o.status) IN ('processing','in_transit')  -- include shipped if you want
             ORDER BY datetime(o.placed_at) DESC, o.id DESC
         """, (email,))
-        return [dict(r) for r in cur.fetchall()]
+        return cur.fetchall()
     
 def user_has_any_orders_by_email(email: str) -> bool:
-    with sqlite3.connect(DB_FILE) as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT 1
@@ -335,30 +1161,153 @@ def user_has_any_orders_by_email(email: str) -> bool:
         """, (email,))
         return cur.fetchone() is not None
 
+def fetch_order_overview_by_email(email: str) -> tuple[list[Order], bool]:
+    """(open_orders, has_any_orders) for an email; see fetch_order_overview."""
+    user_ids = lookup_user_ids(email)
+    if not user_ids:
+        return [], False
+    return fetch_order_overview(user_ids)
+
+def fetch_order_overview(user_ids: list[int]) -> tuple[list[Order], bool]:
+    """
+    One query for the tracking flow: the user's open orders (newest first) and
+    whether they have any orders at all. At most one closed order is returned
+    alongside the open ones, purely as the "has any" marker.
+    """
+    ensure_order_indexes()
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH mine AS (
+                SELECT o.id, o.customer_id, o.order_number, o.placed_at, o.status,
+                       o.shipping_carrier, o.tracking_number, o.eta_date,
+                       COALESCE(lower(o.status) IN ('processing','in_transit'), 0) AS is_open,
+                       datetime(o.placed_at) AS placed_sort
+                FROM faq_db_orders o
+                WHERE o.customer_id IN ({",".join("?" * len(user_ids))})
+            )
+            SELECT * FROM mine WHERE is_open
+            UNION ALL
+            SELECT * FROM (SELECT * FROM mine WHERE NOT is_open LIMIT 1)
+            ORDER BY is_open DESC, placed_sort DESC, id DESC
+        """, tuple(user_ids))
+        rows = cur.fetchall()
+    # columns 0–7 are the Order fields, then is_open and placed_sort
+    open_orders = [Order(*r[:8]) for r in rows if r[8]]
+    return open_orders, bool(rows)
+
+def _drop_stale_orders(kb: KnowledgeBase):
+    """
+    Drop every cached order list and summary if another connection has committed
+    to the write database since the last check (SQLite's PRAGMA data_version, one
+    cheap call on a connection kept for it). Coarse, but order writes come from
+    outside this process; with the change feed on, it invalidates per customer instead.
+    """
+    if kb.write_db_file in kb.change_versions:
+        return
+    with kb.lock:
+        if kb.orders_watch is None:
+            kb.orders_watch = sqlite3.connect(kb.write_db_file, check_same_thread=False)
+        version = kb.orders_watch.execute("PRAGMA data_version").fetchone()[0]
+        if version != kb.orders_version:
+            kb.order_cache.clear()
+            kb.order_summaries.clear()
+            kb.orders_version = version
+
+def get_order_overview(email: str) -> tuple[list[Order], bool]:
+    """
+    (open_orders, has_any_orders) for an email, cached for ORDER_CACHE_TTL seconds
+    or until the orders change (_drop_stale_orders).
+    """
+    kb = current_kb()
+    key = email.strip().lower()
+    now = time.monotonic()
+    _drop_stale_orders(kb)
+    hit = kb.order_cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1], hit[2]
+    open_orders, has_any = fetch_order_overview_by_email(key)
+    with kb.lock:
+        if len(kb.order_cache) >= ORDER_CACHE_MAX:
+            for k in [k for k, v in kb.order_cache.items() if v[0] <= now]:
+                del kb.order_cache[k]
+            if len(kb.order_cache) >= ORDER_CACHE_MAX:
+                kb.order_cache.clear()
+        kb.order_cache[key] = (now + ORDER_CACHE_TTL, open_orders, has_any)
+    return open_orders, has_any
+
+def fetch_items_for_orders(order_ids: list[int]) -> dict[int, list[OrderItem]]:
+    """Items for several orders in one IN (...) query, grouped by order id."""
+    if not order_ids:
+        return {}
+    marks = ",".join("?" * len(order_ids))
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT order_id, {OrderItem.COLUMNS}
+            FROM faq_db_order_items
+            WHERE order_id IN ({marks})
+            ORDER BY order_id, id
+        """, tuple(order_ids))
+        grouped: dict[int, list[OrderItem]] = {}
+        for order_id, *item in cur.fetchall():
+            grouped.setdefault(order_id, []).append(OrderItem(*item))
+        return grouped
+
+def prefetch_order_summaries(orders: list[Order]):
+    """
+    Render summaries for every order in a selection menu up front, so picking
+    a number from format_open_orders_menu needs no further DB round-trip.
+    """
+    kb = current_kb()
+    now = time.monotonic()
+    missing = [o for o in orders if (kb.order_summaries.get(o.id) or (0,))[0] <= now]
+    if not missing:
+        return
+    items = fetch_items_for_orders([o.id for o in missing])
+    expires = now + ORDER_CACHE_TTL
+    with kb.lock:
+        if len(kb.order_summaries) >= ORDER_CACHE_MAX:
+            for k in [k for k, v in kb.order_summaries.items() if v[0] <= now]:
+                del kb.order_summaries[k]
+        for o in missing:
+            kb.order_summaries[o.id] = (expires, summarize_order(o, items.get(o.id, [])))
+
+def get_order_summary(order_id: int) -> str | None:
+    """Prefetched summary for an order, falling back to fetch_order_bundle_by_id."""
+    kb = current_kb()
+    _drop_stale_orders(kb)
+    hit = kb.order_summaries.get(order_id)
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1]
+    order, items = fetch_order_bundle_by_id(order_id)
+    if not order:
+        return None
+    return summarize_order(order, items)
+
 def fetch_order_bundle_by_id(order_id: int):
     """Fetch one order row by id and its items."""
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
+    with connect_db() as conn:
         cur = conn.cursor()
-        order = cur.execute("""
-            SELECT id, customer_id, order_number, placed_at, status,
-                   shipping_carrier,
-                   tracking_number, eta_date
+        cur.row_factory = Order.row_factory
+        order = cur.execute(f"""
+            SELECT {Order.COLUMNS}
             FROM faq_db_orders
             WHERE id = ?
             LIMIT 1
         """, (order_id,)).fetchone()
         if not order:
             return None, None
-        items = cur.execute("""
-            SELECT sku, name, qty
+        cur.row_factory = OrderItem.row_factory
+        items = cur.execute(f"""
+            SELECT {OrderItem.COLUMNS}
             FROM faq_db_order_items
             WHERE order_id = ?
             ORDER BY id
         """, (order_id,)).fetchall()
-        return dict(order), [dict(i) for i in items]
+        return order, items
 
-def format_open_orders_menu(orders: list[dict]) -> str:
+def format_open_orders_menu(orders: list[Order]) -> str:
     """
     Build a numbered list the user can pick from.
     Example line: "1) #184533 — shipped (DHL, track DHLMY... , ETA Sep 04)"
@@ -368,17 +1317,17 @@ def format_open_orders_menu(orders: list[dict]) -> str:
 
     lines = ["Here are your current orders:"]
     for idx, o in enumerate(orders, start=1):
-        status = (o.get("status") or "").lower()
-        carrier = o.get("shipping_carrier")
-        track   = o.get("tracking_number") or "N/A"
-        eta     = _fmt_date(o.get("eta_date"))
+        status = (o.status or "").lower()
+        carrier = o.shipping_carrier
+        track   = o.tracking_number or "N/A"
+        eta     = _fmt_date(o.eta_date)
         eta_str = f", ETA {eta:%b %d}" if eta and hasattr(eta, "strftime") else ""
         extra   = []
         if status in {"in_transit", "shipped"}:
             extra.append(carrier)
             extra.append(f"track {track}")
         extra_str = f" ({', '.join([e for e in extra if e])}{eta_str})" if extra or eta_str else ""
-        lines.append(f"{idx}) #{o['order_number']} — {status}{extra_str}")
+        lines.append(f"{idx}) #{o.order_number} — {status}{extra_str}")
     lines.append("\nPlease select which order you want to track:")
     return "\n".join(lines)
 
@@ -395,12 +1344,12 @@ def _fmt_date(s):
             pass
     return s  # leave as-is if unknown
 
-def summarize_order(order: dict, items: list[dict]) -> str:
+def summarize_order(order: Order, items: list[OrderItem]) -> str:
     """Human-friendly status + item summary."""
-    status = (order.get("status") or "").lower()
-    eta = _fmt_date(order.get("eta_date"))
-    carrier = order.get("shipping_carrier") or "the courier"
-    tracking = order.get("tracking_number") or "N/A"
+    status = (order.status or "").lower()
+    eta = _fmt_date(order.eta_date)
+    carrier = order.shipping_carrier or "the courier"
+    tracking = order.tracking_number or "N/A"
 
     # Status phrasing
     if  status in {"shipped", "in_transit"}:
@@ -417,9 +1366,9 @@ def summarize_order(order: dict, items: list[dict]) -> str:
 
     lines = []
     for it in items[:3]:
-        qty = it.get("qty") or 1
-        name = it.get("name") or "Item"
-        sku = it.get("sku") or ""
+        qty = it.qty or 1
+        name = it.name or "Item"
+        sku = it.sku or ""
         sku_part = f" (SKU {sku})" if sku else ""
         lines.append(f"- {qty} × {name}{sku_part}")
 
@@ -427,42 +1376,62 @@ def summarize_order(order: dict, items: list[dict]) -> str:
     if len(items) > 3:
         more = f"\n… and {len(items) - 3} more item(s)."
 
-    header = f"Order #{order['order_number']} is {status_line}."
+    header = f"Order #{order.order_number} is {status_line}."
     return header + "\n\nItems:\n" + "\n".join(lines) + more
 
 def user_has_any_orders(user_id: int) -> bool:
-    with sqlite3.connect(DB_FILE) as conn:
+    with connect_db() as conn:
         cur = conn.cursor()
         cur.execute("SELECT 1 FROM faq_db_orders WHERE customer_id = ? LIMIT 1", (user_id,))
         return cur.fetchone() is not None
 
-def fetch_product_by_id(pid: int) -> dict | None:
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
+def load_catalog() -> dict:
+    """Snapshot of faq_db_products for the current knowledge base."""
+    with connect_kb() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, sku, name, category, price, sale_price, is_trending, is_on_sale,
-                   sizes, colors, material, description, stock_qty, shipping_note, return_note
+        cur.row_factory = Product.row_factory
+        cur.execute(f"""
+            SELECT {Product.COLUMNS}
             FROM faq_db_products
-            WHERE id = ?
-            LIMIT 1
-        """, (pid,))
-        row = cur.fetchone()
-        return dict(row) if row else None
+            ORDER BY name, id
+        """)
+        ordered = cur.fetchall()
+    return {"loaded_at": time.time(), "by_id": {p.id: p for p in ordered}, "ordered": ordered}
 
-def format_product_answer(p: dict, facet: str | None) -> str:
+def _catalog_stale(kb: KnowledgeBase, catalog: dict | None) -> bool:
+    if catalog is None:
+        return True
+    if kb.db_file in kb.change_versions:   # the change feed keeps it current
+        return False
+    return time.time() - catalog["loaded_at"] >= CATALOG_REFRESH_INTERVAL
+
+def get_catalog() -> dict:
+    """Catalog snapshot, reloaded every CATALOG_REFRESH_INTERVAL seconds unless the change feed follows it."""
+    kb = current_kb()
+    catalog = kb.catalog
+    if _catalog_stale(kb, catalog):
+        with kb.lock:
+            if _catalog_stale(kb, kb.catalog):
+                kb.catalog = load_catalog()
+            catalog = kb.catalog
+    return catalog
+
+def fetch_product_by_id(pid: int) -> Product | None:
+    return get_catalog()["by_id"].get(pid)
+
+def format_product_answer(p: Product, facet: str | None) -> str:
     """Return a concise answer tailored to the facet. Falls back to overview."""
-    name = p.get("name") or (p.get("sku") or "this item")
+    name = p.name or (p.sku or "this item")
     def has(field): 
-        return p.get(field) not in (None, "", "N/A")
+        return getattr(p, field) not in (None, "", "N/A")
 
     # Price helper (handles sale price)
     def price_text() -> str | None:
-        price = p.get("price")
-        sale  = p.get("sale_price")
+        price = p.price
+        sale  = p.sale_price
         if price is None and sale is None:
             return None
-        if p.get("is_on_sale") and sale is not None and price is not None:
+        if p.is_on_sale and sale is not None and price is not None:
             return f"RM{sale:.2f} (was RM{price:.2f})"
         if sale is not None and (price is None):
             return f"RM{sale:.2f}"
@@ -471,34 +1440,34 @@ def format_product_answer(p: dict, facet: str | None) -> str:
         return None
 
     if facet == "sizes" and has("sizes"):
-        return f"{name} sizes available: {p['sizes']}."
+        return f"{name} sizes available: {p.sizes}."
     if facet == "colors" and has("colors"):
-        return f"{name} color options: {p['colors']}."
+        return f"{name} color options: {p.colors}."
     if facet == "price":
         pt = price_text()
         if pt: return f"{name} price: {pt}."
     if facet == "material" and has("material"):
-        return f"{name} material: {p['material']}."
+        return f"{name} material: {p.material}."
     if facet == "stock":
-        qty = p.get("stock_qty")
+        qty = p.stock_qty
         if isinstance(qty, int):
             return f"{name} stock: {qty} unit(s) available."
     if facet == "shipping" and has("shipping_note"):
-        return f"Shipping for {name}: {p['shipping_note']}."
+        return f"Shipping for {name}: {p.shipping_note}."
     if facet == "returns" and has("return_note"):
-        return f"Returns for {name}: {p['return_note']}."
+        return f"Returns for {name}: {p.return_note}."
     if facet == "desc" and has("description"):
-        return f"{name}: {p['description']}"
+        return f"{name}: {p.description}"
 
     # Default overview
     parts = []
-    if has("sizes"):       parts.append(f"Sizes: {p['sizes']}")
-    if has("colors"):      parts.append(f"Colors: {p['colors']}")
-    if has("material"):    parts.append(f"Material: {p['material']}")
+    if has("sizes"):       parts.append(f"Sizes: {p.sizes}")
+    if has("colors"):      parts.append(f"Colors: {p.colors}")
+    if has("material"):    parts.append(f"Material: {p.material}")
     pt = price_text()
     if pt:                 parts.append(f"Price: {pt}")
-    if has("shipping_note"): parts.append(f"Shipping: {p['shipping_note']}")
-    if has("return_note"):   parts.append(f"Returns: {p['return_note']}")
+    if has("shipping_note"): parts.append(f"Shipping: {p.shipping_note}")
+    if has("return_note"):   parts.append(f"Returns: {p.return_note}")
     summary = "; ".join(parts) if parts else "No extra details available."
     return f"{name} — {summary}"
 
@@ -518,34 +1487,35 @@ PRODUCT_MENU_TEXT = (
 def get_product_menu() -> str:
     return PRODUCT_MENU_TEXT
 
-def _fetch_products(where_sql: str, params: tuple = (), limit: int = 10, offset: int = 0) -> list[dict]:
+def _fetch_products(where_sql: str, params: tuple = (), limit: int = 10, offset: int = 0) -> list[Product]:
     sql = f"""
-        SELECT id, sku, name, category, price, sale_price, is_trending, is_on_sale,
-               sizes, colors, material, description, stock_qty, shipping_note, return_note
+        SELECT {Product.COLUMNS}
         FROM faq_db_products
         {where_sql}
         ORDER BY name
         LIMIT ? OFFSET ?
     """
-    with sqlite3.connect(DB_FILE) as conn:
-        conn.row_factory = sqlite3.Row
+    with connect_kb() as conn:
         cur = conn.cursor()
+        cur.row_factory = Product.row_factory
         cur.execute(sql, params + (limit, offset))
-        return [dict(r) for r in cur.fetchall()]
+        return cur.fetchall()
+
+# Product menu choice → filter over the catalog snapshot
+PRODUCT_SECTIONS = {
+    1: lambda p: p.is_trending == 1,
+    2: lambda p: p.is_on_sale == 1,
+    3: lambda p: (p.category or "").lower() == "men",
+    4: lambda p: (p.category or "").lower() == "women",
+    5: lambda p: (p.category or "").lower() == "accessories",
+}
 
-def get_products_by_choice(choice: int, page: int = 1, page_size: int = 10) -> list[dict]:
+def get_products_by_choice(choice: int, page: int = 1, page_size: int = 10) -> list[Product]:
+    in_section = PRODUCT_SECTIONS.get(choice)
+    if in_section is None:
+        return []
     offset = (page - 1) * page_size
-    if choice == 1:
-        return _fetch_products("WHERE is_trending = 1", (), page_size, offset)
-    if choice == 2:
-        return _fetch_products("WHERE is_on_sale = 1", (), page_size, offset)
-    if choice == 3:
-        return _fetch_products("WHERE LOWER(category) = 'men'", (), page_size, offset)
-    if choice == 4:
-        return _fetch_products("WHERE LOWER(category) = 'women'", (), page_size, offset)
-    if choice == 5:
-        return _fetch_products("WHERE LOWER(category) = 'accessories'", (), page_size, offset)
-    return []
+    return [p for p in get_catalog()["ordered"] if in_section(p)][offset:offset + page_size]
 
 SECTION_URLS = {
     1: "https://leanlee0425.github.io/project-rule-base-chatbot/shop.html",
@@ -555,22 +1525,24 @@ SECTION_URLS = {
     5: "https://leanlee0425.github.io/project-rule-base-chatbot/accessories_shop.html",
 }
 
-def format_product_list(products: list[dict]) -> str:
+def format_product_list(products: list[Product], more_url: str | None = None) -> str:
     if not products:
         return "No products found in this section."
     lines = ["Here are some items:"]
     for i, p in enumerate(products, 1):
-        price = p.get("price")
-        sale = p.get("sale_price")
-        if p.get("is_on_sale") and sale is not None and price is not None:
+        price = p.price
+        sale = p.sale_price
+        if p.is_on_sale and sale is not None and price is not None:
             price_txt = f"RM{sale:.2f} (was RM{price:.2f})"
         elif price is not None:
             price_txt = f"RM{price:.2f}"
         else:
             price_txt = "Price N/A"
-        sku = f" • SKU {p['sku']}" if p.get("sku") else ""
-        lines.append(f"{i}) {p['name']} — {price_txt}{sku}")
-    lines.append("\nReply with a number to see details, or type 'menu' to go back.")
+        sku = f" • SKU {p.sku}" if p.sku else ""
+        lines.append(f"{i}) {p.name} — {price_txt}{sku}")
+    lines.append("\nReply with an item number to see details, or type 'menu' to go back.")
+    if more_url:
+        lines.append(f"More products: {more_url}")
     return "\n".join(lines)
 
 # Keep your existing fetch_product_by_id + format_product_answer()
@@ -591,7 +1563,7 @@ def handle_product_menu_turn(user_input: str, ctx: dict) -> tuple[str, dict]:
         products = get_products_by_choice(n, page=1, page_size=10)
         ctx["menu_state"] = f"list_{n}"
         ctx["last_choice"] = n
-        ctx["last_results"] = [p["id"] for p in products]  # map index → id
+        ctx["last_results"] = [p.id for p in products]  # map index → id
         return format_product_list(products), ctx
 
     if ctx["menu_state"].startswith("list_"):
@@ -643,14 +1615,15 @@ def insert_feedback(
     import os
 
     # 0) Make sure folder exists and show the exact DB path being used
-    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-    # print(f"[insert_feedback] DB_FILE = {os.path.abspath(DB_FILE)}")
+    db_file = current_kb().write_db_file
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    # print(f"[insert_feedback] DB_FILE = {os.path.abspath(db_file)}")
 
     # 1) Ensure table exists in API mode too
     ensure_feedback_table()
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with connect_db() as conn:
             # Optional: reduce Windows locking issues
             conn.execute("PRAGMA journal_mode=WAL;")
             cur = conn.cursor()
@@ -671,325 +1644,977 @@ def insert_feedback(
         # print(f"[insert_feedback] SQLITE ERROR: {e!r}")
         raise
 
-# --- 3. DECISION TREE (CONVERSATIONAL FLOW) & MAIN LOOP ---
+# --- 2b. WARM-UP (fill caches before serving) ---
 
-def chatbot_response(user_input, conversation_context, interactive: bool = True):
-    # ---- normalize user info ONCE ----
-    ctx_user = (conversation_context.get('user') or {})
-    if not isinstance(ctx_user, dict):
-        ctx_user = {}
-    user_id = ctx_user.get('user_id')
-    email = (ctx_user.get('email') or "").strip()   # always defined ("" if missing)
+def read_recent_utterances(path: str, top_n: int = WARMUP_TOP_N, scan_lines: int = WARMUP_SCAN_LINES) -> list[str]:
+    """
+    Most frequent messages among the last `scan_lines` lines of a log. Lines are
+    plain text or JSON objects with a "message"; JSON turns that answered a
+    pending question ("waiting_for_before" set) are skipped, as they never reach get_intent.
+    """
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            tail = deque(f, maxlen=scan_lines)
+    except OSError as e:
+        logger.warning("could not read warm-up log %s: %s", path, e)
+        return []
+    counts = Counter()
+    for line in tail:
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("waiting_for_before"):
+                continue
+            line = record.get("message")
+        if isinstance(line, str) and line.strip():
+            counts[line.strip()] += 1
+    return [message for message, _ in counts.most_common(top_n)]
 
-    def _preserve_user(ctx):
-        return {'user': ctx.get('user')}
-    
-        # --- waiting: feedback choice (1–4) ---
-    if conversation_context.get('waiting_for') == 'feedback_choice':
-        choice = (user_input or "").strip().lower()
-        ctx_user = (conversation_context.get('user') or {})
-        user_id = ctx_user.get('user_id')
-        user_email = ctx_user.get('email')
-
-        # allow both numbers and words
-        mapping = {
-            "1": (1, "good"),
-            "good": (1, "good"),
-            "2": (2, "ok"),
-            "ok": (2, "ok"),
-            "ok ok only": (2, "ok"),
-            "3": (3, "not_answered"),
-            "didn’t specifically answer my question": (3, "not_answered"),
-            "didn't specifically answer my question": (3, "not_answered"),
-            "4": (4, "others"),
-            "others": (4, "others"),
-            "other": (4, "others"),
+def warm_up(utterances: list[str] = ()) -> dict:
+    """
+    Preload the current knowledge base (answers, compiled rules, catalog, spaCy)
+    and replay `utterances` through the lemma table and intent cache.
+    Returns how long it took and how full each cache is.
+    """
+    kb = current_kb()
+    t0 = time.perf_counter()
+    with kb.lock:
+        kb.answers = load_answers()
+    rules = get_rules()
+    catalog = get_catalog()
+    get_nlp()
+    for text in utterances:
+        get_intent(text)
+    return {
+        "tenant": kb.name,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "answers": len(kb.answers["by_intent"]),
+        "intents": len(rules["by_intent"]),
+        "rules": sum(len(r) for r in rules["by_intent"].values()),
+        "products": len(catalog["ordered"]),
+        "utterances": len(utterances),
+        "intent_cache": len(kb.intent_cache),
+        "lemma_table": len(get_lemma_table()),
+    }
+
+def warm_up_all(log_file: str | None = None) -> list[dict]:
+    """warm_up() every hosted knowledge base with the top WARMUP_TOP_N messages from the log."""
+    log_file = WARMUP_LOG_FILE if log_file is None else log_file
+    utterances = read_recent_utterances(log_file) if log_file else []
+    reports = []
+    for name in list_tenants():
+        with use_kb(get_kb(name)):
+            reports.append(warm_up(utterances))
+    return reports
+
+
+# --- 2c. CATALOG IMPORT (bulk product upsert) ---
+
+_PRODUCT_FIELDS = Product.__slots__[1:]   # everything but id; rows are matched on sku
+_PRODUCT_NUMBERS = {"price": float, "sale_price": float, "is_trending": int, "is_on_sale": int, "stock_qty": int}
+
+def _product_update(raw: dict, where: str) -> dict:
+    """Validate one update row: known columns only, sku required, numbers coerced ('' → NULL)."""
+    unknown = sorted(set(raw) - set(_PRODUCT_FIELDS) - {"id"})
+    if unknown:
+        raise ValueError(f"{where}: unknown product field(s) {', '.join(unknown)}")
+    sku = str(raw.get("sku") or "").strip()
+    if not sku:
+        raise ValueError(f"{where}: missing sku")
+    row = {"sku": sku}
+    for field in _PRODUCT_FIELDS[1:]:
+        if field not in raw:
+            continue
+        value = raw[field]
+        if isinstance(value, str):
+            value = value.strip()
+        if field in _PRODUCT_NUMBERS:
+            if value in ("", None):
+                value = None
+            else:
+                try:
+                    value = _PRODUCT_NUMBERS[field](value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{where}: {field} must be a number, got {raw[field]!r}") from None
+        elif value == "":
+            value = None
+        row[field] = value
+    return row
+
+def parse_product_updates(text: str, fmt: str | None = None) -> list[dict]:
+    """
+    Product update rows from CSV (header row of faq_db_products column names) or
+    JSON lines (one object per product). `fmt` is "csv" or "jsonl"; by default
+    it is JSON lines when the first non-blank line starts with '{'.
+    Columns that are absent are left untouched on existing products.
+    """
+    if fmt is None:
+        fmt = "jsonl" if text.lstrip().startswith("{") else "csv"
+    if fmt == "jsonl":
+        rows = []
+        for n, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"line {n}: {e}") from None
+                if not isinstance(item, dict):
+                    raise ValueError(f"line {n}: expected a JSON object")
+                rows.append(_product_update(item, f"line {n}"))
+        return rows
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        return [_product_update({k.strip(): v for k, v in item.items() if k}, f"line {reader.line_num}")
+                for item in reader]
+    raise ValueError(f"unknown format {fmt!r}; use csv or jsonl")
+
+def _ensure_product_sku_index(conn: sqlite3.Connection):
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON faq_db_products(sku)")
+    except sqlite3.IntegrityError:
+        raise ValueError("faq_db_products has duplicate SKUs; de-duplicate them before a bulk upsert") from None
+
+def upsert_products(rows: list[dict], chunk_size: int = CATALOG_IMPORT_CHUNK) -> dict:
+    """
+    Insert or update products by sku with executemany, committing every
+    `chunk_size` rows so a large sync never holds the write lock for long.
+    Rows whose values are unchanged are not rewritten. Afterwards only the
+    products that actually changed are swapped into the catalog snapshot.
+    """
+    kb = current_kb()
+    if kb.immutable:
+        raise RuntimeError(f"knowledge base {kb.name!r} is opened immutable (KB_READONLY=immutable); "
+                           f"catalog imports need it writable")
+    # a sku listed twice in one batch is merged, later values winning
+    merged: dict[str, dict] = {}
+    for r in rows:
+        merged[r["sku"]] = {**merged.get(r["sku"], {}), **r}
+    rows = list(merged.values())
+    report = {"rows": len(rows), "written": 0, "unchanged": 0, "chunks": 0, "refreshed": 0}
+    t0 = time.perf_counter()
+    fresh: list[Product] = []
+    # connect_kb() may be a shared read-only connection; imports write to the file directly
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        _ensure_product_sku_index(conn)
+        if CHANGE_POLL_INTERVAL > 0:
+            # so read-only workers can follow the import
+            install_change_log(conn, ("faq_db_products",), kb.db_file)
+        # executemany needs one column list per statement: group rows by the fields they carry
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        for r in rows:
+            groups.setdefault(tuple(r), []).append(r)
+        for fields, group in groups.items():
+            updates = fields[1:]
+            if updates:
+                conflict = (f"DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updates)} "
+                            f"WHERE {' OR '.join(f'{c} IS NOT excluded.{c}' for c in updates)}")
+            else:
+                conflict = "DO NOTHING"
+            sql = (f"INSERT INTO faq_db_products ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))}) "
+                   f"ON CONFLICT(sku) {conflict}")
+            for i in range(0, len(group), chunk_size):
+                chunk = group[i:i + chunk_size]
+                with conn:
+                    # rowcount counts only the upserted rows, not what triggers write
+                    cur = conn.executemany(sql, [tuple(r[c] for c in fields) for r in chunk])
+                report["written"] += cur.rowcount
+                report["chunks"] += 1
+                cur = conn.cursor()
+                cur.row_factory = Product.row_factory
+                cur.execute(f"SELECT {Product.COLUMNS} FROM faq_db_products "
+                            f"WHERE sku IN (SELECT value FROM json_each(?))", (json.dumps([r["sku"] for r in chunk]),))
+                fresh.extend(cur.fetchall())
+    finally:
+        conn.close()
+    report["unchanged"] = report["rows"] - report["written"]
+    report["refreshed"] = refresh_catalog_products(fresh)
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+def refresh_catalog_products(products: list[Product], deleted: set[int] = frozenset()) -> int:
+    """
+    Swap these rows into the current catalog snapshot and drop the `deleted`
+    ids (copy-on-write, so turns already reading the old snapshot are
+    unaffected); returns how many products differed. The snapshot keeps its
+    load time; untouched products stay cached.
+    """
+    kb = current_kb()
+    with kb.lock:
+        catalog = kb.catalog
+        if catalog is None:
+            return 0   # nothing cached yet; the next get_catalog() loads fresh rows
+        by_id = catalog["by_id"]
+        changed = {p.id: p for p in products if by_id.get(p.id) != p}
+        deleted = {pid for pid in deleted if pid in by_id}
+        if not changed and not deleted:
+            return 0
+        by_id = {pid: p for pid, p in {**by_id, **changed}.items() if pid not in deleted}
+        ordered = [by_id[p.id] for p in catalog["ordered"] if p.id in by_id]
+        ordered += [p for pid, p in changed.items() if pid not in catalog["by_id"]]
+        if any(pid not in catalog["by_id"] or catalog["by_id"][pid].name != p.name for pid, p in changed.items()):
+            # same order as load_catalog()'s ORDER BY name, id (NULL names first)
+            ordered.sort(key=lambda p: (p.name is not None, p.name or "", p.id))
+        kb.catalog = {"loaded_at": catalog["loaded_at"], "by_id": by_id, "ordered": ordered}
+        return len(changed) + len(deleted)
+
+
+# --- 2d. RULE IMPORT (bulk faq_db_pattern / faq_db edits) ---
+
+RULE_TYPES = ("keyword", "regex")
+
+def parse_rule_updates(text: str, fmt: str | None = None) -> list[dict]:
+    """
+    Rule rows from CSV (columns intent, type, pattern, weight, answer) or JSON
+    lines with the same keys. A row may carry a pattern, an answer, or both;
+    weight defaults to 1. Every regex is compiled and benchmarked here
+    (check_regex_rule), so a broken or slow one rejects the whole import
+    instead of surfacing later inside get_intent.
+    """
+    if fmt is None:
+        fmt = "jsonl" if text.lstrip().startswith("{") else "csv"
+    if fmt == "jsonl":
+        items = []
+        for n, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"line {n}: {e}") from None
+                if not isinstance(item, dict):
+                    raise ValueError(f"line {n}: expected a JSON object")
+                items.append((n, item))
+    elif fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        items = [(reader.line_num, {k.strip(): v for k, v in item.items() if k}) for item in reader]
+    else:
+        raise ValueError(f"unknown format {fmt!r}; use csv or jsonl")
+
+    rows, errors = [], []
+    for n, item in items:
+        intent = str(item.get("intent") or "").strip()
+        type = str(item.get("type") or "").strip().lower()
+        pattern = item.get("pattern")
+        answer = item.get("answer")
+        row = {"intent": intent, "type": type or None, "pattern": pattern or None,
+               "weight": 1.0, "answer": answer or None}
+        if not intent:
+            errors.append(f"line {n}: missing intent")
+        elif not (type or pattern or answer):
+            errors.append(f"line {n}: needs a type/pattern or an answer")
+        elif type or pattern:
+            if type not in RULE_TYPES:
+                errors.append(f"line {n}: type must be one of {', '.join(RULE_TYPES)}, got {type!r}")
+            elif not pattern:
+                errors.append(f"line {n}: missing pattern")
+            elif type == "regex":
+                error = check_regex_rule(pattern)
+                if error:
+                    errors.append(f"line {n}: invalid regex {pattern!r} for intent '{intent}' ({error})")
+            try:
+                row["weight"] = float(item.get("weight") or 1.0)
+            except (TypeError, ValueError):
+                errors.append(f"line {n}: weight must be a number, got {item.get('weight')!r}")
+        rows.append(row)
+    if errors:
+        more = f" (and {len(errors) - 20} more)" if len(errors) > 20 else ""
+        raise ValueError("; ".join(errors[:20]) + more)
+    return rows
+
+def import_rules(rows: list[dict]) -> dict:
+    """
+    Apply parsed rule rows. An intent that has pattern rows in the import gets
+    exactly that pattern set (its old patterns are replaced); an answer replaces
+    the intent's faq_db answer. Intents whose patterns and answer already match
+    are skipped. Everything is written in one transaction. Afterwards only the
+    changed intents are lemmatized and recompiled, both in the rules artifact
+    and in this process's live matcher.
+    """
+    kb = current_kb()
+    if kb.immutable:
+        raise RuntimeError(f"knowledge base {kb.name!r} is opened immutable (KB_READONLY=immutable); "
+                           f"rule imports need it writable")
+    patterns: dict[str, list[tuple[str, str, float]]] = {}
+    answers: dict[str, str] = {}
+    for r in rows:
+        if r["pattern"]:
+            patterns.setdefault(r["intent"], []).append((r["type"], r["pattern"], r["weight"]))
+        if r["answer"]:
+            answers[r["intent"]] = r["answer"]
+
+    t0 = time.perf_counter()
+    before = _fetch_rule_rows()
+    current: dict[str, list[tuple[str, str, float]]] = {}
+    for p in before:
+        current.setdefault(p.intent, []).append((p.type, p.pattern, p.weight))
+    changed_patterns = {i: p for i, p in patterns.items() if current.get(i) != p}
+    current_answers = load_answers()["by_intent"]
+    changed_answers = {i: a for i, a in answers.items() if current_answers.get(i) != a}
+
+    # connect_kb() may be a shared read-only connection; imports write to the file directly
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        with conn:
+            conn.executemany("DELETE FROM faq_db_pattern WHERE intent = ?", [(i,) for i in changed_patterns])
+            conn.executemany("INSERT INTO faq_db_pattern (intent, type, pattern, weight) VALUES (?, ?, ?, ?)",
+                             [(i, *p) for i, ps in changed_patterns.items() for p in ps])
+            for intent, answer in changed_answers.items():
+                if conn.execute("UPDATE faq_db SET answer = ? WHERE intent = ?", (answer, intent)).rowcount == 0:
+                    conn.execute("INSERT INTO faq_db (intent, answer) VALUES (?, ?)", (intent, answer))
+    finally:
+        conn.close()
+
+    report = {"intents": len(set(patterns) | set(answers)), "patterns_changed": len(changed_patterns),
+              "answers_changed": len(changed_answers), "rebuilt": False}
+    if changed_patterns:
+        report["rebuilt"] = _apply_rule_changes(kb, before, changed_patterns)
+    if changed_answers:
+        with kb.lock:
+            if kb.answers is not None:
+                kb.answers = {**kb.answers, "by_intent": {**kb.answers["by_intent"], **changed_answers}}
+    report["seconds"] = round(time.perf_counter() - t0, 3)
+    return report
+
+def _apply_rule_changes(kb: KnowledgeBase, before: list[Pattern],
+                        changed: dict[str, list[tuple[str, str, float]]]) -> bool:
+    """
+    Patch the artifact and the live matcher for the changed intents. Their rows
+    were re-inserted at the end of faq_db_pattern, so they move to the end of
+    the artifact too, the same order a full rebuild would give. Falls back to a
+    full rebuild (returns True) if the artifact didn't match the table beforehand.
+    """
+    after = _fetch_rule_rows()
+    before_hash = rules_source_hash(before)
+    artifact = read_rules_artifact()
+    if artifact is None or artifact.get("source_hash") != before_hash:
+        artifact = build_rules_artifact(after)
+        rebuilt = True
+    else:
+        added = build_rules_artifact([Pattern(i, *p) for i, ps in changed.items() for p in ps])
+        artifact = {
+            **artifact,
+            "source_hash": rules_source_hash(after),
+            "built_at": datetime.utcnow().isoformat(),
+            "rules": [r for r in artifact["rules"] if r["intent"] not in changed] + added["rules"],
+            "invalid": [b for b in artifact["invalid"] if b["intent"] not in changed] + added["invalid"],
         }
+        rebuilt = False
+    try:
+        write_rules_artifact(artifact)
+    except OSError as e:
+        logger.warning("could not write rules artifact %s: %s", kb.rules_artifact_file, e)
 
-        if choice in mapping:
-            rating, category = mapping[choice]
-            if rating == 4:  # needs free text
-                ctx = {'user': ctx_user, 'waiting_for': 'feedback_other_pending'}
-                return ("Please type your feedback:", ctx)
+    with kb.lock:
+        if rebuilt or kb.rules is None or kb.rules["source_hash"] != before_hash:
+            kb.rules = compile_rules(artifact)
+        else:
+            # recompile only the changed intents; the rest keep their compiled payloads
+            fresh = compile_rules({"source_hash": artifact["source_hash"],
+                                   "rules": [r for r in artifact["rules"] if r["intent"] in changed]})
+            by_intent = {i: rules for i, rules in kb.rules["by_intent"].items() if i not in changed}
+            by_intent.update(fresh["by_intent"])
+            drifted = [d for d in kb.rules["drifted"] if d["intent"] not in changed] + fresh["drifted"]
+            kb.rules = {**fresh, "by_intent": by_intent, "drifted": drifted}
+        kb.intent_cache = {}
+    return rebuilt
+
+
+# --- 2e. CHANGE FEED (trigger-maintained change log → cache deltas) ---
+
+def _change_log_sql(table: str) -> list[str]:
+    """AFTER INSERT/UPDATE/DELETE triggers that append (tbl, row_id, customer_id) to faq_db_changes."""
+    if table == "faq_db_products":
+        row = {"NEW": "'faq_db_products', NEW.id, NULL", "OLD": "'faq_db_products', OLD.id, NULL"}
+        moved = "OLD.id IS NOT NEW.id"
+    elif table == "faq_db_orders":
+        row = {"NEW": "'faq_db_orders', NEW.id, NEW.customer_id", "OLD": "'faq_db_orders', OLD.id, OLD.customer_id"}
+        moved = "OLD.id IS NOT NEW.id OR OLD.customer_id IS NOT NEW.customer_id"
+    else:
+        # items are logged under their order, with the owner looked up so the order cache can be targeted
+        row = {r: f"'faq_db_order_items', {r}.order_id, "
+                  f"(SELECT customer_id FROM faq_db_orders WHERE id = {r}.order_id)" for r in ("NEW", "OLD")}
+        moved = "OLD.order_id IS NOT NEW.order_id"
+    log = "INSERT INTO faq_db_changes (tbl, row_id, customer_id)"
+    name = f"trg_{table.removeprefix('faq_db_')}_changes"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table} "
+        f"BEGIN {log} VALUES ({row['NEW']}); END",
+        # an update that moves the row (new owner, new order) also dirties where it came from
+        f"CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE ON {table} "
+        f"BEGIN {log} VALUES ({row['NEW']}); {log} SELECT {row['OLD']} WHERE {moved}; END",
+        f"CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table} "
+        f"BEGIN {log} VALUES ({row['OLD']}); END",
+    ]
 
-            # immediate save for 1–3 (no comment)
-            insert_feedback(user_id=user_id, user_email=user_email,
-                            rating=rating, category=category, comment=None)
-            ctx = {'user': ctx_user, 'end_session': True}
-            return (CLOSING_MSG, ctx)
+def install_change_log(conn: sqlite3.Connection, tables: tuple[str, ...], path: str = "") -> bool:
+    """
+    Create faq_db_changes and its triggers on those of `tables` that exist in
+    this database. This changes the schema, so it is logged when anything is
+    new (returns True then).
+    """
+    present = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    wanted = ["faq_db_changes"] + [f"trg_{t.removeprefix('faq_db_')}_changes_{op}"
+                                   for t in tables if t in present for op in ("insert", "update", "delete")]
+    missing = [name for name in wanted if name not in present]
+    if not missing:
+        return False
+    logger.warning("change feed: adding %s to %s", ", ".join(missing), path or "the database")
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS faq_db_changes (
+              version INTEGER PRIMARY KEY AUTOINCREMENT,
+              tbl TEXT NOT NULL,
+              row_id INTEGER NOT NULL,
+              customer_id INTEGER
+            )
+        """)
+        for table in tables:
+            if table in present:
+                for sql in _change_log_sql(table):
+                    conn.execute(sql)
+    return True
+
+def _change_sources(kb: KnowledgeBase) -> dict[str, tuple[str, ...]]:
+    """Database file → the cached tables it holds."""
+    sources = {kb.db_file: ("faq_db_products",)}
+    sources[kb.write_db_file] = sources.get(kb.write_db_file, ()) + ("faq_db_orders", "faq_db_order_items")
+    return sources
+
+def _feed_read_only(kb: KnowledgeBase, path: str) -> bool:
+    # a read-only knowledge base that doesn't also hold the writable tables
+    return kb.readonly and path == kb.db_file and path != kb.write_db_file
+
+def _connect_changes(kb: KnowledgeBase, path: str) -> sqlite3.Connection:
+    if _feed_read_only(kb, path):
+        return kb.connect_readonly()   # per-thread and shared: don't close it
+    return sqlite3.connect(path)
+
+def init_change_feed(kb: KnowledgeBase) -> list[str]:
+    """
+    Install the change log in each of the knowledge base's databases and start
+    tracking from its current version. A read-only knowledge base is only
+    followed if the log already exists there (import_catalog.py installs it
+    while the feed is on); otherwise the catalog keeps its
+    CATALOG_REFRESH_INTERVAL reloads.
+    Returns the database files now followed.
+    """
+    followed = []
+    for path, tables in _change_sources(kb).items():
+        read_only = _feed_read_only(kb, path)
+        if path == kb.db_file and kb.immutable:
+            continue
+        conn = _connect_changes(kb, path)
+        try:
+            if not read_only:
+                install_change_log(conn, tables, path)
+            elif not conn.execute("SELECT 1 FROM sqlite_master WHERE name='faq_db_changes'").fetchone():
+                logger.warning("%s is read-only and has no faq_db_changes log; "
+                               "the catalog is reloaded every %gs instead", path, CATALOG_REFRESH_INTERVAL)
+                continue
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM faq_db_changes").fetchone()[0]
+        finally:
+            if not read_only:
+                conn.close()
+        with kb.lock:
+            kb.change_versions[path] = version
+        followed.append(path)
+    return followed
+
+def poll_changes(kb: KnowledgeBase) -> int:
+    """Apply new faq_db_changes rows to the current knowledge base's caches; returns how many were read."""
+    applied = 0
+    for path, last in list(kb.change_versions.items()):
+        read_only = _feed_read_only(kb, path)
+        conn = _connect_changes(kb, path)
+        try:
+            while True:
+                rows = conn.execute("SELECT version, tbl, row_id, customer_id FROM faq_db_changes "
+                                    "WHERE version > ? ORDER BY version LIMIT ?", (last, CHANGE_POLL_BATCH)).fetchall()
+                if not rows:
+                    break
+                if rows[0][0] != last + 1 and conn.execute(
+                        "SELECT MIN(version) FROM faq_db_changes").fetchone()[0] > last + 1:
+                    # pruned past us (or the log was recreated): deltas are lost, drop what this file feeds
+                    _reset_cached(kb, _change_sources(kb)[path])
+                else:
+                    _apply_changes(kb, conn, rows)
+                last = rows[-1][0]
+                applied += len(rows)
+                if len(rows) < CHANGE_POLL_BATCH:
+                    break
+            if not read_only and last > CHANGE_LOG_KEEP:
+                with conn:
+                    conn.execute("DELETE FROM faq_db_changes WHERE version <= ?", (last - CHANGE_LOG_KEEP,))
+        finally:
+            if not read_only:
+                conn.close()
+        kb.change_versions[path] = last
+    kb.change_stats["polls"] += 1
+    kb.change_stats["changes"] += applied
+    return applied
+
+def _apply_changes(kb: KnowledgeBase, conn: sqlite3.Connection, rows: list[tuple]):
+    product_ids, order_ids, customer_ids = set(), set(), set()
+    for _, tbl, row_id, customer_id in rows:
+        if tbl == "faq_db_products":
+            product_ids.add(row_id)
+        else:
+            order_ids.add(row_id)
+            if customer_id is not None:
+                customer_ids.add(customer_id)
+    if product_ids and kb.catalog is not None:
+        cur = conn.cursor()
+        cur.row_factory = Product.row_factory
+        cur.execute(f"SELECT {Product.COLUMNS} FROM faq_db_products WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(sorted(product_ids)),))
+        fresh = cur.fetchall()
+        refresh_catalog_products(fresh, deleted=product_ids - {p.id for p in fresh})
+    if order_ids:
+        invalidate_orders(order_ids, customer_ids)
+
+def _reset_cached(kb: KnowledgeBase, tables: tuple[str, ...]):
+    kb.change_stats["resets"] += 1
+    with kb.lock:
+        if "faq_db_products" in tables:
+            kb.catalog = None
+        if "faq_db_orders" in tables:
+            kb.order_cache.clear()
+            kb.order_summaries.clear()
+
+def invalidate_orders(order_ids: set[int], customer_ids: set[int]):
+    """
+    Drop the cached summaries of these orders and the cached order lists of
+    these customers (found through the identity cache) or that contain them.
+    """
+    kb = current_kb()
+    with kb.lock:
+        for order_id in order_ids:
+            kb.order_summaries.pop(order_id, None)
+        keys = {key for key, (user_id, _) in kb.identities.items() if user_id in customer_ids}
+        keys.update(key for key, (_, open_orders, _) in kb.order_cache.items()
+                    if any(o.id in order_ids for o in open_orders))
+        for key in keys:
+            kb.order_cache.pop(key, None)
+
+_change_feed_thread = None
+_change_feed_stop = threading.Event()
+
+def start_change_feed(interval: float = CHANGE_POLL_INTERVAL) -> dict[str, list[str]]:
+    """
+    Follow every hosted knowledge base's change log from a background thread,
+    applying deltas every `interval` seconds. Call it before warm-up so nothing
+    loaded in between is missed. Returns the followed files per tenant.
+    """
+    global _change_feed_thread
+    if interval <= 0:
+        return {}
+    followed = {}
+    for name in list_tenants():
+        kb = get_kb(name)
+        with use_kb(kb):
+            followed[name] = init_change_feed(kb)
+
+    def run():
+        while not _change_feed_stop.wait(interval):
+            for kb in list(_KBS.values()):
+                with use_kb(kb):
+                    try:
+                        poll_changes(kb)
+                    except sqlite3.Error as e:
+                        logger.warning("change feed for %s failed: %s", kb.name, e)
+
+    if _change_feed_thread is None or not _change_feed_thread.is_alive():
+        _change_feed_stop.clear()
+        _change_feed_thread = threading.Thread(target=run, name="change-feed", daemon=True)
+        _change_feed_thread.start()
+    return followed
+
+def stop_change_feed():
+    _change_feed_stop.set()
+
+def get_change_feed_stats() -> dict:
+    """Per tenant poll counts and applied versions; sources are labelled by role, not by file path."""
+    return {name: {**kb.change_stats,
+                   "versions": {("knowledge_base" if path == kb.db_file else "write_db"): version
+                                for path, version in kb.change_versions.items()}}
+            for name, kb in _KBS.items() if kb.change_versions}
 
-        # invalid input → ask again
-        return ("Please enter 1, 2, 3, or 4.", conversation_context)
 
+# --- 3. DECISION TREE (CONVERSATIONAL FLOW) & MAIN LOOP ---
 
-    # --- waiting: feedback other (free text) ---
-    if conversation_context.get('waiting_for') == 'feedback_other_pending':
-        text = (user_input or "").strip()
-        if not text:
-            return ("Please type your feedback (cannot be empty):", conversation_context)
+# --- 3a. STATE HANDLERS (dispatch on conversation_context['waiting_for']) ---
 
-        ctx_user = (conversation_context.get('user') or {})
-        user_id = ctx_user.get('user_id')
-        user_email = ctx_user.get('email')
+@dataclass
+class StateHandler:
+    """
+    A registered handler for one `waiting_for` state. The latency budget is
+    advisory: a handler always runs to completion (it may already have written
+    feedback or a user row), and overruns are only counted and logged so slow
+    states show up in /metrics.
+    """
+    state: str
+    func: Callable[[str, dict, dict], tuple[str, dict]]
+    needs: tuple[str, ...]      # data the handler touches: "db", "orders", "products", "feedback", "nlp"
+    budget_ms: float            # advisory latency budget; overruns are counted and logged, not cut short
+
+STATE_HANDLERS: dict[str, StateHandler] = {}
+_state_stats: dict[str, dict] = {}
+_state_stats_lock = threading.Lock()
+
+def state_handler(state: str, *, needs: tuple[str, ...] = (), budget_ms: float = 50.0):
+    """Register `func(user_input, conversation_context, user)` as the handler for `state`."""
+    def register(func):
+        STATE_HANDLERS[state] = StateHandler(state, func, tuple(needs), budget_ms)
+        return func
+    return register
+
+def run_state_handler(handler: StateHandler, user_input: str, conversation_context: dict,
+                      user: dict) -> tuple[str, dict]:
+    """Run a handler to completion, timing it against its (advisory) budget."""
+    t0 = time.perf_counter()
+    try:
+        return handler.func(user_input, conversation_context, user)
+    finally:
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        note_turn(handler_ms=round(elapsed_ms, 3))
+        over = elapsed_ms > handler.budget_ms
+        with _state_stats_lock:
+            st = _state_stats.setdefault(handler.state, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "over_budget": 0})
+            st["calls"] += 1
+            st["total_ms"] += elapsed_ms
+            st["max_ms"] = max(st["max_ms"], elapsed_ms)
+            st["over_budget"] += over
+        if over:
+            logger.warning("state %s took %.1f ms (budget %.0f ms)", handler.state, elapsed_ms, handler.budget_ms)
+
+def get_state_stats() -> dict:
+    """Per-state call counts, latency and budget overruns for reporting."""
+    with _state_stats_lock:
+        stats = {s: dict(v) for s, v in _state_stats.items()}
+    for state, h in STATE_HANDLERS.items():
+        st = stats.setdefault(state, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "over_budget": 0})
+        st["avg_ms"] = st["total_ms"] / st["calls"] if st["calls"] else 0.0
+        st["budget_ms"] = h.budget_ms
+        st["needs"] = list(h.needs)
+    return stats
+
+def is_cheap_turn(conversation_context: dict | None) -> bool:
+    """True when the pending state can be answered without NLP (menu picks, numbers, emails)."""
+    handler = STATE_HANDLERS.get((conversation_context or {}).get('waiting_for'))
+    return handler is not None and "nlp" not in handler.needs
+
+def _preserve_user(ctx):
+    return {'user': ctx.get('user')}
+
+def _track_orders_reply(email: str, ctx: dict) -> tuple[str, dict]:
+    """Shared order-tracking step: list open orders for `email` or explain why there are none."""
+    open_orders, has_any = get_order_overview(email)
+    if open_orders:
+        prefetch_order_summaries(open_orders)
+        ctx['waiting_for'] = 'choose_order_to_track'
+        ctx['order_choice_ids'] = [o.id for o in open_orders]
+        return (format_open_orders_menu(open_orders), ctx)
+
+    ctx.pop('waiting_for', None)
+    # no open orders → check if they have any orders at all
+    if not has_any:
+        return ("I couldn't find any orders for that email. Please create an account or check the email entered.", ctx)
+    # they have orders, but none active
+    return ("You currently have no processing or in-transit orders.", ctx)
+
+
+def _order_number_reply(order_number: str, email: str, ctx: dict) -> tuple[str, dict]:
+    """One-step tracking for "where is 184533": summarize that order if it is the user's."""
+    ctx.pop('waiting_for', None)
+    ctx.pop('pending_order_number', None)
+    order, items = fetch_order_by_number(order_number, email)
+    if order is None:
+        # same answer whether the order is missing or someone else's
+        return (f"I couldn't find order #{order_number} under {email}. "
+                "Please check the number, or type 'track order' to see your orders.", ctx)
+    return (summarize_order(order, items), ctx)
+
+
+# --- waiting: feedback choice (1–4) ---
+FEEDBACK_CHOICES = {
+    "1": (1, "good"),
+    "good": (1, "good"),
+    "2": (2, "ok"),
+    "ok": (2, "ok"),
+    "ok ok only": (2, "ok"),
+    "3": (3, "not_answered"),
+    "didn’t specifically answer my question": (3, "not_answered"),
+    "didn't specifically answer my question": (3, "not_answered"),
+    "4": (4, "others"),
+    "others": (4, "others"),
+    "other": (4, "others"),
+}
+
+@state_handler('feedback_choice', needs=("feedback",), budget_ms=50)
+def _on_feedback_choice(user_input, conversation_context, user):
+    choice = (user_input or "").strip().lower()
+    ctx_user = (conversation_context.get('user') or {})
 
-        insert_feedback(user_id=user_id, user_email=user_email,
-                        rating=4, category="others", comment=text)
+    # allow both numbers and words
+    if choice in FEEDBACK_CHOICES:
+        rating, category = FEEDBACK_CHOICES[choice]
+        if rating == 4:  # needs free text
+            ctx = {'user': ctx_user, 'waiting_for': 'feedback_other_pending'}
+            return ("Please type your feedback:", ctx)
+
+        # immediate save for 1–3 (no comment)
+        insert_feedback(user_id=ctx_user.get('user_id'), user_email=ctx_user.get('email'),
+                        rating=rating, category=category, comment=None)
         ctx = {'user': ctx_user, 'end_session': True}
-        return ("Thanks! Your feedback has been recorded. Goodbye!", ctx)
+        return (CLOSING_MSG, ctx)
 
+    # invalid input → ask again
+    return ("Please enter 1, 2, 3, or 4.", conversation_context)
 
-    # --- A0) waiting: choose product section (1–5) ---
-    if conversation_context.get('waiting_for') == 'choose_product_section':
-        choice_raw = user_input.strip().lower()
-        if choice_raw in ("menu", "back"):
-            ctx = _preserve_user(conversation_context)
-            return (PRODUCT_MENU_TEXT, ctx)
 
-        if not choice_raw.isdigit():
-            return ("Please enter a number 1–5 (or type 'menu' to see options).",
-                    conversation_context)
+# --- waiting: feedback other (free text) ---
+@state_handler('feedback_other_pending', needs=("feedback",), budget_ms=50)
+def _on_feedback_other(user_input, conversation_context, user):
+    text = (user_input or "").strip()
+    if not text:
+        return ("Please type your feedback (cannot be empty):", conversation_context)
 
-        choice = int(choice_raw)
+    ctx_user = (conversation_context.get('user') or {})
+    insert_feedback(user_id=ctx_user.get('user_id'), user_email=ctx_user.get('email'),
+                    rating=4, category="others", comment=text)
+    ctx = {'user': ctx_user, 'end_session': True}
+    return ("Thanks! Your feedback has been recorded. Goodbye!", ctx)
 
-        if choice == 6:
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'fallback_menu_choice'   # expect a number next
-            return (fallback_menu_text(), ctx)    
-
-        # Build WHERE by choice
-        if choice == 1:
-            where_sql, params = "WHERE is_trending = 1", ()
-        elif choice == 2:
-            where_sql, params = "WHERE is_on_sale = 1", ()
-        elif choice == 3:
-            where_sql, params = "WHERE LOWER(category) = 'men'", ()
-        elif choice == 4:
-            where_sql, params = "WHERE LOWER(category) = 'women'", ()
-        else:  # 5
-            where_sql, params = "WHERE LOWER(category) = 'accessories'", ()
-
-        # Query products for this section (first page, up to 10)
-        import sqlite3
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute(f"""
-                SELECT id, sku, name, category, price, sale_price, is_trending, is_on_sale,
-                    sizes, colors, material, description, stock_qty, shipping_note, return_note
-                FROM faq_db_products
-                {where_sql}
-                ORDER BY name
-                LIMIT 10
-            """, params)
-            products = [dict(r) for r in cur.fetchall()]
-
-        if not products:
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'choose_product_section'
-            return ("No products found in this section. Type 1–5 to pick another section, or 'menu' to see options.",
-                    ctx)
-
-        # Build the numbered list
-        lines = ["Here are some items:"]
-        for i, p in enumerate(products, 1):
-            sku = f" • SKU {p['sku']}" if p.get('sku') else ""
-            if p.get('is_on_sale') and p.get('sale_price') is not None and p.get('price') is not None:
-                price_txt = f"RM{p['sale_price']:.2f} (was RM{p['price']:.2f})"
-            elif p.get('price') is not None:
-                price_txt = f"RM{p['price']:.2f}"
-            else:
-                price_txt = "Price N/A"
-            lines.append(f"{i}) {p['name']} — {price_txt}{sku}")
-        lines.append("\nReply with an item number to see details, or type 'menu' to go back.")
-        sec_url = SECTION_URLS.get(choice, "https://leanlee0425.github.io/project-rule-base-chatbot/shop.html")
-        lines.append(f"More products: {sec_url}")
-        menu_text = "\n".join(lines)
 
+# --- A0) waiting: choose product section (1–5) ---
+@state_handler('choose_product_section', needs=("products",), budget_ms=50)
+def _on_choose_product_section(user_input, conversation_context, user):
+    choice_raw = user_input.strip().lower()
+    if choice_raw in ("menu", "back"):
         ctx = _preserve_user(conversation_context)
-        ctx['waiting_for'] = 'choose_product_item'
-        ctx['product_choice_ids'] = [p['id'] for p in products]
-        return (menu_text, ctx)
-
-    # --- A1) waiting: choose a specific product item ---
-    if conversation_context.get('waiting_for') == 'choose_product_item':
-        choice_raw = user_input.strip().lower()
-        if choice_raw in ("menu", "back"):
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'choose_product_section'
-            return (PRODUCT_MENU_TEXT, ctx)
-        if not choice_raw.isdigit():
-            return ("Please enter the item number from the list, or type 'menu' to go back.",
-                    conversation_context)
-        idx = int(choice_raw)
-        ids = conversation_context.get('product_choice_ids', [])
-        if not ids or not (1 <= idx <= len(ids)):
-            return ("That number isn’t in the list. Try again, or type 'menu' to go back.",
-                    conversation_context)
-
-        pid = ids[idx - 1]
-        product = fetch_product_by_id(pid)
-        if not product:
-            ctx = _preserve_user(conversation_context)
-            return ("Sorry, I couldn’t load that item. Type 'menu' to pick again.",
-                    ctx)
+        return (PRODUCT_MENU_TEXT, ctx)
+
+    if not choice_raw.isdigit():
+        return ("Please enter a number 1–5 (or type 'menu' to see options).",
+                conversation_context)
 
-        # Clear waiting state after showing details (or keep it if you want further actions)
+    choice = int(choice_raw)
+
+    if choice == 6:
         ctx = _preserve_user(conversation_context)
-        # Optionally keep the list for quick back navigation:
-        # ctx['waiting_for'] = 'choose_product_item'
-        return (format_product_answer(product, facet=None), ctx)
-    
-    # --- waiting: confirm end of session (yes/no) ---
-    if conversation_context.get('waiting_for') == 'confirm_end':
-        # classify the user message using your DB
+        ctx['waiting_for'] = 'fallback_menu_choice'   # expect a number next
+        return (fallback_menu_text(), ctx)
+
+    # Query products for this section (first page, up to 10)
+    products = get_products_by_choice(choice, page=1, page_size=10)
+
+    if not products:
+        ctx = _preserve_user(conversation_context)
+        ctx['waiting_for'] = 'choose_product_section'
+        return ("No products found in this section. Type 1–5 to pick another section, or 'menu' to see options.",
+                ctx)
+
+    sec_url = SECTION_URLS.get(choice, "https://leanlee0425.github.io/project-rule-base-chatbot/shop.html")
+    ctx = _preserve_user(conversation_context)
+    ctx['waiting_for'] = 'choose_product_item'
+    ctx['product_choice_ids'] = [p.id for p in products]
+    return (format_product_list(products, more_url=sec_url), ctx)
+
+
+# --- A1) waiting: choose a specific product item ---
+@state_handler('choose_product_item', needs=("products",), budget_ms=30)
+def _on_choose_product_item(user_input, conversation_context, user):
+    choice_raw = user_input.strip().lower()
+    if choice_raw in ("menu", "back"):
+        ctx = _preserve_user(conversation_context)
+        ctx['waiting_for'] = 'choose_product_section'
+        return (PRODUCT_MENU_TEXT, ctx)
+    if not choice_raw.isdigit():
+        return ("Please enter the item number from the list, or type 'menu' to go back.",
+                conversation_context)
+    idx = int(choice_raw)
+    ids = conversation_context.get('product_choice_ids', [])
+    if not ids or not (1 <= idx <= len(ids)):
+        return ("That number isn’t in the list. Try again, or type 'menu' to go back.",
+                conversation_context)
+
+    product = fetch_product_by_id(ids[idx - 1])
+    # Clear waiting state after showing details
+    ctx = _preserve_user(conversation_context)
+    if not product:
+        return ("Sorry, I couldn’t load that item. Type 'menu' to pick again.", ctx)
+    return (format_product_answer(product, facet=None), ctx)
+
+
+# --- waiting: confirm end of session (yes/no) ---
+CONFIRM_END_PROMPT = "Is there anything else I can help you with before ending the session? (yes/no)"
+
+def confirm_end_prompt(conversation_context: dict) -> tuple[str, dict]:
+    """Ask whether to end the session; the answer is handled by the confirm_end state."""
+    ctx = _preserve_user(conversation_context)
+    ctx['waiting_for'] = 'confirm_end'
+    return (CONFIRM_END_PROMPT, ctx)
+
+@state_handler('confirm_end', needs=("nlp",), budget_ms=150)
+def _on_confirm_end(user_input, conversation_context, user):
+    # plain y/n first, then classify the user message using your DB
+    answer = (user_input or "").strip().lower()
+    if answer in ("y", "yes"):
+        intent = 'affirm'
+    elif answer in ("n", "no"):
+        intent = 'deny'
+    else:
         intent, _ = get_intent(user_input)
 
-        ctx = {'user': conversation_context.get('user', {})}
-        if intent == 'affirm':   # user says "yes/sure/ok"
-            ctx.pop('waiting_for', None)
-            # Your prompt text was "do you want to continue? (yes/no)"
-            # If YES means CONTINUE:
-            return ("Okay — how else can I help you?", ctx)
-            # If you prefer YES means END, swap to:
-            # ctx['end_session'] = True; return ("Goodbye!", ctx)
-
-        if intent == 'deny':     # user says "no/nope"
-            # If NO means END:
-            ctx['end_session'] = True
-            ctx.pop('waiting_for', None)
-            return ("Goodbye!", ctx)
-            # If NO means CONTINUE, swap accordingly.
-
-        # Not clearly affirm/deny → ask again, keep state
-        return ("Please answer yes or no.", conversation_context)
-    
+    ctx = {'user': conversation_context.get('user', {})}
+    if intent == 'affirm':   # user says "yes/sure/ok" → CONTINUE
+        return ("Okay — how else can I help you?", ctx)
 
-    # --- waiting: user provides email (Option B path) ---
-    if conversation_context.get('waiting_for') == 'provide_email':
-        email_in = (user_input or "").strip()
-        # email = user_input.strip()
-        if not re.match(EMAIL_REGEX, email_in):
-            return ("That doesn't look like a valid email. Please enter a valid email (e.g., jane@example.com).",
-                    conversation_context)
-
-        # Optional: remember email in context (no user_id needed for Option B)
-        # ctx = {'user': {'email': email}}
-        ctx_user = (conversation_context.get('user') or {})
-        ctx = {'user': {**ctx_user, 'email': email_in}}  # merge email in
-
-        # find open orders by email
-        open_orders = fetch_open_orders_for_user(email_in)
-        if open_orders:
-            menu_text = format_open_orders_menu(open_orders)
-            ctx['waiting_for'] = 'choose_order_to_track'
-            ctx['order_choice_ids'] = [o['id'] for o in open_orders]
-            return (menu_text, ctx)
-
-        # no open orders → check if they have any orders at all
-        if not user_has_any_orders_by_email(email_in):
-            # ctx = _preserve_user(conversation_context)
-            ctx.pop('waiting_for', None)
-            return ("I couldn't find any orders for that email. Please create an account or check the email entered.", ctx)
-
-        # they have orders, but none active
-        ctx.pop('waiting_for', None)
-        return ("You currently have no processing or in-transit orders.", ctx)
-
-    # --- AX) waiting: choose from main (fallback) menu ---
-    if conversation_context.get('waiting_for') == 'fallback_menu_choice':
-        choice_raw = user_input.strip().lower()
-        if choice_raw in ("menu", "back"):
-            ctx = _preserve_user(conversation_context)
-            return (fallback_menu_text(), ctx)
+    if intent == 'deny':     # user says "no/nope" → END
+        ctx['end_session'] = True
+        return ("Goodbye!", ctx)
 
-        if not choice_raw.isdigit():
-            return ("Please enter a valid number 1–6 from the main menu.", conversation_context)
+    # Not clearly affirm/deny → ask again, keep state
+    return ("Please answer yes or no.", conversation_context)
+
+
+# --- waiting: user provides email (Option B path) ---
+@state_handler('provide_email', needs=("orders",), budget_ms=100)
+def _on_provide_email(user_input, conversation_context, user):
+    email_in = (user_input or "").strip()
+    if not re.match(EMAIL_REGEX, email_in):
+        return ("That doesn't look like a valid email. Please enter a valid email (e.g., jane@example.com).",
+                conversation_context)
+
+    # remember email in context (no user_id needed for Option B)
+    ctx_user = (conversation_context.get('user') or {})
+    ctx = {'user': {**ctx_user, 'email': email_in}}  # merge email in
+    # they asked about a specific order before we knew who they were
+    pending = conversation_context.get('pending_order_number')
+    if pending:
+        return _order_number_reply(pending, email_in, ctx)
+    return _track_orders_reply(email_in, ctx)
 
-        n = int(choice_raw)
-        slug = fallback_menu_resolve(n)
-        if not slug:
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'fallback_menu_choice'
-            return ("Please enter a valid number 1–6 from the main menu.", ctx)
 
-        # Clear the menu state
+# --- AX) waiting: choose from main (fallback) menu ---
+SUPPORT_FORM_URL = "leeyenyen@oum.edu.my"
+
+@state_handler('fallback_menu_choice', needs=("db", "orders"), budget_ms=100)
+def _on_fallback_menu_choice(user_input, conversation_context, user):
+    choice_raw = user_input.strip().lower()
+    if choice_raw in ("menu", "back"):
         ctx = _preserve_user(conversation_context)
-        ctx.pop('waiting_for', None)
+        return (fallback_menu_text(), ctx)
 
-        # Route by slug
-        if slug == "track_order":
-            # user = conversation_context.get('user') or {}
-            # email = user.get('email')
-            if not email:
-                ctx['waiting_for'] = 'provide_email'
-                return ("I need to know who you are first. Please provide your email.", ctx)
-
-            open_orders = fetch_open_orders_for_user(email)  # ✅ use email
-            if not open_orders:
-                if not user_has_any_orders_by_email(email):  # ✅ use the email helper
-                    msg = ("I couldn't find any orders for that email. "
-                        "Please create an account or check the email entered.")
-                    return (msg, ctx)
-                return ("You currently have no processing or in-transit orders.", ctx)
-
-            menu_text = format_open_orders_menu(open_orders)
-            ctx['waiting_for'] = 'choose_order_to_track'
-            ctx['order_choice_ids'] = [o['id'] for o in open_orders]
-            return (menu_text, ctx)
-
-        if slug == "create_account":
-            return (get_answer_for_intent('create_account'), ctx)
-
-        if slug == "return_policy":
-            return (get_answer_for_intent('return_policy'), ctx)
-
-        if slug == "package_lost_damaged":
-            return (get_answer_for_intent('package_lost_damaged'), ctx)
-
-        if slug == "contact_customer_support":
-            SUPPORT_FORM_URL = "leeyenyen@oum.edu.my"
-            return (f"You can reach us email us for more details: {SUPPORT_FORM_URL}", ctx)
-
-        if slug == "send_glink":
-            SUPPORT_FORM_URL = "leeyenyen@oum.edu.my"
-            ctx['end_session'] = True
-            return (f"I'm sorry I can’t resolve that here. Please email us and our support team will contact you: {SUPPORT_FORM_URL}", ctx)
-
-        # default guard (shouldn't hit)
-        return ("Okay—back to the main menu. How can I help you?", ctx)
-
-
-    # --- A) waiting choose order to track ---
-    if conversation_context.get('waiting_for') == 'choose_order_to_track':
-        # Expecting a number
-        choice_raw = user_input.strip()
-        if not choice_raw.isdigit():
-            return ("Please enter a valid number from the list (e.g., 1 or 2).",
-                    conversation_context)
-        idx = int(choice_raw)
-        order_ids: list[int] = conversation_context.get('order_choice_ids', [])
-        if not order_ids or not (1 <= idx <= len(order_ids)):
-            return ("That number isn’t in the list. Please try again.",
-                    conversation_context)
-
-        selected_id = order_ids[idx - 1]
-        order, items = fetch_order_bundle_by_id(selected_id)
-        if not order:
-            # very unlikely, but handle gracefully
-            ctx = _preserve_user(conversation_context)
-            return ("Sorry, I couldn’t retrieve that order just now. Please try another one.",
-                    ctx)
+    if not choice_raw.isdigit():
+        return ("Please enter a valid number 1–6 from the main menu.", conversation_context)
 
-        # clear waiting state
+    slug = fallback_menu_resolve(int(choice_raw))
+    if not slug:
         ctx = _preserve_user(conversation_context)
-        return (summarize_order(order, items), ctx)
+        ctx['waiting_for'] = 'fallback_menu_choice'
+        return ("Please enter a valid number 1–6 from the main menu.", ctx)
+
+    # Clear the menu state
+    ctx = _preserve_user(conversation_context)
+
+    # Route by slug
+    if slug == "track_order":
+        email = (user.get('email') or "").strip()
+        if not email:
+            ctx['waiting_for'] = 'provide_email'
+            return ("I need to know who you are first. Please provide your email.", ctx)
+        return _track_orders_reply(email, ctx)
+
+    if slug in ("create_account", "return_policy", "package_lost_damaged"):
+        return (get_answer_for_intent(slug), ctx)
+
+    if slug == "contact_customer_support":
+        return (f"You can reach us email us for more details: {SUPPORT_FORM_URL}", ctx)
+
+    if slug == "send_glink":
+        ctx['end_session'] = True
+        return (f"I'm sorry I can’t resolve that here. Please email us and our support team will contact you: {SUPPORT_FORM_URL}", ctx)
+
+    # default guard (shouldn't hit)
+    return ("Okay—back to the main menu. How can I help you?", ctx)
+
+
+# --- A) waiting choose order to track ---
+@state_handler('choose_order_to_track', needs=("orders",), budget_ms=20)
+def _on_choose_order_to_track(user_input, conversation_context, user):
+    # Expecting a number
+    choice_raw = user_input.strip()
+    if not choice_raw.isdigit():
+        return ("Please enter a valid number from the list (e.g., 1 or 2).",
+                conversation_context)
+    idx = int(choice_raw)
+    order_ids: list[int] = conversation_context.get('order_choice_ids', [])
+    if not order_ids or not (1 <= idx <= len(order_ids)):
+        return ("That number isn’t in the list. Please try again.",
+                conversation_context)
+
+    summary = get_order_summary(order_ids[idx - 1])
+    # clear waiting state
+    ctx = _preserve_user(conversation_context)
+    if summary is None:
+        # very unlikely, but handle gracefully
+        return ("Sorry, I couldn’t retrieve that order just now. Please try another one.", ctx)
+    return (summary, ctx)
+
+
+# --- 3b. FREE-TEXT TURN ---
+
+# Words that mean "I want to browse the catalog"
+BROWSE_TRIGGERS = (
+    "browse products", "browse product", "show products", "show product",
+    "product list", "list products", "see products", "view products",
+    "catalog", "shop", "trending", "best sellers", "popular"
+)
+
+# If user mentions these, DON'T open the catalog
+BROWSE_BLOCKERS = (
+    "damage", "damaged", "broken", "defect", "faulty",
+    "refund", "return", "exchange", "warranty",
+    "lost", "missing", "never arrived",
+    "support", "contact", "help", "complaint"
+)
+
+def looks_like_browse(s: str) -> bool:
+    # explicit browse phrases win
+    if any(k in s for k in BROWSE_TRIGGERS):
+        return not any(b in s for b in BROWSE_BLOCKERS)
+    # generic "product(s)" must be paired with an action verb
+    if ("product" in s or "products" in s) and any(v in s for v in ("show","browse","see","list","view","buy","find")):
+        return not any(b in s for b in BROWSE_BLOCKERS)
+    return False
 
-    # (keep your existing "waiting_for == 'order_number'" block here if you still use it anywhere else)
+def chatbot_response(user_input, conversation_context):
+    """
+    One dialogue turn: returns (reply, new_context). Never prints, reads input
+    or sleeps; anything that needs another answer from the user is a
+    `waiting_for` state handled on the next call.
+    """
+    # ---- normalize user info ONCE ----
+    ctx_user = (conversation_context.get('user') or {})
+    if not isinstance(ctx_user, dict):
+        ctx_user = {}
+    email = (ctx_user.get('email') or "").strip()   # always defined ("" if missing)
+
+    # --- A) a pending question: O(1) dispatch to its state handler ---
+    handler = STATE_HANDLERS.get(conversation_context.get('waiting_for'))
+    if handler is not None:
+        note_turn(state=handler.state)
+        return run_state_handler(handler, user_input, conversation_context, ctx_user)
 
     # --- B) normal intent detection ---
     intent, entity = get_intent(user_input)
+    note_turn(intent=intent, entity=entity)
 
-            # Map 'goodbye', 'affirm' (ok/sure/okay), and 'thanks' to feedback flow
+    # Map 'goodbye', 'affirm' (ok/sure/okay), and 'thanks' to feedback flow
     if intent in ('goodbye', 'affirm', 'thanks'):
         ctx = _preserve_user(conversation_context)
         ctx['waiting_for'] = 'feedback_choice'
@@ -997,219 +2622,125 @@ def chatbot_response(user_input, conversation_context, interactive: bool = True)
 
     # Early keyword router so typos like "woud" still work
     txt = (user_input or "").lower()
-
-    # Words that mean "I want to browse the catalog"
-    BROWSE_TRIGGERS = (
-        "browse products", "browse product", "show products", "show product",
-        "product list", "list products", "see products", "view products",
-        "catalog", "shop", "trending", "best sellers", "popular"
-    )
-
-    # If user mentions these, DON'T open the catalog
-    BROWSE_BLOCKERS = (
-        "damage", "damaged", "broken", "defect", "faulty",
-        "refund", "return", "exchange", "warranty",
-        "lost", "missing", "never arrived",
-        "support", "contact", "help", "complaint"
-    )
-
-    def looks_like_browse(s: str) -> bool:
-        # explicit browse phrases win
-        if any(k in s for k in BROWSE_TRIGGERS):
-            return not any(b in s for b in BROWSE_BLOCKERS)
-        # generic "product(s)" must be paired with an action verb
-        if ("product" in s or "products" in s) and any(v in s for v in ("show","browse","see","list","view","buy","find")):
-            return not any(b in s for b in BROWSE_BLOCKERS)
-        return False
-
     if conversation_context.get('waiting_for') is None and looks_like_browse(txt):
         ctx = _preserve_user(conversation_context)
         ctx['waiting_for'] = 'choose_product_section'
         return (PRODUCT_MENU_TEXT, ctx)
 
-
     # Entry point for product browsing
     if intent in ('product', 'browse_products', 'show_products'):
         ctx = _preserve_user(conversation_context)
         ctx['waiting_for'] = 'choose_product_section'
         return (PRODUCT_MENU_TEXT, ctx)
 
-    # --- C) advanced track_order branch ---
+    # --- C0) "where is 184533": go straight to that order ---
+    # Unclassified text only counts when it is just the number, so phone numbers,
+    # postcodes and prices in other messages don't trigger an order lookup.
+    if intent in ('track_order', 'fallback'):
+        if entity and ORDER_NO_RE.fullmatch(str(entity)):
+            order_number = str(entity)
+        elif intent == 'track_order':
+            order_number = find_order_number(user_input or "")
+        else:
+            m = ORDER_NO_ONLY_RE.fullmatch(user_input or "")
+            order_number = m.group(1) if m else None
+        if order_number:
+            ctx = _preserve_user(conversation_context)
+            if not email:
+                ctx['waiting_for'] = 'provide_email'
+                ctx['pending_order_number'] = order_number
+                return (f"Please provide your email so I can look up order #{order_number}.", ctx)
+            return _order_number_reply(order_number, email, ctx)
+
+    # --- C) track_order branch ---
     if intent == 'track_order':
+        ctx = _preserve_user(conversation_context)
         # 1) identify user
-        user = conversation_context.get('user') or {}
-        email  = user.get('email')
-        if not email :
-            ctx = _preserve_user(conversation_context)
+        if not email:
             ctx['waiting_for'] = 'provide_email'   # expect email next turn
-            return ("I need to know who you are first. Please provide your email.",ctx)
-                    # _preserve_user(conversation_context))
-
-        # 2) fetch open orders (processing / shipped / in_transit)
-        open_orders = fetch_open_orders_for_user(email)
-
-        # 3) if any open orders → show numbered menu and wait for choice
-        if open_orders:
-            if not open_orders:
-                if not user_has_any_orders_by_email(email):
-                    msg = ("I couldn't find any orders for that email. "
-                        "Please create an account or check the email entered.")
-                    return (msg, _preserve_user(conversation_context))
-                msg = ("You currently have no processing or in-transit orders.")
-                return (msg, _preserve_user(conversation_context))
- 
-            menu_text = format_open_orders_menu(open_orders)
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'choose_order_to_track'
-            ctx['order_choice_ids'] = [o['id'] for o in open_orders]
-            return (menu_text, ctx)
-
-        # 4) no open orders → check if this user has any orders at all
-        if not user_has_any_orders_by_email(email):
-            ctx = _preserve_user(conversation_context)
-            ctx.pop('waiting_for', None)
-            return ("I couldn't find any orders for that email. Please create an account or check the email entered.", ctx)
-
-        # 5) user has past orders but nothing active
-        return ("You currently have no processing or in-transit orders.",
-                _preserve_user(conversation_context))
+            return ("I need to know who you are first. Please provide your email.", ctx)
+        # 2) open orders → numbered menu; otherwise explain
+        return _track_orders_reply(email, ctx)
 
 
     # --- D) other intents / fallbacks (keep your existing logic) ---
     if intent == 'fallback':
-        # Non-interactive (API mode): show menu text and wait for a choice on next turn
-        if not interactive:
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'fallback_menu_choice'
-            apology = get_answer_for_intent('fallback')
-            # Return the fallback menu prompt (non-blocking)
-            return (apology + "\n\n" + fallback_menu_text(), ctx)
-
-        # Interactive (terminal mode): keep your original behavior
-        print(get_answer_for_intent('fallback'))
-        selected_intent = fallback_menu()
-        if selected_intent is None:
-            response = "No problem. Ending the session. Have a great day!"
-            ctx = _preserve_user(conversation_context); ctx['end_session'] = True
-            return response, ctx
-        if selected_intent == 'track_order':
-            user = conversation_context.get('user') or {}
-            user_id = user.get('user_id')
-            open_orders = fetch_open_orders_for_user(email)
-            if not open_orders:
-                msg = ("I didn’t find any processing/in-transit orders. "
-                       "You can type an order number to search for a specific order.")
-                return (msg, _preserve_user(conversation_context))
-            menu_text = format_open_orders_menu(open_orders)
-            ctx = _preserve_user(conversation_context)
-            ctx['waiting_for'] = 'choose_order_to_track'
-            ctx['order_choice_ids'] = [o['id'] for o in open_orders]
-            return (menu_text, ctx)
-        if selected_intent == 'send_glink':
-            SUPPORT_FORM_URL = "leeyenyen@oum.edu.my"
-            response = f"I'm sorry I can’t resolve that here. Please email us and our support team will contact you: {SUPPORT_FORM_URL}"
-            ctx = _preserve_user(conversation_context); ctx['end_session'] = True
-            return response, ctx
-        return get_answer_for_intent(selected_intent), _preserve_user(conversation_context)
+        # show the menu text and wait for a choice on the next turn
+        ctx = _preserve_user(conversation_context)
+        ctx['waiting_for'] = 'fallback_menu_choice'
+        apology = get_answer_for_intent('fallback')
+        return (apology + "\n\n" + fallback_menu_text(), ctx)
 
 
     if intent == 'goodbye':
-        ctx = _preserve_user(conversation_context)
-        ctx['waiting_for'] = 'confirm_end'
-        return ("Before I end the session, do you want to continue? (yes/no)", ctx)
+        return confirm_end_prompt(conversation_context)
 
     return get_answer_for_intent(intent), _preserve_user(conversation_context)
 
 
 
-def bot_send(response, min_delay=3, max_delay=5):
-    """Simulate bot thinking/typing, then print the response."""
-    delay = random.uniform(min_delay, max_delay)
-
-    # typing indicator
-    msg = "Bot is typing..."
-    sys.stdout.write(msg)
-    sys.stdout.flush()
-    t0 = time.time()
-    dot = 0
-    while time.time() - t0 < delay:
-        sys.stdout.write("." * ((dot % 3) + 1) + "\r" + msg + "   \r")
-        sys.stdout.flush()
-        time.sleep(0.4)
-        dot += 1
-
-    # clear the line and print the actual bot message
-    sys.stdout.write(" " * (len(msg) + 3) + "\r")
-    sys.stdout.flush()
-    print(f"Bot: {response}", flush=True)
-
-
-def main():
-
-        # One-line, anchored regex so we only trigger when the whole input is an end cue.
-    END_TRIGGER_RE = re.compile(
-        r"^\s*(?:"
-        r"quit|exit|bye|goodbye|"
-        r"ok(?:ay)?|can|done|got it|"
-        r"no more|nothing else|that(?:'|’)?s all|all good|i(?:'|’)?m good|im good|"
-        r"no thanks|no thank you|thanks"
-        r")\s*[.!?]*\s*$",
-        re.IGNORECASE
-    )
-
-    """Main function to run the chatbot."""
-    setup_database()
-    ensure_order_tables()
-    
+# Structured per-turn log (CONVERSATION_LOG_FILE); None when disabled
+conversation_log = ConversationLog.from_env()
+if conversation_log is not None:
+    atexit.register(conversation_log.close)
+# Replies to these prompts are an email address or free-text feedback: only their length is logged
+_UNLOGGED_STATES = frozenset({"provide_email", "feedback_choice", "feedback_other_pending"})
+_EMAIL_IN_TEXT_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
 
-    # 🔹 Single-shot capture
-    user = capture_user_profile()
-
-    print("\n--- E-commerce Chatbot ---")
-    print("Bot: Hello! How can I assist you today?")
-
-    conversation_context = {"user": user}
-
-
-    while True:
-        user_input = input("You: ")
-        print(f"You: {user_input}", flush=True)
-
-        # 🔹 If user typed quit, confirm before ending
-                # 🔹 Treat many phrases as “I’m done”
-        if END_TRIGGER_RE.match(user_input):
-            # Confirm before actually ending
-            conversation_context, should_end = confirm_before_end(conversation_context)
-            if should_end:
-                break
-            else:
-                # user wants to continue → skip intent this turn
-                continue
-
-        # Normal turn
-        response, conversation_context = chatbot_response(user_input, conversation_context)
-        bot_send(response, min_delay=3, max_delay=5)
-
-        # 🔹 If any branch set end_session, confirm before ending
-        if conversation_context.get('end_session'):
-            conversation_context, should_end = confirm_before_end(conversation_context)
-            if should_end:
-                break
-            else:
-                # user wants to continue → keep chatting
-                continue
-
-def generate_reply_api(user_input: str, conversation_context: dict | None = None) -> tuple[str, dict]:
+def generate_reply_api(user_input: str, conversation_context: dict | None = None,
+                       tenant: str | None = None) -> tuple[str, dict]:
+    kb = get_kb(tenant)
+    if kb is None:
+        raise KeyError(f"Unknown tenant: {tenant}")
     if not isinstance(conversation_context, dict):
         conversation_context = {}
     # make sure we always have a dict user
     u = conversation_context.get('user')
     if not isinstance(u, dict):
         conversation_context['user'] = {}
-    reply, new_ctx = chatbot_response(user_input, conversation_context, interactive=False)
+    if conversation_log is None:
+        with use_kb(kb):
+            reply, new_ctx = chatbot_response(user_input, conversation_context)
+        return reply, new_ctx
+
+    # session id survives handlers that rebuild the context from scratch
+    sid = conversation_context.get('sid') or os.urandom(8).hex()
+    waiting_before = conversation_context.get('waiting_for')
+    t0 = time.perf_counter()
+    with use_kb(kb), trace_turn() as trace:
+        reply, new_ctx = chatbot_response(user_input, conversation_context)
+    new_ctx['sid'] = sid
+    record = {"ts": round(time.time(), 3), "tenant": kb.name, "sid": sid, "message_chars": len(user_input)}
+    if conversation_log.messages and waiting_before not in _UNLOGGED_STATES:
+        record["message"] = _EMAIL_IN_TEXT_RE.sub("<email>", user_input)
+    conversation_log.write({
+        **record, "waiting_for_before": waiting_before, "waiting_for_after": new_ctx.get('waiting_for'),
+        **trace, "total_ms": round((time.perf_counter() - t0) * 1000, 3),
+    })
     return reply, new_ctx
 
+def identify_api(email: str, name: str = "", conversation_context: dict | None = None,
+                 tenant: str | None = None) -> tuple[dict, dict]:
+    """
+    Session start for web clients: upsert the user and put them in the context.
+    Returns (user, new_context). Raises ValueError for an invalid email.
+    """
+    kb = get_kb(tenant)
+    if kb is None:
+        raise KeyError(f"Unknown tenant: {tenant}")
+    email = (email or "").strip()
+    if not re.match(EMAIL_REGEX, email):
+        raise ValueError("Please enter a valid email (e.g., jane@example.com).")
+    with use_kb(kb):
+        user = identify_user(email, (name or "").strip())
+    ctx = dict(conversation_context) if isinstance(conversation_context, dict) else {}
+    ctx['user'] = {**(ctx.get('user') if isinstance(ctx.get('user'), dict) else {}), **user}
+    return user, ctx
 
-if __name__ == "__main__":
-    main()
 
+if __name__ == "__main__":
+    # The console driver lives in chatbot_cli.py. Register this module under its
+    # import name first so the driver shares it instead of loading a second copy.
+    sys.modules.setdefault("FYP_chatbot_LEE_YEN_YEN", sys.modules[__name__])
+    import chatbot_cli
+    chatbot_cli.main()
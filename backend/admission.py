@@ -0,0 +1,136 @@
+"""
+Admission control for the chat endpoint.
+
+Limits how many turns run in the threadpool at once and keeps a bounded,
+prioritised queue in front of it. A request is rejected up front (503 +
+Retry-After) when the queue is full or its expected wait would exceed the
+deadline, and is dropped if it actually waits longer than that. Cheap turns
+(menu picks, numbers, emails) are served before free-text turns that need NLP.
+
+Configuration (environment):
+    CHAT_MAX_CONCURRENCY    turns running at once (default 8)
+    CHAT_MAX_QUEUE          turns allowed to wait (default 64)
+    CHAT_QUEUE_DEADLINE_MS  longest acceptable wait in the queue (default 2000)
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+PRIORITY_CHEAP = 0
+PRIORITY_NLP = 1
+
+
+class Overloaded(Exception):
+    """Raised when a turn is shed instead of queued."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Concurrency limit plus bounded priority queue; all state lives on the event loop."""
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64, deadline_s: float = 2.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline_s = deadline_s
+        self.running = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []   # (priority, seq, future)
+        self._queued = {PRIORITY_CHEAP: 0, PRIORITY_NLP: 0}
+        self._seq = itertools.count()
+        self._service_ewma_s = 0.05
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "deadline": 0, "timed_out": 0}
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+            deadline_s=float(os.getenv("CHAT_QUEUE_DEADLINE_MS", "2000")) / 1000,
+        )
+
+    @asynccontextmanager
+    async def admit(self, priority: int = PRIORITY_NLP):
+        t0 = time.perf_counter()
+        await self._acquire(priority)
+        waited = time.perf_counter() - t0
+        self.admitted += 1
+        self.wait_total_s += waited
+        self.wait_max_s = max(self.wait_max_s, waited)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # exponentially weighted service time drives the wait estimate
+            self._service_ewma_s = 0.9 * self._service_ewma_s + 0.1 * (time.perf_counter() - start)
+            self._release()
+
+    def _expected_wait(self, priority: int) -> float:
+        ahead = sum(n for p, n in self._queued.items() if p <= priority)
+        return (ahead + 1) * self._service_ewma_s / self.max_concurrency
+
+    async def _acquire(self, priority: int):
+        if self.running < self.max_concurrency and not any(self._queued.values()):
+            self.running += 1
+            return
+        expected = self._expected_wait(priority)
+        if sum(self._queued.values()) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue_full", expected)
+        if expected > self.deadline_s:
+            self.rejected["deadline"] += 1
+            raise Overloaded("deadline", expected)
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.deadline_s)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return  # the slot was handed over just as we timed out
+            fut.cancel()
+            self._queued[priority] -= 1
+            self.rejected["timed_out"] += 1
+            raise Overloaded("timed_out", self._expected_wait(priority))
+        except asyncio.CancelledError:  # client went away while queued
+            if fut.done() and not fut.cancelled():
+                self._release()
+            else:
+                fut.cancel()
+                self._queued[priority] -= 1
+            raise
+
+    def _release(self):
+        # hand the slot straight to the best waiter, skipping ones that gave up
+        while self._waiters:
+            priority, _, fut = heapq.heappop(self._waiters)
+            if fut.cancelled():
+                continue
+            self._queued[priority] -= 1
+            fut.set_result(None)
+            return
+        self.running -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": {"cheap": self._queued[PRIORITY_CHEAP], "nlp": self._queued[PRIORITY_NLP]},
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "deadline_ms": self.deadline_s * 1000,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_wait_ms": 1000 * self.wait_total_s / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": 1000 * self.wait_max_s,
+            "service_ewma_ms": 1000 * self._service_ewma_s,
+        }
@@ -1,15 +1,67 @@
-from fastapi import FastAPI
+import asyncio
+import hmac
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 # ⬇️ import the function you just added
 from FYP_chatbot_LEE_YEN_YEN import generate_reply_api  # or from <your_big_file> import generate_reply_api
+from FYP_chatbot_LEE_YEN_YEN import identify_api, feedback_analytics, use_kb, conversation_log
+from FYP_chatbot_LEE_YEN_YEN import parse_product_updates, upsert_products, parse_rule_updates, import_rules
+from FYP_chatbot_LEE_YEN_YEN import get_state_stats, get_regex_stats, get_regex_summary, get_kb, is_cheap_turn, trace_turn, warm_up_all
+from FYP_chatbot_LEE_YEN_YEN import start_change_feed, stop_change_feed, get_change_feed_stats
+from admission import AdmissionController, Overloaded, PRIORITY_CHEAP, PRIORITY_NLP
+from ctxtoken import ContextTokens, InvalidToken
+from profiling import Profiler
+
+# Fill answers/rules/catalog/intent caches before this worker takes traffic ("0" to skip)
+WARMUP = os.getenv("WARMUP", "1") != "0"
+warmup_report: list[dict] = []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # follow faq_db_changes first, so nothing changed during warm-up is missed
+    followed = await run_in_threadpool(start_change_feed)
+    for tenant, files in followed.items():
+        print(f"Change feed [{tenant}]: following {', '.join(files) or 'nothing'}", flush=True)
+    if WARMUP:
+        warmup_report[:] = await run_in_threadpool(warm_up_all)
+        for r in warmup_report:
+            print(f"Warm-up [{r['tenant']}]: {r['seconds']:.2f}s, {r['answers']} answers, {r['rules']} rules, "
+                  f"{r['products']} products, {r['intent_cache']}/{r['utterances']} utterances cached, "
+                  f"{r['lemma_table']} lemmas", flush=True)
+    yield
+    stop_change_feed()
+
+app = FastAPI(title="FYP Rule-based Chatbot API", lifespan=lifespan)
+
+# Concurrency limit + bounded priority queue in front of the engine (see admission.py)
+admission = AdmissionController.from_env()
+
+# Shared secret for /admin/* endpoints and the X-Profile header; admin routes are off when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
-app = FastAPI(title="FYP Rule-based Chatbot API")
+# Opt-in sampling profiler (PROFILE_SAMPLE_RATE or X-Profile: <ADMIN_TOKEN>)
+profiler = Profiler.from_env()
+
+# WebSocket sessions: ping after this many quiet seconds, close after WS_IDLE_TIMEOUT_S without a client message
+WS_HEARTBEAT_S = float(os.getenv("WS_HEARTBEAT_S", "25"))
+WS_IDLE_TIMEOUT_S = float(os.getenv("WS_IDLE_TIMEOUT_S", "300"))
+ws_sessions = {"open": 0, "opened": 0, "idle_closed": 0}
+
+# Signed context tokens for stateless clients (CONTEXT_TOKEN_SECRET; see ctxtoken.py)
+context_tokens = ContextTokens.from_env()
+# What /chat still returns as plain `context` when tokens are on (the rest lives in the token)
+PUBLIC_CONTEXT_KEYS = ("user", "waiting_for", "end_session")
 
 # Allow local dev frontends (adjust ports as needed)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins = [
+ALLOWED_ORIGINS = [
     "https://leanlee0425.github.io",   # GitHub Pages (prod/demo)
     "http://127.0.0.1:5500",           # Local dev (Live Server)
     "http://localhost:5500",
@@ -18,7 +70,10 @@ app.add_middleware(
     # optional common dev ports:
     "http://localhost:3000",
     "http://127.0.0.1:3000",
-],
+]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -27,16 +82,308 @@ app.add_middleware(
 class ChatIn(BaseModel):
     message: str
     context: dict | None = None
+    token: str | None = None
 
 class ChatOut(BaseModel):
     reply: str
     context: dict
+    token: str | None = None
+
+class IdentifyIn(BaseModel):
+    email: str
+    name: str = ""
+    context: dict | None = None
+    token: str | None = None
+
+class IdentifyOut(BaseModel):
+    user: dict
+    context: dict
+    token: str | None = None
 
 @app.get("/")
 def health():
     return {"status": "OK"}
 
-@app.post("/chat", response_model=ChatOut)
-def chat(incoming: ChatIn):
-    reply, new_ctx = generate_reply_api(incoming.message, incoming.context or {})
+@app.get("/metrics")
+def metrics():
+    # per-state handler latency vs. budget; regex rule counts per tenant (patterns: /admin/regex)
+    return {"states": get_state_stats(), "regex": get_regex_summary(), "admission": admission.snapshot(),
+            "warmup": warmup_report,
+            "conversation_log": conversation_log.stats() if conversation_log else None,
+            "websocket": ws_sessions, "change_feed": get_change_feed_stats(),
+            "context_token": context_tokens.stats() if context_tokens else None}
+
+def _require_admin(token: str | None):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/profile")
+def download_profile(format: str = "folded", x_admin_token: str | None = Header(default=None)):
+    # folded stacks per intent/state → flamegraph.pl / speedscope; json → top frames per label
+    _require_admin(x_admin_token)
+    if format == "json":
+        return profiler.summary()
+    return PlainTextResponse(profiler.folded(),
+                             headers={"Content-Disposition": 'attachment; filename="chat-profile.folded"'})
+
+@app.get("/admin/regex")
+def regex_stats(limit: int = 20, x_admin_token: str | None = Header(default=None)):
+    # costliest regex rules per tenant, and the ones slower on this worker than at build time
+    _require_admin(x_admin_token)
+    return get_regex_stats(limit)
+
+@app.delete("/admin/profile")
+def reset_profile(x_admin_token: str | None = Header(default=None)):
+    _require_admin(x_admin_token)
+    profiler.reset()
+    return {"status": "OK"}
+
+@app.post("/admin/catalog")
+async def import_catalog(request: Request, format: str | None = None,
+                         x_tenant: str | None = Header(default=None), x_admin_token: str | None = Header(default=None)):
+    # body: CSV or JSON lines of product updates keyed by sku (see import_catalog.py)
+    _require_admin(x_admin_token)
+    kb = get_kb(x_tenant)
+    if kb is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {x_tenant}")
+    text = (await request.body()).decode("utf-8-sig")
+
+    def run():
+        with use_kb(kb):
+            return upsert_products(parse_product_updates(text, format))
+
+    try:
+        return await run_in_threadpool(run)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/rules")
+async def import_rule_set(request: Request, format: str | None = None,
+                          x_tenant: str | None = Header(default=None), x_admin_token: str | None = Header(default=None)):
+    # body: CSV or JSON lines of intent/type/pattern/weight/answer rows (see import_rules.py)
+    _require_admin(x_admin_token)
+    kb = get_kb(x_tenant)
+    if kb is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {x_tenant}")
+    text = (await request.body()).decode("utf-8-sig")
+
+    def run():
+        with use_kb(kb):
+            return import_rules(parse_rule_updates(text, format))
+
+    try:
+        return await run_in_threadpool(run)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/analytics/feedback")
+def feedback_report(bucket: str = "day", start: str | None = None, end: str | None = None,
+                    x_tenant: str | None = Header(default=None), x_admin_token: str | None = Header(default=None)):
+    # served from the trigger-maintained daily aggregates, never the raw feedback table
+    _require_admin(x_admin_token)
+    kb = get_kb(x_tenant)
+    if kb is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {x_tenant}")
+    try:
+        with use_kb(kb):
+            buckets = feedback_analytics(bucket, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"bucket": bucket, "start": start, "end": end, "buckets": buckets}
+
+def _reply(incoming: ChatIn, tenant: str | None) -> ChatOut:
+    # One process can host several storefronts (KB_TENANTS); pick by header or path
+    if get_kb(tenant) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant}")
+    reply, new_ctx = generate_reply_api(incoming.message, incoming.context or {}, tenant=tenant)
     return ChatOut(reply=reply, context=new_ctx)
+
+def _profiled_reply(incoming: ChatIn, tenant: str | None) -> ChatOut:
+    with profiler.profile_thread() as target, trace_turn() as trace:
+        try:
+            return _reply(incoming, tenant)
+        finally:
+            target.label = (f"state:{trace['state']}" if "state" in trace
+                            else f"intent:{trace.get('intent', 'none')}")
+
+async def _run_turn(incoming: ChatIn, tenant: str | None, x_profile: str | None = None) -> ChatOut:
+    # Menu/number turns skip NLP, so serve them ahead of free-text turns; raises Overloaded
+    priority = PRIORITY_CHEAP if is_cheap_turn(incoming.context) else PRIORITY_NLP
+    handler = _profiled_reply if profiler.wants(x_profile) else _reply
+    async with admission.admit(priority):
+        return await run_in_threadpool(handler, incoming, tenant)
+
+def _client_context(context: dict | None, token: str | None, tenant: str | None) -> dict:
+    """
+    Dialogue state sent by a client. With tokens on, state only comes from a signed
+    token (from /chat or /identify) and a bare `context` is ignored, user included,
+    so neither choice ids nor someone else's email can be forged. Raises InvalidToken.
+    """
+    if context_tokens is None:
+        return context or {}
+    if token:
+        return context_tokens.decode(token, get_kb(tenant).name)
+    return {}
+
+def _token_reply(ctx: dict, tenant: str | None) -> tuple[str, dict]:
+    """Signed token for `ctx` and the part of it clients may still see in plain form."""
+    return (context_tokens.encode(ctx, get_kb(tenant).name),
+            {k: ctx[k] for k in PUBLIC_CONTEXT_KEYS if k in ctx})
+
+async def _admitted_reply(incoming: ChatIn, tenant: str | None, x_profile: str | None = None):
+    if get_kb(tenant) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {tenant}")
+    if context_tokens is not None:
+        try:
+            ctx = _client_context(incoming.context, incoming.token, tenant)
+        except InvalidToken as e:
+            # client should drop the token and start a new conversation
+            raise HTTPException(status_code=400, detail=f"Invalid context token: {e}")
+        incoming = ChatIn(message=incoming.message, context=ctx)
+    try:
+        out = await _run_turn(incoming, tenant, x_profile)
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "The assistant is busy, please try again shortly.", "reason": e.reason},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if context_tokens is not None:
+        token, public = _token_reply(out.context, tenant)
+        out = ChatOut(reply=out.reply, token=token, context=public)
+    return out
+
+@app.post("/identify", response_model=IdentifyOut)
+def identify(incoming: IdentifyIn, x_tenant: str | None = Header(default=None)):
+    # one atomic upsert per session start; later turns reuse the cached user_id
+    if get_kb(x_tenant) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {x_tenant}")
+    try:
+        ctx = _client_context(incoming.context, incoming.token, x_tenant)
+    except InvalidToken as e:
+        raise HTTPException(status_code=400, detail=f"Invalid context token: {e}")
+    try:
+        user, ctx = identify_api(incoming.email, incoming.name, ctx, tenant=x_tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if context_tokens is not None:
+        # the user travels in the token; /chat ignores a bare context naming one
+        token, public = _token_reply(ctx, x_tenant)
+        return IdentifyOut(user=user, context=public, token=token)
+    return IdentifyOut(user=user, context=ctx)
+
+@app.post("/chat", response_model=ChatOut)
+async def chat(incoming: ChatIn, x_tenant: str | None = Header(default=None),
+               x_profile: str | None = Header(default=None)):
+    return await _admitted_reply(incoming, x_tenant, x_profile)
+
+@app.post("/t/{tenant}/chat", response_model=ChatOut)
+async def tenant_chat(tenant: str, incoming: ChatIn, x_profile: str | None = Header(default=None)):
+    return await _admitted_reply(incoming, tenant, x_profile)
+
+async def _chat_session(ws: WebSocket, tenant: str | None):
+    """
+    One chat session per connection; the context never leaves the server.
+    Client → server (JSON):
+        {"message": "..."}                        a user turn
+        {"type": "hello", "context": {...}}       resume a saved context (e.g. after a page change);
+                                                  add "echo_context": true to get it back with each reply
+        {"type": "hello", "token": "..."}         resume from a /chat or /identify token (when tokens are
+                                                  on, a bare hello context is ignored)
+        {"type": "context"}                       ask for the current context (+ "token" when tokens are on)
+        {"type": "ping"} / {"type": "pong"}       keep-alive
+    Server → client:
+        {"type": "reply", "reply", "waiting_for", "end_session"}  (+ "context" if echoed)
+        {"type": "busy", "retry_after"}, {"type": "context", "context"}, {"type": "ping"},
+        {"type": "pong"}, {"type": "error", "detail"}
+    The server pings after WS_HEARTBEAT_S quiet seconds and closes the socket
+    after WS_IDLE_TIMEOUT_S without a client message, or once the session ends.
+    """
+    origin = ws.headers.get("origin")
+    if origin and origin not in ALLOWED_ORIGINS:
+        await ws.close(code=1008)   # policy violation: same origins as CORS
+        return
+    if get_kb(tenant) is None:
+        await ws.close(code=4404, reason=f"Unknown tenant: {tenant}")
+        return
+    await ws.accept()
+    ws_sessions["open"] += 1
+    ws_sessions["opened"] += 1
+    ctx: dict = {}
+    echo_context = False
+    last_seen = time.monotonic()
+    try:
+        while True:
+            try:
+                raw = await asyncio.wait_for(ws.receive_text(), timeout=WS_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_seen >= WS_IDLE_TIMEOUT_S:
+                    ws_sessions["idle_closed"] += 1
+                    await ws.close(code=1000, reason="idle timeout")
+                    return
+                await ws.send_json({"type": "ping"})
+                continue
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                await ws.send_json({"type": "error", "detail": "expected a JSON object"})
+                continue
+            kind = data.get("type", "message")
+            if kind not in ("ping", "pong"):   # keep-alives don't count as activity
+                last_seen = time.monotonic()
+            if kind == "ping":
+                await ws.send_json({"type": "pong"})
+            elif kind == "pong":
+                pass
+            elif kind == "hello":
+                token = data.get("token") if isinstance(data.get("token"), str) else None
+                if (token and context_tokens is not None) or isinstance(data.get("context"), dict):
+                    try:
+                        ctx = _client_context(data.get("context"), token, tenant)
+                    except InvalidToken as e:
+                        await ws.send_json({"type": "error", "detail": f"Invalid context token: {e}"})
+                        continue
+                echo_context = bool(data.get("echo_context"))
+            elif kind == "context":
+                msg = {"type": "context", "context": ctx}
+                if context_tokens is not None:
+                    msg["token"] = context_tokens.encode(ctx, get_kb(tenant).name)
+                await ws.send_json(msg)
+            elif kind == "message" and isinstance(data.get("message"), str):
+                try:
+                    out = await _run_turn(ChatIn(message=data["message"], context=ctx), tenant)
+                except Overloaded as e:
+                    await ws.send_json({"type": "busy", "reason": e.reason, "retry_after": e.retry_after})
+                    continue
+                ctx = out.context
+                msg = {"type": "reply", "reply": out.reply, "waiting_for": ctx.get("waiting_for"),
+                       "end_session": bool(ctx.get("end_session"))}
+                if echo_context:
+                    msg["context"] = ctx
+                await ws.send_json(msg)
+                if ctx.get("end_session"):
+                    await ws.close(code=1000, reason="session ended")
+                    return
+            else:
+                await ws.send_json({"type": "error", "detail": f"unsupported message: {kind!r}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_sessions["open"] -= 1
+
+@app.websocket("/ws")
+async def chat_ws(ws: WebSocket):
+    # tenant as a query parameter: browsers can't set headers on a WebSocket handshake
+    await _chat_session(ws, ws.query_params.get("tenant"))
+
+@app.websocket("/t/{tenant}/ws")
+async def tenant_chat_ws(ws: WebSocket, tenant: str):
+    await _chat_session(ws, tenant)
@@ -0,0 +1,67 @@
+"""
+Build step: compile faq_db_pattern into the on-disk rules artifact.
+
+Run this after editing rules (or as part of a deploy) so workers can load
+pre-lemmatized keywords straight from disk instead of running spaCy at boot:
+
+    python build_rules.py            # rebuild only if the table changed
+    python build_rules.py --force    # always rebuild
+    python build_rules.py --tenant storeA   # a storefront from KB_TENANTS
+
+It can also export the lemma lookup table used by preprocess_text, from the
+rule vocabulary plus any files of observed user inputs (one per line):
+
+    python build_rules.py --lemmas inputs.txt more_inputs.txt
+"""
+import argparse
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile faq_db_pattern into a rules artifact.")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the content hash is unchanged")
+    parser.add_argument("--tenant", default=None, help="knowledge base from KB_TENANTS (default: DB_FILE)")
+    parser.add_argument("--out", default=None, help="artifact path (default: the knowledge base's artifact)")
+    parser.add_argument("--lemmas", nargs="*", metavar="INPUTS",
+                        help="also export the lemma table from the rule vocabulary and these input files")
+    parser.add_argument("--lemma-out", default=bot.LEMMA_TABLE_FILE, help="lemma table path (default: %(default)s)")
+    args = parser.parse_args()
+
+    kb = bot.get_kb(args.tenant)
+    if kb is None:
+        parser.error(f"unknown tenant {args.tenant!r}; known: {', '.join(bot.list_tenants())}")
+    with bot.use_kb(kb):
+        build(args, args.out or kb.rules_artifact_file)
+
+
+def build(args, out: str):
+    if args.lemmas is not None:
+        export_lemmas(args.lemmas, args.lemma_out)
+
+    rows = bot._fetch_rule_rows()
+    source_hash = bot.rules_source_hash(rows)
+    current = bot.read_rules_artifact(out)
+    if not args.force and current and current.get("source_hash") == source_hash:
+        print(f"Rules artifact is up to date ({source_hash[:12]}): {out}")
+        return
+
+    artifact = bot.build_rules_artifact(rows)
+    for bad in artifact["invalid"]:
+        print(f"Invalid regex for intent '{bad['intent']}': {bad['pattern']!r} ({bad['error']})")
+    bot.write_rules_artifact(artifact, out)
+    print(f"Wrote {len(artifact['rules'])} rules ({source_hash[:12]}) to {out}")
+
+
+def export_lemmas(input_files: list[str], out: str):
+    texts = [pattern for _, type, pattern, _ in bot._fetch_rule_rows() if type == 'keyword']
+    for path in input_files:
+        with open(path, encoding="utf-8") as f:
+            texts.extend(line.strip() for line in f if line.strip())
+    table = bot.build_lemma_table(texts)
+    bot.save_lemma_table(out)
+    print(f"Wrote {len(table)} lemma entries from {len(texts)} texts to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Console driver for the chatbot engine.
+
+All console I/O lives here: prompts, the typing indicator and the "I'm done"
+shortcuts. The engine itself only maps (message, context) to (reply, context),
+so this file is a thin loop around generate_reply_api, the same call the API
+makes.
+
+    python chatbot_cli.py                          # chat in the terminal
+    python chatbot_cli.py --batch scripts.txt --email jane@example.com --out replies.jsonl
+
+`python FYP_chatbot_LEE_YEN_YEN.py` runs this driver too.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+# One-line, anchored regex so we only trigger when the whole input is an end cue.
+END_TRIGGER_RE = re.compile(
+    r"^\s*(?:"
+    r"quit|exit|bye|goodbye|"
+    r"ok(?:ay)?|can|done|got it|"
+    r"no more|nothing else|that(?:'|’)?s all|all good|i(?:'|’)?m good|im good|"
+    r"no thanks|no thank you|thanks"
+    r")\s*[.!?]*\s*$",
+    re.IGNORECASE
+)
+
+
+def capture_user_profile():
+    """
+    Ask for name and email in a single prompt like:
+    'Jane Doe jane@example.com'
+    Extracts the email via regex; uses the remaining text as name.
+    If the email exists in DB, keeps the stored name.
+    """
+    while True:
+        raw = input("Hi! please give me your name and email: ").strip()
+        m = re.search(bot.EMAIL_REGEX, raw)
+        if not m:
+            print("I couldn't find a valid email. Try again (e.g., Jane Doe jane@example.com).")
+            continue
+
+        email = m.group(0)
+        # Remove the email token from the input to get the name
+        name = raw.replace(email, "").strip(" ,;<>\"'")
+
+        if not name:
+            name = input("Got your email. What's your name? ").strip()
+            if not name:
+                print("Name can't be empty.")
+                continue
+
+        # Save to DB (insert if new, keep existing name if email found)
+        return bot.identify_user(email, name)
+
+
+def bot_send(response, min_delay=3, max_delay=5):
+    """Simulate bot thinking/typing, then print the response."""
+    delay = random.uniform(min_delay, max_delay)
+
+    # typing indicator
+    msg = "Bot is typing..."
+    sys.stdout.write(msg)
+    sys.stdout.flush()
+    t0 = time.time()
+    dot = 0
+    while time.time() - t0 < delay:
+        sys.stdout.write("." * ((dot % 3) + 1) + "\r" + msg + "   \r")
+        sys.stdout.flush()
+        time.sleep(0.4)
+        dot += 1
+
+    # clear the line and print the actual bot message
+    sys.stdout.write(" " * (len(msg) + 3) + "\r")
+    sys.stdout.flush()
+    print(f"Bot: {response}", flush=True)
+
+
+def chat(tenant: str | None = None):
+    """Interactive session in the terminal."""
+    with bot.use_kb(bot.get_kb(tenant)):
+        bot.setup_database()
+        bot.ensure_order_tables()
+        print("Database connection successful. Using existing data.")
+
+        # 🔹 Single-shot capture
+        user = capture_user_profile()
+
+    print("\n--- E-commerce Chatbot ---")
+    print("Bot: Hello! How can I assist you today?")
+
+    conversation_context = {"user": user}
+
+    while True:
+        try:
+            user_input = input("You: ")
+        except EOFError:
+            break
+        print(f"You: {user_input}", flush=True)
+        confirming = conversation_context.get('waiting_for') == 'confirm_end'
+
+        # 🔹 Treat many phrases as “I’m done”: confirm before actually ending
+        if not confirming and END_TRIGGER_RE.match(user_input):
+            response, conversation_context = bot.confirm_end_prompt(conversation_context)
+            bot_send(response, min_delay=0.8, max_delay=1.2)
+            continue
+
+        # Normal turn (or the yes/no answer to the confirmation)
+        response, conversation_context = bot.generate_reply_api(user_input, conversation_context, tenant=tenant)
+        if confirming:
+            bot_send(response, min_delay=0.8, max_delay=1.2)
+        else:
+            bot_send(response, min_delay=3, max_delay=5)
+
+        # 🔹 If any branch set end_session, confirm before ending
+        if conversation_context.get('end_session'):
+            if confirming:
+                break
+            response, conversation_context = bot.confirm_end_prompt(conversation_context)
+            bot_send(response, min_delay=0.8, max_delay=1.2)
+
+
+def read_scripts(path: str):
+    """
+    Yield (id, messages, context) conversations from a script file ('-' = stdin).
+    JSON lines (first line starts with '{'): one {"id", "messages": [...], "context": {...}} per line;
+    malformed lines are reported on stderr with their line number and skipped.
+    Plain text: one user message per line, conversations separated by a blank line.
+    """
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    name = "stdin" if path == "-" else os.path.basename(path)
+    try:
+        lines = f.read().splitlines()
+        if next((l for l in lines if l.strip()), "").lstrip().startswith("{"):
+            for n, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"{name}: line {n}: skipped, {e}", file=sys.stderr)
+                    continue
+                messages = item.get("messages") if isinstance(item, dict) else None
+                if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+                    print(f'{name}: line {n}: skipped, expected an object with a "messages" list of strings',
+                          file=sys.stderr)
+                    continue
+                yield item.get("id", f"{name}:{n}"), messages, item.get("context") or {}
+            return
+        messages, start = [], 1
+        for n, line in enumerate(lines, 1):
+            if line.strip():
+                messages.append(line.strip())
+            elif messages:
+                yield f"{name}:{start}", messages, {}
+                messages = []
+            if not messages:
+                start = n + 1
+        if messages:
+            yield f"{name}:{start}", messages, {}
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch(paths: list[str], out, user: dict | None = None, tenant: str | None = None) -> dict:
+    """
+    Replay conversation scripts through the engine with no typing delays.
+    Writes one JSON line per conversation (turns + final context).
+    A conversation stops early once the engine sets end_session.
+    """
+    conversations = turns = 0
+    t0 = time.perf_counter()
+    for path in paths:
+        for conv_id, messages, context in read_scripts(path):
+            ctx = dict(context)
+            if user and not ctx.get('user'):
+                ctx['user'] = dict(user)
+            transcript = []
+            for message in messages:
+                reply, ctx = bot.generate_reply_api(message, ctx, tenant=tenant)
+                transcript.append({"user": message, "reply": reply, "waiting_for": ctx.get('waiting_for')})
+                if ctx.get('end_session'):
+                    break
+            out.write(json.dumps({"id": conv_id, "turns": transcript, "context": ctx}, ensure_ascii=False) + "\n")
+            conversations += 1
+            turns += len(transcript)
+    elapsed = time.perf_counter() - t0
+    return {"conversations": conversations, "turns": turns, "seconds": elapsed,
+            "turns_per_sec": turns / elapsed if elapsed > 0 else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="E-commerce chatbot (interactive, or headless with --batch).")
+    parser.add_argument("--batch", nargs="+", metavar="SCRIPT",
+                        help="replay conversation scripts ('-' for stdin) and write JSON lines instead of chatting")
+    parser.add_argument("--out", default="-", help="JSON lines output for --batch (default: stdout)")
+    parser.add_argument("--name", default="", help="user name for --batch conversations")
+    parser.add_argument("--email", default="", help="user email for --batch conversations")
+    parser.add_argument("--tenant", default=None, help="knowledge base from KB_TENANTS (default: DB_FILE)")
+    args = parser.parse_args()
+
+    if bot.get_kb(args.tenant) is None:
+        parser.error(f"unknown tenant {args.tenant!r}; known: {', '.join(bot.list_tenants())}")
+    if args.batch is None:
+        try:
+            chat(args.tenant)
+        except RuntimeError as e:
+            sys.exit(f"Error: {e}")
+        return
+
+    user = {"name": args.name, "email": args.email} if (args.name or args.email) else None
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        stats = run_batch(args.batch, out, user=user, tenant=args.tenant)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Replayed {stats['conversations']} conversations, {stats['turns']} turns "
+          f"in {stats['seconds']:.2f}s ({stats['turns_per_sec']:.0f} turns/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Append-only structured conversation log.
+
+One JSON object per turn, written by a background thread so the request only
+pays for a queue append. Files rotate by size (conversations.jsonl,
+conversations.jsonl.1, ... .N, oldest last). If the writer falls behind, the
+queue is bounded and new records are dropped and counted, not blocked on.
+
+Record fields (see generate_reply_api):
+    ts, tenant, sid, message_chars, waiting_for_before, waiting_for_after, state,
+    intent, entity, scores [[intent, score], ...], cached, and *_ms stage latencies;
+    plus message (the text, email addresses masked) with CONVERSATION_LOG_MESSAGES=1,
+    except for replies to the email and feedback prompts, which are never logged
+
+Configuration (environment):
+    CONVERSATION_LOG_FILE       log path; logging is off when unset
+    CONVERSATION_LOG_MAX_BYTES  rotate after this size (default 50 MB)
+    CONVERSATION_LOG_BACKUPS    rotated files to keep (default 5)
+    CONVERSATION_LOG_MESSAGES   1 = also log message text (default 0: length only)
+
+Offline analysis:
+    python convlog.py conversations.jsonl             # per-intent/state counts and latency
+    python convlog.py conversations.jsonl --slowest 20
+"""
+import json
+import os
+import threading
+from collections import deque
+
+
+class ConversationLog:
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5,
+                 flush_interval: float = 1.0, max_pending: int = 10000, messages: bool = False):
+        self.path = path
+        self.messages = messages
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="conversation-log", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> "ConversationLog | None":
+        path = os.getenv("CONVERSATION_LOG_FILE", "")
+        if not path:
+            return None
+        return cls(path,
+                   max_bytes=int(os.getenv("CONVERSATION_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+                   backups=int(os.getenv("CONVERSATION_LOG_BACKUPS", "5")),
+                   messages=os.getenv("CONVERSATION_LOG_MESSAGES", "0") == "1")
+
+    def write(self, record: dict):
+        """Queue a record; never blocks and never raises."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(record)
+        if len(self._pending) >= 256:
+            self._wake.set()
+
+    def close(self, timeout: float = 5.0):
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a", encoding="utf-8", buffering=1024 * 1024)
+        size = f.tell()
+        try:
+            while True:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                closing = self._closed
+                while self._pending:
+                    line = json.dumps(self._pending.popleft(), ensure_ascii=False, default=str) + "\n"
+                    f.write(line)
+                    size += len(line.encode("utf-8"))
+                    self.written += 1
+                    if size >= self.max_bytes:
+                        f.close()
+                        self._rotate()
+                        f = open(self.path, "a", encoding="utf-8", buffering=1024 * 1024)
+                        size = 0
+                f.flush()
+                if closing:
+                    return
+        finally:
+            f.close()
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def stats(self) -> dict:
+        return {"written": self.written, "pending": len(self._pending), "dropped": self.dropped}
+
+
+def read_log(path: str, include_rotated: bool = True):
+    """Yield records oldest first, across rotated files; unparseable lines are skipped."""
+    paths = [path]
+    if include_rotated:
+        i = 1
+        while os.path.exists(f"{path}.{i}"):
+            paths.insert(0, f"{path}.{i}")
+            i += 1
+    for p in paths:
+        try:
+            with open(p, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a conversation log.")
+    parser.add_argument("log", help="conversation log path (rotated files are read too)")
+    parser.add_argument("--slowest", type=int, default=10, metavar="N", help="also list the N slowest turns")
+    args = parser.parse_args()
+
+    by_key: dict[str, list[float]] = {}
+    slow = []
+    sessions = set()
+    for r in read_log(args.log):
+        key = f"state:{r['state']}" if r.get("state") else f"intent:{r.get('intent')}"
+        by_key.setdefault(key, []).append(r.get("total_ms") or 0.0)
+        slow.append((r.get("total_ms") or 0.0, key, r.get("message") or f"<{r.get('message_chars', '?')} chars>"))
+        sessions.add(r.get("sid"))
+    turns = sum(len(v) for v in by_key.values())
+    print(f"{turns} turns, {len(sessions)} sessions")
+    print(f"{'intent/state':<36} {'turns':>7} {'p50ms':>8} {'p95ms':>8} {'maxms':>8}")
+    for key, lat in sorted(by_key.items(), key=lambda kv: -len(kv[1])):
+        print(f"{key:<36} {len(lat):>7} {_percentile(lat, 50):>8.1f} {_percentile(lat, 95):>8.1f} {max(lat):>8.1f}")
+    if args.slowest:
+        print(f"\nSlowest {args.slowest} turns:")
+        for ms, key, message in sorted(slow, key=lambda t: t[0], reverse=True)[:args.slowest]:
+            print(f"  {ms:8.1f} ms  {key:<30} {message!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Compact, signed dialogue-state tokens for stateless HTTP clients.
+
+Instead of echoing the JSON `context` back and forth, /chat can hand the
+client one opaque string: the context packed into a small binary record,
+zlib-compressed when that makes it shorter, and signed with HMAC-SHA256.
+The server keeps nothing per session, and a client can't edit the order or
+product ids it is allowed to pick from (the token is signed, not encrypted:
+don't put anything in the context the user may not see).
+
+Token layout (base64url, no padding):
+    version u8 | flags u8 | issued_at u32 | body | mac[16]
+    body = u16 bitmap of present FIELDS, then each present field in order;
+           ints are varints, strings are varint-length UTF-8, id lists are
+           a varint count plus varints. Keys or values outside FIELDS travel
+           in a trailing compact-JSON field, so any context round-trips.
+The MAC also covers the tenant name: a token only opens on the storefront
+that issued it.
+
+Configuration (environment):
+    CONTEXT_TOKEN_SECRET   signing key; tokens are off when unset
+    CONTEXT_TOKEN_TTL      seconds a token stays valid (default 86400, 0 = no expiry)
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import struct
+import time
+import zlib
+
+VERSION = 1
+MAC_BYTES = 16
+MAX_TOKEN_CHARS = 16384          # reject before decoding anything
+MAX_BODY_BYTES = 64 * 1024       # decompression limit
+COMPRESS_MIN_BYTES = 96          # shorter bodies rarely shrink
+
+_HEADER = struct.Struct("<BBI")  # version, flags, issued_at
+_FLAG_ZLIB = 0x01
+
+# waiting_for values stored as one byte. Append only: tokens store the index.
+STATES = (
+    "feedback_choice", "feedback_other_pending", "choose_product_section", "choose_product_item",
+    "confirm_end", "provide_email", "fallback_menu_choice", "choose_order_to_track",
+)
+_STATE_INDEX = {s: i for i, s in enumerate(STATES)}
+_OTHER_STATE = 0xFF
+
+# Packed context keys and their encodings. Append only, before the JSON field.
+FIELDS = (
+    ("waiting_for", "state"),
+    ("user", "user"),
+    ("product_choice_ids", "ids"),
+    ("order_choice_ids", "ids"),
+    ("last_results", "ids"),
+    ("pending_order_number", "str"),
+    ("menu_state", "str"),
+    ("last_choice", "int"),
+    ("end_session", "bool"),
+    ("sid", "str"),
+)
+_EXTRA_BIT = 1 << 15
+_USER_FIELDS = (("user_id", "int"), ("name", "str"), ("email", "str"))
+
+
+class InvalidToken(ValueError):
+    """Raised for tokens that are malformed, tampered with, expired or from another tenant."""
+
+
+def _fits(kind: str, value) -> bool:
+    if kind in ("str", "state"):
+        return isinstance(value, str)
+    if kind == "int":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "bool":
+        return isinstance(value, bool)
+    if kind == "ids":
+        return isinstance(value, list) and all(
+            isinstance(v, int) and not isinstance(v, bool) and v >= 0 for v in value)
+    if kind == "user":
+        return isinstance(value, dict) and all(
+            any(k == name and _fits(sub, v) for name, sub in _USER_FIELDS) for k, v in value.items())
+    return False
+
+
+def _put_uint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _put_str(out: bytearray, s: str):
+    data = s.encode("utf-8")
+    _put_uint(out, len(data))
+    out += data
+
+
+def _put(out: bytearray, kind: str, value):
+    if kind == "str":
+        _put_str(out, value)
+    elif kind == "int":
+        _put_uint(out, value << 1 if value >= 0 else (-value << 1) - 1)   # zigzag
+    elif kind == "bool":
+        out.append(1 if value else 0)
+    elif kind == "ids":
+        _put_uint(out, len(value))
+        for v in value:
+            _put_uint(out, v)
+    elif kind == "state":
+        index = _STATE_INDEX.get(value, _OTHER_STATE)
+        out.append(index)
+        if index == _OTHER_STATE:
+            _put_str(out, value)
+    elif kind == "user":
+        bits = 0
+        for i, (name, _) in enumerate(_USER_FIELDS):
+            if name in value:
+                bits |= 1 << i
+        out.append(bits)
+        for name, sub in _USER_FIELDS:
+            if name in value:
+                _put(out, sub, value[name])
+
+
+def pack(ctx: dict) -> bytes:
+    """Binary body for `ctx` (no header, compression or signature)."""
+    bits = 0
+    out = bytearray(2)
+    packed = set()
+    for i, (key, kind) in enumerate(FIELDS):
+        if key in ctx and _fits(kind, ctx[key]):
+            bits |= 1 << i
+            packed.add(key)
+            _put(out, kind, ctx[key])
+    extra = {k: v for k, v in ctx.items() if k not in packed}
+    if extra:
+        bits |= _EXTRA_BIT
+        _put_str(out, json.dumps(extra, separators=(",", ":"), ensure_ascii=False))
+    struct.pack_into("<H", out, 0, bits)
+    return bytes(out)
+
+
+class _Reader:
+    """Cursor over a memoryview; strings are the only values copied out."""
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, buf: memoryview):
+        self.buf = buf
+        self.pos = 0
+
+    def uint(self) -> int:
+        buf, pos, n, shift = self.buf, self.pos, 0, 0
+        while True:
+            b = buf[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                self.pos = pos
+                return n
+            shift += 7
+            if shift > 63:
+                raise InvalidToken("varint too long")
+
+    def text(self) -> str:
+        n = self.uint()
+        end = self.pos + n
+        if end > len(self.buf):
+            raise InvalidToken("truncated string")
+        s = str(self.buf[self.pos:end], "utf-8")
+        self.pos = end
+        return s
+
+    def read(self, kind: str):
+        if kind == "str":
+            return self.text()
+        if kind == "int":
+            n = self.uint()
+            return (n >> 1) ^ -(n & 1)
+        if kind == "bool":
+            self.pos += 1
+            return self.buf[self.pos - 1] != 0
+        if kind == "ids":
+            return [self.uint() for _ in range(self.uint())]
+        if kind == "state":
+            self.pos += 1
+            index = self.buf[self.pos - 1]
+            if index == _OTHER_STATE:
+                return self.text()
+            if index >= len(STATES):
+                raise InvalidToken("unknown state")
+            return STATES[index]
+        if kind == "user":
+            self.pos += 1
+            bits = self.buf[self.pos - 1]
+            return {name: self.read(sub) for i, (name, sub) in enumerate(_USER_FIELDS) if bits >> i & 1}
+        raise InvalidToken(f"unknown field kind {kind!r}")
+
+
+def unpack(body: bytes | memoryview) -> dict:
+    """Inverse of pack(); raises InvalidToken on malformed input."""
+    r = _Reader(memoryview(body))
+    try:
+        (bits,) = struct.unpack_from("<H", r.buf, 0)
+        r.pos = 2
+        ctx = {key: r.read(kind) for i, (key, kind) in enumerate(FIELDS) if bits >> i & 1}
+        if bits & _EXTRA_BIT:
+            extra = json.loads(r.text())
+            if not isinstance(extra, dict):
+                raise InvalidToken("extra fields are not an object")
+            ctx.update(extra)
+    except InvalidToken:
+        raise
+    except (IndexError, struct.error, ValueError) as e:
+        raise InvalidToken(f"malformed body: {e}") from None
+    if r.pos != len(r.buf):
+        raise InvalidToken("trailing bytes")
+    return ctx
+
+
+class ContextTokens:
+    def __init__(self, secret: str | bytes, ttl: float = 86400.0):
+        self._key = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self.issued = 0
+        self.opened = 0
+        self.rejected = 0
+        self.issued_chars = 0
+
+    @classmethod
+    def from_env(cls) -> "ContextTokens | None":
+        secret = os.getenv("CONTEXT_TOKEN_SECRET", "")
+        if not secret:
+            return None
+        return cls(secret, ttl=float(os.getenv("CONTEXT_TOKEN_TTL", "86400")))
+
+    def _mac(self, tenant: str, signed: bytes | memoryview) -> bytes:
+        mac = hmac.new(self._key, tenant.encode("utf-8") + b"\0", hashlib.sha256)
+        mac.update(signed)
+        return mac.digest()[:MAC_BYTES]
+
+    def encode(self, ctx: dict, tenant: str = "") -> str:
+        """Sign `ctx` for `tenant` and return it as a URL-safe token."""
+        body = pack(ctx)
+        flags = 0
+        if len(body) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(body, 6)
+            if len(packed) < len(body):
+                body, flags = packed, _FLAG_ZLIB
+        signed = _HEADER.pack(VERSION, flags, int(time.time()) & 0xFFFFFFFF) + body
+        token = base64.urlsafe_b64encode(signed + self._mac(tenant, signed)).rstrip(b"=").decode("ascii")
+        self.issued += 1
+        self.issued_chars += len(token)
+        return token
+
+    def decode(self, token: str, tenant: str = "") -> dict:
+        """Verify and unpack a token from encode(); raises InvalidToken."""
+        try:
+            ctx = self._open(token, tenant)
+        except InvalidToken:
+            self.rejected += 1
+            raise
+        self.opened += 1
+        return ctx
+
+    def _open(self, token: str, tenant: str) -> dict:
+        if not isinstance(token, str) or len(token) > MAX_TOKEN_CHARS:
+            raise InvalidToken("token too long")
+        try:
+            raw = memoryview(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        except (ValueError, TypeError):
+            raise InvalidToken("not base64url") from None
+        if len(raw) < _HEADER.size + 2 + MAC_BYTES:
+            raise InvalidToken("token too short")
+        signed, mac = raw[:-MAC_BYTES], raw[-MAC_BYTES:]
+        if not hmac.compare_digest(self._mac(tenant, signed), mac):
+            raise InvalidToken("bad signature")
+        version, flags, issued_at = _HEADER.unpack_from(signed, 0)
+        if version != VERSION:
+            raise InvalidToken(f"unsupported version {version}")
+        if self.ttl > 0 and time.time() - issued_at > self.ttl:
+            raise InvalidToken("token expired")
+        body = signed[_HEADER.size:]
+        if flags & _FLAG_ZLIB:
+            d = zlib.decompressobj()
+            try:
+                body = d.decompress(body, MAX_BODY_BYTES)
+            except zlib.error:
+                raise InvalidToken("bad compression") from None
+            if d.unconsumed_tail or not d.eof:
+                raise InvalidToken("body too large")
+        return unpack(body)
+
+    def stats(self) -> dict:
+        return {"issued": self.issued, "opened": self.opened, "rejected": self.rejected,
+                "avg_chars": round(self.issued_chars / self.issued, 1) if self.issued else 0.0}
@@ -0,0 +1,167 @@
+"""
+Offline intent evaluation: accuracy and throughput of get_intent.
+
+Runs a labeled utterance file through get_intent across several processes and
+reports intent accuracy, entity accuracy, the most common confusions and
+utterances/sec. Use it before shipping edits to faq_db_pattern:
+
+    python eval_intents.py labeled.csv
+    python eval_intents.py labeled.csv --save-baseline data/intent_baseline.json
+    python eval_intents.py labeled.csv --baseline data/intent_baseline.json --max-regression 0.2
+
+Input formats (chosen by extension):
+    .csv / .tsv   columns text, intent, entity (header row required; entity may be empty)
+    .jsonl        {"text": ..., "intent": ..., "entity": ...} per line
+
+Exits with status 1 when throughput falls more than --max-regression below the
+baseline, or accuracy falls more than --accuracy-tolerance below it.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+_worker_kb = None
+
+
+def load_labeled(path: str) -> list[tuple[str, str, str | None]]:
+    rows = []
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    rows.append((item["text"], item["intent"], item.get("entity") or None))
+        return rows
+    delimiter = "\t" if path.endswith(".tsv") else ","
+    with open(path, encoding="utf-8", newline="") as f:
+        for item in csv.DictReader(f, delimiter=delimiter):
+            rows.append((item["text"], item["intent"].strip(), (item.get("entity") or "").strip() or None))
+    return rows
+
+
+def _init_worker(tenant: str | None):
+    # load rules and spaCy before the clock starts on the first chunk
+    global _worker_kb
+    _worker_kb = bot.get_kb(tenant)
+    bot.INTENT_CACHE_MAX_LEN = -1   # time rule matching, not intent-cache hits on --repeat
+    with bot.use_kb(_worker_kb):
+        bot.get_rules()
+        bot.get_intent("hello")
+
+
+def _classify(texts: list[str]) -> tuple[list[tuple[str, str | None]], float, float]:
+    with bot.use_kb(_worker_kb):
+        start = time.time()
+        results = [bot.get_intent(text) for text in texts]
+        return results, start, time.time()
+
+
+def evaluate(rows, processes: int, chunk_size: int, tenant: str | None) -> dict:
+    texts = [text for text, _, _ in rows]
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(tenant,)) as pool:
+        outputs = pool.map(_classify, chunks, chunksize=1)
+
+    predictions = [p for results, _, _ in outputs for p in results]
+    # wall time from the first chunk starting to the last one finishing (pool start-up excluded)
+    elapsed = max(end for _, _, end in outputs) - min(start for _, start, _ in outputs)
+
+    correct = entity_total = entity_correct = 0
+    confusion = Counter()
+    errors = []
+    for (text, expected, expected_entity), (intent, entity) in zip(rows, predictions):
+        if intent == expected:
+            correct += 1
+        else:
+            confusion[(expected, intent)] += 1
+            errors.append((text, expected, intent))
+        if expected_entity is not None:
+            entity_total += 1
+            entity_correct += str(entity) == expected_entity
+    return {
+        "utterances": len(rows),
+        "accuracy": correct / len(rows) if rows else 0.0,
+        "entity_accuracy": entity_correct / entity_total if entity_total else None,
+        "utterances_per_sec": len(rows) / elapsed if elapsed > 0 else float("inf"),
+        "processes": processes,
+        "confusion": confusion,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate get_intent accuracy and throughput on labeled utterances.")
+    parser.add_argument("labeled", help="labeled utterances (.csv, .tsv or .jsonl)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes (default: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="utterances per task (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="run the file this many times for steadier timing")
+    parser.add_argument("--tenant", default=None, help="knowledge base from KB_TENANTS (default: DB_FILE)")
+    parser.add_argument("--show-errors", type=int, default=10, metavar="N", help="print the first N misclassified utterances")
+    parser.add_argument("--baseline", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed throughput drop vs. baseline, as a fraction (default: %(default)s)")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0,
+                        help="allowed accuracy drop vs. baseline (default: %(default)s)")
+    parser.add_argument("--save-baseline", default=None, metavar="PATH", help="write this run as the new baseline")
+    args = parser.parse_args()
+
+    if bot.get_kb(args.tenant) is None:
+        parser.error(f"unknown tenant {args.tenant!r}; known: {', '.join(bot.list_tenants())}")
+    rows = load_labeled(args.labeled)
+    if not rows:
+        parser.error(f"no labeled utterances in {args.labeled}")
+    report = evaluate(rows * args.repeat, args.processes, args.chunk_size, args.tenant)
+
+    print(f"Utterances:       {report['utterances']} ({args.processes} processes)")
+    print(f"Intent accuracy:  {report['accuracy']:.2%}")
+    if report["entity_accuracy"] is not None:
+        print(f"Entity accuracy:  {report['entity_accuracy']:.2%}")
+    print(f"Throughput:       {report['utterances_per_sec']:.1f} utterances/sec")
+    if report["confusion"]:
+        print("\nMost common confusions (expected → predicted):")
+        for (expected, got), n in report["confusion"].most_common(10):
+            print(f"  {expected:>20} → {got:<20} {n}")
+    if args.show_errors and report["errors"]:
+        print(f"\nFirst {min(args.show_errors, len(report['errors']))} errors:")
+        seen = set()
+        for text, expected, got in report["errors"]:
+            if text in seen:
+                continue
+            seen.add(text)
+            print(f"  {text!r}: expected {expected}, got {got}")
+            if len(seen) >= args.show_errors:
+                break
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        floor = baseline["utterances_per_sec"] * (1 - args.max_regression)
+        if report["utterances_per_sec"] < floor:
+            print(f"\nFAIL: throughput {report['utterances_per_sec']:.1f}/s is below {floor:.1f}/s "
+                  f"(baseline {baseline['utterances_per_sec']:.1f}/s - {args.max_regression:.0%})")
+            failed = True
+        if report["accuracy"] < baseline["accuracy"] - args.accuracy_tolerance:
+            print(f"\nFAIL: accuracy {report['accuracy']:.2%} is below baseline {baseline['accuracy']:.2%}")
+            failed = True
+        if baseline.get("processes") != args.processes:
+            print(f"\nNote: baseline was measured with {baseline.get('processes')} processes.")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({k: report[k] for k in ("utterances", "accuracy", "entity_accuracy",
+                                              "utterances_per_sec", "processes")}, f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Bulk product import: upsert faq_db_products rows by sku.
+
+Meant for nightly price/stock syncs. Rows are written with executemany in
+chunked transactions (CATALOG_IMPORT_CHUNK rows each), unchanged rows are
+skipped, and only the products that changed are refreshed in this process's
+catalog snapshot. Running API workers pick the changes up on their next
+CATALOG_REFRESH_INTERVAL reload (POST /admin/catalog refreshes the worker that
+serves it immediately).
+
+    python import_catalog.py prices.csv
+    python import_catalog.py stock.jsonl --tenant storeA
+    cat updates.jsonl | python import_catalog.py -
+
+Input: CSV with a header row of faq_db_products column names, or JSON lines.
+`sku` is required; columns that are left out keep their current values.
+"""
+import argparse
+import sys
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upsert products into faq_db_products by sku.")
+    parser.add_argument("updates", help="CSV or JSON lines file ('-' = stdin)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None,
+                        help="input format (default: JSON lines if the first line starts with '{', else CSV)")
+    parser.add_argument("--tenant", default=None, help="knowledge base from KB_TENANTS (default: DB_FILE)")
+    parser.add_argument("--chunk-size", type=int, default=bot.CATALOG_IMPORT_CHUNK,
+                        help="rows per transaction (default: %(default)s)")
+    args = parser.parse_args()
+
+    kb = bot.get_kb(args.tenant)
+    if kb is None:
+        parser.error(f"unknown tenant {args.tenant!r}; known: {', '.join(bot.list_tenants())}")
+    if args.updates == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.updates, encoding="utf-8-sig") as f:
+            text = f.read()
+    try:
+        rows = bot.parse_product_updates(text, args.format)
+        with bot.use_kb(kb):
+            report = bot.upsert_products(rows, args.chunk_size)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(f"Import failed: {e}")
+    print(f"{report['rows']} products: {report['written']} written, {report['unchanged']} unchanged, "
+          f"{report['chunks']} transaction(s) in {report['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Bulk rule import: add or replace intents in faq_db_pattern and faq_db.
+
+Every regex is compiled before anything is written, and the whole file is
+applied in one transaction. Only intents whose patterns actually changed are
+lemmatized and recompiled into the rules artifact, so running workers reload
+them on their next RULES_CHECK_INTERVAL check without running spaCy
+(POST /admin/rules also updates the serving worker's matcher at once).
+
+    python import_rules.py rules.csv
+    python import_rules.py rules.jsonl --tenant storeA
+    python import_rules.py rules.csv --check      # validate only
+
+Input: CSV with columns intent, type, pattern, weight, answer, or JSON lines
+with the same keys. An intent listed with patterns gets exactly those
+patterns; an answer replaces the intent's faq_db answer.
+"""
+import argparse
+import sys
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import rules and answers into faq_db_pattern / faq_db.")
+    parser.add_argument("rules", help="CSV or JSON lines file ('-' = stdin)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None,
+                        help="input format (default: JSON lines if the first line starts with '{', else CSV)")
+    parser.add_argument("--tenant", default=None, help="knowledge base from KB_TENANTS (default: DB_FILE)")
+    parser.add_argument("--check", action="store_true", help="validate the file without writing anything")
+    args = parser.parse_args()
+
+    kb = bot.get_kb(args.tenant)
+    if kb is None:
+        parser.error(f"unknown tenant {args.tenant!r}; known: {', '.join(bot.list_tenants())}")
+    if args.rules == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.rules, encoding="utf-8-sig") as f:
+            text = f.read()
+    try:
+        rows = bot.parse_rule_updates(text, args.format)
+        if args.check:
+            print(f"{len(rows)} rows OK ({len({r['intent'] for r in rows})} intents)")
+            return
+        with bot.use_kb(kb):
+            report = bot.import_rules(rows)
+    except (ValueError, RuntimeError) as e:
+        sys.exit(f"Import failed: {e}")
+    print(f"{report['intents']} intents: {report['patterns_changed']} with new patterns, "
+          f"{report['answers_changed']} with new answers"
+          f"{' (full artifact rebuild)' if report['rebuilt'] else ''} in {report['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Load generator for the chatbot API.
+
+Spins up concurrent async clients against a running `app:app`, each replaying
+realistic multi-turn conversations and carrying state the way
+docs/chat/chat.js does: the signed `token` when the API hands one out
+(CONTEXT_TOKEN_SECRET set), the plain `context` otherwise. A rejected request
+(e.g. an expired token) starts a new conversation. Concurrency is stepped up
+and each step reports sustained requests/sec, error rate and latency
+percentiles, so you can see where a single worker saturates.
+
+    uvicorn app:app --port 8000 --workers 1      # in another terminal
+    python loadgen.py --steps 1,2,4,8,16,32 --duration 15
+
+    python loadgen.py --spawn                     # start a one-worker server itself
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+try:
+    import httpx
+except ImportError:  # optional tooling dependency
+    httpx = None
+
+# Each script is a list of user messages; "{email}" is filled per client.
+SCRIPTS = {
+    # browse → item detail
+    "browse": ["I want to browse products", "1", "1"],
+    # email → order pick
+    "track": ["where is my order", "{email}", "1"],
+    # fallback menu → feedback
+    "fallback_feedback": ["asdf qwerty", "3", "thanks", "1"],
+}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class StepResult:
+    def __init__(self):
+        self.latencies_ms: list[float] = []
+        self.errors = 0
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies_ms) + self.errors
+
+
+async def run_client(client, url: str, email: str, scripts: list[str], stop_at: float,
+                     record_from: float, result: StepResult):
+    rng = random.Random()
+    while time.perf_counter() < stop_at:
+        ctx, token = {}, None  # a fresh chat widget session
+        for message in SCRIPTS[rng.choice(scripts)]:
+            if time.perf_counter() >= stop_at:
+                return
+            t0 = time.perf_counter()
+            try:
+                body = {"message": message.format(email=email)}
+                if token:
+                    body["token"] = token
+                else:
+                    body["context"] = ctx
+                res = await client.post(url, json=body)
+                ok = res.status_code == 200
+                data = res.json() if ok else {}
+            except (httpx.HTTPError, ValueError):
+                ok, data = False, {}
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            if t0 >= record_from:  # ignore the ramp-up window
+                if ok:
+                    result.latencies_ms.append(elapsed_ms)
+                else:
+                    result.errors += 1
+            if not ok:
+                break  # start a new conversation, like a user reloading the page
+            # keep / persist context and token, as chat.js does
+            ctx = data.get("context") or {}
+            token = data.get("token") or None
+            if ctx.get("end_session"):
+                break
+
+
+async def run_step(base_url: str, concurrency: int, duration: float, ramp: float,
+                   emails: list[str], scripts: list[str], timeout: float) -> StepResult:
+    result = StepResult()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        record_from = start + ramp
+        stop_at = record_from + duration
+        await asyncio.gather(*[
+            run_client(client, base_url + "/chat", emails[i % len(emails)], scripts, stop_at, record_from, result)
+            for i in range(concurrency)
+        ])
+    return result
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Start a single uvicorn worker serving app:app from this folder."""
+    try:
+        httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+        sys.exit(f"Port {port} is already serving something; stop it or pick another --port.")
+    except httpx.HTTPError:
+        pass
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", "1", "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            sys.exit(f"uvicorn exited with code {proc.returncode}")
+        time.sleep(0.5)
+    proc.terminate()
+    sys.exit("Timed out waiting for the server to start.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stepped-concurrency load test for POST /chat.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="API base URL (default: %(default)s)")
+    parser.add_argument("--steps", default="1,2,4,8,16,32", help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per step")
+    parser.add_argument("--ramp", type=float, default=2.0, help="unmeasured warm-up seconds per step")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS), help="scripts to replay: " + ", ".join(SCRIPTS))
+    parser.add_argument("--emails", default="jane@example.com", help="comma-separated emails for the track script")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--spawn", action="store_true", help="start a one-worker uvicorn on --port first")
+    parser.add_argument("--port", type=int, default=8765, help="port for --spawn (default: %(default)s)")
+    args = parser.parse_args()
+
+    if httpx is None:
+        sys.exit("loadgen needs httpx: pip install httpx")
+    scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = [s for s in scripts if s not in SCRIPTS]
+    if unknown:
+        sys.exit(f"Unknown script(s): {', '.join(unknown)}")
+    steps = [int(n) for n in args.steps.split(",")]
+    emails = [e.strip() for e in args.emails.split(",") if e.strip()]
+
+    server = None
+    base_url = args.url.rstrip("/")
+    if args.spawn:
+        server = spawn_server(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'clients':>7} {'reqs':>7} {'req/s':>8} {'err%':>6} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'maxms':>8}")
+    best_rps, prev_n, saturated_at = 0.0, None, None
+    try:
+        for n in steps:
+            r = asyncio.run(run_step(base_url, n, args.duration, args.ramp, emails, scripts, args.timeout))
+            lat = sorted(r.latencies_ms)
+            rps = len(lat) / args.duration
+            err = 100.0 * r.errors / r.requests if r.requests else 0.0
+            print(f"{n:>7} {r.requests:>7} {rps:>8.1f} {err:>6.1f} {percentile(lat, 50):>8.1f} "
+                  f"{percentile(lat, 90):>8.1f} {percentile(lat, 99):>8.1f} {(lat[-1] if lat else 0):>8.1f}",
+                  flush=True)
+            # saturation: throughput stops growing (<5%) while clients keep increasing
+            if saturated_at is None and best_rps and rps < best_rps * 1.05:
+                saturated_at = (prev_n, n)
+            best_rps, prev_n = max(best_rps, rps), n
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"\nPeak throughput: {best_rps:.1f} req/s")
+    if saturated_at is not None:
+        print(f"Throughput stopped scaling between {saturated_at[0]} and {saturated_at[1]} concurrent clients.")
+
+
+if __name__ == "__main__":
+    main()
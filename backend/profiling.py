@@ -0,0 +1,133 @@
+"""
+On-demand sampling profiler for chat turns.
+
+A profiled turn registers its worker thread with a background sampler that
+reads the thread's stack every PROFILE_INTERVAL_MS via sys._current_frames().
+Samples are aggregated per intent/state label and can be downloaded in the
+folded-stack format understood by flamegraph.pl and speedscope.
+
+Turns are profiled when either
+  * PROFILE_SAMPLE_RATE > 0 and the request is randomly selected, or
+  * the request carries `X-Profile: <ADMIN_TOKEN>`.
+With both unset, `wants()` is a single attribute check and nothing else runs.
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _Target:
+    __slots__ = ("samples", "label")
+
+    def __init__(self):
+        self.samples = Counter()
+        self.label = "unlabelled"
+
+
+class Profiler:
+    def __init__(self, sample_rate: float = 0.0, interval_s: float = 0.005, admin_token: str = ""):
+        self.sample_rate = sample_rate
+        self.interval_s = interval_s
+        self.admin_token = admin_token
+        self.enabled = sample_rate > 0 or bool(admin_token)
+        self._targets: dict[int, _Target] = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stacks = Counter()          # (label, frame, frame, ...) → samples
+        self._requests = Counter()        # label → profiled turns
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        return cls(
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            interval_s=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            admin_token=os.getenv("ADMIN_TOKEN", ""),
+        )
+
+    def wants(self, profile_header: str | None = None) -> bool:
+        """Should this request be profiled?"""
+        if not self.enabled:
+            return False
+        if profile_header and self.admin_token and hmac.compare_digest(profile_header, self.admin_token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile_thread(self):
+        """Sample the calling thread until the block exits; set `.label` on the yielded target."""
+        tid = threading.get_ident()
+        target = _Target()
+        with self._lock:
+            self._targets[tid] = target
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._sampler.start()
+        try:
+            yield target
+        finally:
+            with self._lock:
+                self._targets.pop(tid, None)
+                self._requests[target.label] += 1
+                for stack, n in target.samples.items():
+                    self._stacks[(target.label,) + stack] += n
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._sampler = None
+                    return
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for tid, target in targets:
+                frame = frames.get(tid)
+                if frame is not None:
+                    target.samples[_stack_of(frame)] += 1
+            time.sleep(self.interval_s)
+
+    def folded(self) -> str:
+        """Folded stacks ("label;outer;...;inner count" per line) for flame-graph tools."""
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in items)
+
+    def summary(self) -> dict:
+        with self._lock:
+            per_label: dict[str, Counter] = {}
+            for stack, n in self._stacks.items():
+                per_label.setdefault(stack[0], Counter())[stack[-1]] += n
+            return {
+                label: {
+                    "requests": self._requests[label],
+                    "samples": sum(leaves.values()),
+                    "top_frames": leaves.most_common(10),
+                }
+                for label, leaves in per_label.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._requests.clear()
+
+
+def _stack_of(frame) -> tuple[str, ...]:
+    """Outermost-first stack, trimmed to start at the first frame from this backend."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, f"{os.path.basename(code.co_filename)}:{code.co_name}"))
+        frame = frame.f_back
+    stack.reverse()
+    for i, (filename, _) in enumerate(stack):
+        if filename.startswith(_BACKEND_DIR):
+            stack = stack[i:]
+            break
+    return tuple(name for _, name in stack)
@@ -0,0 +1,135 @@
+"""
+Compact record types for rows the engine keeps in memory.
+
+Product, Order, OrderItem and Pattern use __slots__ instead of a per-row
+__dict__, so a worker holding the full catalog, its order caches and the rule
+set pays for one small fixed-size object per row rather than a dict.
+
+Use `Record.row_factory` as a sqlite3 row factory with a SELECT whose columns
+follow the class's field order (`Record.COLUMNS` spells them out):
+
+    conn.row_factory = Product.row_factory
+    conn.execute(f"SELECT {Product.COLUMNS} FROM faq_db_products")
+
+Records unpack like tuples and support `rec["field"]` / `rec.get("field")`,
+so code written against the old dict rows keeps working.
+
+Run this file for a memory report comparing dict rows with slotted records:
+
+    python records.py --rows 100000
+"""
+from dataclasses import dataclass
+
+
+class Record:
+    """Mixin for the slotted dataclasses below: row factory plus dict/tuple-style reads."""
+    __slots__ = ()
+    COLUMNS = ""
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        return cls(*row)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __getitem__(self, name: str):
+        try:
+            return getattr(self, name)
+        except (AttributeError, TypeError):
+            raise KeyError(name) from None
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def record(cls):
+    cls = dataclass(slots=True)(cls)
+    cls.COLUMNS = ", ".join(cls.__slots__)
+    return cls
+
+
+@record
+class Product(Record):
+    id: int
+    sku: str | None
+    name: str | None
+    category: str | None
+    price: float | None
+    sale_price: float | None
+    is_trending: int | None
+    is_on_sale: int | None
+    sizes: str | None
+    colors: str | None
+    material: str | None
+    description: str | None
+    stock_qty: int | None
+    shipping_note: str | None
+    return_note: str | None
+
+
+@record
+class Order(Record):
+    id: int
+    customer_id: int | None
+    order_number: str | None
+    placed_at: str | None
+    status: str | None
+    shipping_carrier: str | None
+    tracking_number: str | None
+    eta_date: str | None
+
+
+@record
+class OrderItem(Record):
+    sku: str | None
+    name: str | None
+    qty: int | None
+
+
+@record
+class Pattern(Record):
+    """One faq_db_pattern row."""
+    intent: str
+    type: str
+    pattern: str
+    weight: float
+
+
+def memory_report(rows: int) -> dict:
+    """Bytes allocated for `rows` catalog rows held as dicts vs. as Product records."""
+    import tracemalloc
+
+    def sample(i):
+        return (i, f"SKU-{i}", f"Product {i}", ("men", "women", "accessories")[i % 3], 10.0 + i,
+                8.0 + i if i % 2 else None, i % 2, i % 2, "S,M,L", "Red,Blue", "Cotton",
+                "Nice", 5, "2-3 days", "30 days")
+
+    # the column values are shared by both layouts; only measure the containers
+    values = [sample(i) for i in range(rows)]
+    report = {"rows": rows}
+    for label, build in (("dict", lambda v: dict(zip(Product.__slots__, v))), ("slots", lambda v: Product(*v))):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        held = [build(v) for v in values]
+        report[f"{label}_bytes"] = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del held
+    report["saved_bytes"] = report["dict_bytes"] - report["slots_bytes"]
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-worker memory for catalog rows: dicts vs. slotted records.")
+    parser.add_argument("--rows", type=int, default=100_000, help="catalog rows to hold (default: %(default)s)")
+    r = memory_report(parser.parse_args().rows)
+    mb = 1024 * 1024
+    print(f"{r['rows']} products held in memory (per worker):")
+    print(f"  dict rows:      {r['dict_bytes'] / mb:8.1f} MB  ({r['dict_bytes'] / r['rows']:.0f} B/row)")
+    print(f"  Product slots:  {r['slots_bytes'] / mb:8.1f} MB  ({r['slots_bytes'] / r['rows']:.0f} B/row)")
+    print(f"  saved:          {r['saved_bytes'] / mb:8.1f} MB  ({100 * r['saved_bytes'] / r['dict_bytes']:.0f}%)")
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+# The engine reads its configuration at import time: point it at a scratch
+# directory so the suite never touches backend/data.
+_SCRATCH = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ.setdefault("DB_FILE", os.path.join(_SCRATCH, "chatbot_db.db"))
+os.environ.setdefault("RULES_ARTIFACT_FILE", os.path.join(_SCRATCH, "rules_artifact.json"))
+os.environ.setdefault("LEMMA_TABLE_FILE", os.path.join(_SCRATCH, "lemma_table.json"))
+os.environ.setdefault("CONVERSATION_LOG_FILE", "")
+os.environ.setdefault("KB_TENANTS", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FYP_chatbot_LEE_YEN_YEN as bot  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE faq_db (id INTEGER PRIMARY KEY, intent TEXT, answer TEXT);
+CREATE TABLE faq_db_pattern (id INTEGER PRIMARY KEY, intent TEXT, type TEXT, pattern TEXT, weight REAL);
+CREATE TABLE user_profile (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, email TEXT, created_at TEXT);
+CREATE TABLE faq_db_orders (id INTEGER PRIMARY KEY, customer_id INTEGER, order_number TEXT, placed_at TEXT,
+                            status TEXT, shipping_carrier TEXT, tracking_number TEXT, eta_date TEXT);
+CREATE TABLE faq_db_order_items (id INTEGER PRIMARY KEY, order_id INTEGER, sku TEXT, name TEXT, qty INTEGER);
+CREATE TABLE faq_db_products (id INTEGER PRIMARY KEY, sku TEXT, name TEXT, category TEXT, price REAL,
+                              sale_price REAL, is_trending INTEGER, is_on_sale INTEGER, sizes TEXT, colors TEXT,
+                              material TEXT, description TEXT, stock_qty INTEGER, shipping_note TEXT,
+                              return_note TEXT);
+"""
+
+
+def make_db(path: str, patterns=()):
+    """A small knowledge base: answers, the given (intent, type, pattern, weight) rules, two users, orders, products."""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO faq_db (intent, answer) VALUES (?, ?)",
+                         [("fallback", "Sorry, I couldn't understand your request."), ("track_order", "Let me check.")])
+        conn.executemany("INSERT INTO faq_db_pattern (intent, type, pattern, weight) VALUES (?, ?, ?, ?)", patterns)
+        conn.executemany("INSERT INTO user_profile (name, email, created_at) VALUES (?, ?, '2025-01-01')",
+                         [("Jane", "jane@example.com"), ("Bob", "bob@example.com")])
+        conn.executemany("INSERT INTO faq_db_orders VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            (1, 1, "184533", "2025-09-01 10:00:00", "in_transit", "DHL", "DHLMY1", "2025-09-04"),
+            (2, 1, "184534", "2025-09-02 10:00:00", "processing", None, None, None),
+            (3, 2, "184600", "2025-08-01 10:00:00", "processing", None, None, None),
+        ])
+        conn.executemany("INSERT INTO faq_db_order_items (order_id, sku, name, qty) VALUES (?, ?, ?, ?)",
+                         [(1, "TEE-1", "Cotton Tee", 2), (2, "JEAN-1", "Jeans", 1), (3, "CAP-1", "Cap", 1)])
+        conn.executemany("INSERT INTO faq_db_products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (i, f"SKU-{i}", f"Product {i}", ("men", "women", "accessories")[i % 3], 10.0 + i, None,
+             i % 2, 0, "S,M,L", "Red", "Cotton", "Nice", 5, "2-3 days", "30 days") for i in range(1, 6)
+        ])
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def kb(tmp_path):
+    """A fresh knowledge base in tmp_path, active for the duration of the test."""
+    knowledge_base = bot.KnowledgeBase("test", make_db(str(tmp_path / "kb.db")),
+                                       str(tmp_path / "rules_artifact.json"))
+    with bot.use_kb(knowledge_base):
+        yield knowledge_base
@@ -0,0 +1,115 @@
+import json
+import logging
+import sqlite3
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+
+def _write(kb, sql, *params):
+    conn = sqlite3.connect(kb.db_file)
+    with conn:
+        conn.execute(sql, params)
+    conn.close()
+
+
+def _tables(kb):
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    finally:
+        conn.close()
+
+
+def test_feed_is_opt_in(kb, monkeypatch):
+    assert bot.start_change_feed(0) == {}
+    monkeypatch.setattr(bot, "CHANGE_POLL_INTERVAL", 0)
+    bot.upsert_products([{"sku": "SKU-1", "price": 99.0}])
+    assert "faq_db_changes" not in _tables(kb)
+
+
+def test_install_logs_schema_change_once(kb, caplog):
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        with caplog.at_level(logging.WARNING, logger=bot.logger.name):
+            assert bot.install_change_log(conn, ("faq_db_products", "faq_db_orders"), kb.db_file)
+            assert not bot.install_change_log(conn, ("faq_db_products", "faq_db_orders"), kb.db_file)
+    finally:
+        conn.close()
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 1
+    assert "faq_db_changes" in messages[0] and "trg_orders_changes_update" in messages[0]
+
+
+def test_product_changes_patch_the_catalog(kb):
+    bot.init_change_feed(kb)
+    before = bot.get_catalog()
+    _write(kb, "UPDATE faq_db_products SET price = 1.5 WHERE id = 1")
+    _write(kb, "DELETE FROM faq_db_products WHERE id = 2")
+    _write(kb, "INSERT INTO faq_db_products (id, sku, name, category, price) VALUES (9, 'SKU-9', 'A first', 'men', 3.0)")
+    assert bot.poll_changes(kb) == 3
+    after = bot.get_catalog()
+    assert after is not before
+    assert after["by_id"][1].price == 1.5
+    assert 2 not in after["by_id"]
+    assert after["ordered"][0].id == 9   # sorted by name like a fresh load
+    assert before["by_id"][1].price == 11.0   # the old snapshot is untouched
+    assert bot.poll_changes(kb) == 0
+
+
+def test_order_changes_drop_only_the_affected_caches(kb):
+    bot.init_change_feed(kb)
+    jane, _ = bot.get_order_overview("jane@example.com")
+    bot.get_order_overview("bob@example.com")
+    assert {o.id for o in jane} == {1, 2}
+    kb.order_summaries.update({1: (float("inf"), "old 1"), 3: (float("inf"), "old 3")})
+
+    _write(kb, "UPDATE faq_db_orders SET status = 'delivered' WHERE id = 2")
+    _write(kb, "INSERT INTO faq_db_order_items (order_id, sku, name, qty) VALUES (1, 'SOCK-1', 'Socks', 3)")
+    assert bot.poll_changes(kb) == 2
+    assert "jane@example.com" not in kb.order_cache
+    assert "bob@example.com" in kb.order_cache
+    assert 1 not in kb.order_summaries and 3 in kb.order_summaries
+    assert {o.id for o in bot.get_order_overview("jane@example.com")[0]} == {1}
+
+
+def test_order_moved_to_another_customer_dirties_both(kb):
+    bot.init_change_feed(kb)
+    bot.get_order_overview("jane@example.com")
+    bot.get_order_overview("bob@example.com")
+    _write(kb, "UPDATE faq_db_orders SET customer_id = 1 WHERE id = 3")
+    bot.poll_changes(kb)
+    assert kb.order_cache == {}
+
+
+def test_pruned_log_resets_caches(kb):
+    bot.init_change_feed(kb)
+    bot.get_catalog()
+    bot.get_order_overview("jane@example.com")
+    for price in (1.0, 2.0, 3.0):
+        _write(kb, "UPDATE faq_db_products SET price = ? WHERE id = 1", price)
+    _write(kb, "DELETE FROM faq_db_changes WHERE version < (SELECT MAX(version) FROM faq_db_changes)")
+    bot.poll_changes(kb)
+    assert kb.change_stats["resets"] == 1
+    assert kb.catalog is None and kb.order_cache == {}
+    assert bot.get_catalog()["by_id"][1].price == 3.0
+
+
+def test_log_is_pruned_to_keep(kb, monkeypatch):
+    monkeypatch.setattr(bot, "CHANGE_LOG_KEEP", 2)
+    bot.init_change_feed(kb)
+    for price in (1.0, 2.0, 3.0, 4.0):
+        _write(kb, "UPDATE faq_db_products SET price = ? WHERE id = 1", price)
+    bot.poll_changes(kb)
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM faq_db_changes").fetchone()[0] == 2
+    finally:
+        conn.close()
+
+
+def test_stats_are_keyed_by_tenant_without_paths(kb, monkeypatch):
+    monkeypatch.setitem(bot._KBS, "test", kb)
+    bot.init_change_feed(kb)
+    stats = bot.get_change_feed_stats()["test"]
+    assert stats["versions"] == {"knowledge_base": 0}
+    assert kb.db_file not in json.dumps(bot.get_change_feed_stats())
@@ -0,0 +1,20 @@
+import chatbot_cli
+
+
+def test_read_scripts_skips_malformed_json_lines(tmp_path, capsys):
+    path = tmp_path / "scripts.jsonl"
+    path.write_text("\n".join([
+        '{"id": "a", "messages": ["hi", "track my order"]}',
+        '{"id": "b", "message": "typo"}',
+        '{"id": "c", "messages": "not a list"}',
+        '{not json',
+        '',
+        '{"messages": ["bye"], "context": {"waiting_for": "provide_email"}}',
+    ]), encoding="utf-8")
+    assert list(chatbot_cli.read_scripts(str(path))) == [
+        ("a", ["hi", "track my order"], {}),
+        ("scripts.jsonl:6", ["bye"], {"waiting_for": "provide_email"}),
+    ]
+    err = capsys.readouterr().err
+    assert "scripts.jsonl: line 2: skipped" in err
+    assert "line 3: skipped" in err and "line 4: skipped" in err
@@ -0,0 +1,48 @@
+import pytest
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+from convlog import ConversationLog, read_log
+
+
+class _Log:
+    def __init__(self, messages: bool):
+        self.messages = messages
+        self.records = []
+
+    def write(self, record: dict):
+        self.records.append(record)
+
+
+@pytest.fixture
+def log(kb, monkeypatch):
+    def install(messages: bool = False) -> _Log:
+        stub = _Log(messages)
+        monkeypatch.setattr(bot, "conversation_log", stub)
+        return stub
+    monkeypatch.setitem(bot._KBS, "test", kb)
+    return install
+
+
+def test_message_text_is_off_by_default(log):
+    records = log().records
+    bot.generate_reply_api("where is my order, I am jane@example.com", {}, "test")
+    assert "message" not in records[0]
+    assert records[0]["message_chars"] == len("where is my order, I am jane@example.com")
+
+
+def test_opt_in_masks_emails_and_skips_sensitive_prompts(log):
+    records = log(messages=True).records
+    bot.generate_reply_api("where is my order, I am jane@example.com", {}, "test")
+    bot.generate_reply_api("jane@example.com", {"waiting_for": "provide_email"}, "test")
+    bot.generate_reply_api("the parcel came wet", {"waiting_for": "feedback_other_pending"}, "test")
+    assert records[0]["message"] == "where is my order, I am <email>"
+    assert "message" not in records[1] and "message" not in records[2]
+    assert records[2]["message_chars"] == len("the parcel came wet")
+
+
+def test_stats_have_no_path(tmp_path):
+    conv = ConversationLog(str(tmp_path / "conversations.jsonl"), flush_interval=0.01)
+    conv.write({"sid": "a", "message_chars": 3})
+    conv.close()
+    assert conv.stats() == {"written": 1, "pending": 0, "dropped": 0}
+    assert list(read_log(str(tmp_path / "conversations.jsonl"))) == [{"sid": "a", "message_chars": 3}]
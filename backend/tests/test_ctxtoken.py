@@ -0,0 +1,131 @@
+import base64
+
+import pytest
+
+import ctxtoken
+from ctxtoken import ContextTokens, InvalidToken, pack, unpack
+
+CONTEXTS = [
+    {},
+    {"waiting_for": "choose_order_to_track", "order_choice_ids": [1, 2, 3],
+     "user": {"user_id": 7, "name": "Jane", "email": "jane@example.com"}},
+    {"waiting_for": "some_future_state", "last_choice": -3, "end_session": False, "sid": "abc"},
+    {"menu_state": "root", "pending_order_number": "184533", "user": {"email": "ünïcode@example.com"}},
+    # keys and values outside FIELDS travel as JSON
+    {"last_choice": "2", "product_choice_ids": [1, -1], "extra": {"nested": [1, None, True]}},
+    {"last_results": list(range(1000, 1400)), "product_choice_ids": list(range(500))},
+]
+
+
+def _flip_last_char(token: str) -> str:
+    return token[:-1] + ("A" if token[-1] != "A" else "B")
+
+
+@pytest.mark.parametrize("ctx", CONTEXTS)
+def test_pack_round_trip(ctx):
+    assert unpack(pack(ctx)) == ctx
+
+
+@pytest.mark.parametrize("ctx", CONTEXTS)
+def test_token_round_trip(ctx):
+    tokens = ContextTokens("secret")
+    assert tokens.decode(tokens.encode(ctx, "shop"), "shop") == ctx
+
+
+def test_big_contexts_are_compressed():
+    tokens = ContextTokens("secret")
+    ctx = {"last_results": list(range(1000, 1400))}
+    token = tokens.encode(ctx, "shop")
+    raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    assert raw[1] & ctxtoken._FLAG_ZLIB
+    assert len(raw) < len(pack(ctx))
+
+
+def test_unpack_rejects_malformed_bodies():
+    body = pack({"sid": "abcdef"})
+    for bad in (body[:-2], body + b"\0", b"\x01", b"\x01\x00\xfe"):
+        with pytest.raises(InvalidToken):
+            unpack(bad)
+
+
+def test_tampered_tokens_are_rejected():
+    tokens = ContextTokens("secret")
+    token = tokens.encode({"order_choice_ids": [1, 2]}, "shop")
+    raw = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    raw[ctxtoken._HEADER.size + 3] ^= 0x01   # change an order id
+    forged = base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode("ascii")
+    for bad in (forged, _flip_last_char(token), token[:-4], "", "not base64!", "A" * 40,
+                "A" * (ctxtoken.MAX_TOKEN_CHARS + 1)):
+        with pytest.raises(InvalidToken):
+            tokens.decode(bad, "shop")
+    assert tokens.stats()["rejected"] == 7
+
+
+def test_token_is_bound_to_tenant_and_key():
+    token = ContextTokens("secret").encode({"sid": "x"}, "shop")
+    with pytest.raises(InvalidToken, match="bad signature"):
+        ContextTokens("secret").decode(token, "other-shop")
+    with pytest.raises(InvalidToken, match="bad signature"):
+        ContextTokens("another secret").decode(token, "shop")
+
+
+def test_tokens_expire_after_ttl(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(ctxtoken.time, "time", lambda: now[0])
+    tokens = ContextTokens("secret", ttl=60)
+    token = tokens.encode({"sid": "x"}, "shop")
+    now[0] += 60
+    assert tokens.decode(token, "shop") == {"sid": "x"}
+    now[0] += 1
+    with pytest.raises(InvalidToken, match="expired"):
+        tokens.decode(token, "shop")
+    assert ContextTokens("secret", ttl=0).decode(token, "shop") == {"sid": "x"}
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("CONTEXT_TOKEN_SECRET", raising=False)
+    assert ContextTokens.from_env() is None
+    monkeypatch.setenv("CONTEXT_TOKEN_SECRET", "s")
+    monkeypatch.setenv("CONTEXT_TOKEN_TTL", "5")
+    assert ContextTokens.from_env().ttl == 5.0
+
+
+def test_stats():
+    tokens = ContextTokens("secret")
+    assert tokens.stats() == {"issued": 0, "opened": 0, "rejected": 0, "avg_chars": 0.0}
+    token = tokens.encode({"sid": "x"}, "shop")
+    tokens.decode(token, "shop")
+    assert tokens.stats() == {"issued": 1, "opened": 1, "rejected": 0, "avg_chars": float(len(token))}
+
+
+def test_client_context_only_trusts_tokens(monkeypatch):
+    app = pytest.importorskip("app")
+    tokens = ContextTokens("secret")
+    monkeypatch.setattr(app, "context_tokens", tokens)
+    tenant = app.get_kb(None).name
+    user = {"user_id": 1, "name": "Jane", "email": "jane@example.com"}
+    forged = {"user": user, "waiting_for": "choose_order_to_track", "order_choice_ids": [3]}
+    assert app._client_context(forged, None, None) == {}
+    assert app._client_context(None, tokens.encode(forged, tenant), None) == forged
+    with pytest.raises(InvalidToken):
+        app._client_context(None, tokens.encode(forged, tenant + "-other"), None)
+
+
+def test_identify_returns_a_token_and_chat_ignores_a_bare_user(kb, monkeypatch):
+    app = pytest.importorskip("app")
+    testclient = pytest.importorskip("fastapi.testclient")
+    import FYP_chatbot_LEE_YEN_YEN as bot
+
+    tokens = ContextTokens("secret")
+    monkeypatch.setattr(app, "context_tokens", tokens)
+    monkeypatch.setitem(bot._KBS, bot.DEFAULT_TENANT, kb)
+    client = testclient.TestClient(app.app)
+
+    res = client.post("/identify", json={"email": "jane@example.com", "name": "Jane"}).json()
+    assert res["user"]["user_id"] == 1
+    assert tokens.decode(res["token"], kb.name)["user"]["email"] == "jane@example.com"
+    assert client.post("/identify", json={"email": "jane@example.com", "token": "forged"}).status_code == 400
+
+    bare = {"user": {"user_id": 2, "email": "bob@example.com"}}
+    out = client.post("/chat", json={"message": "hi", "context": bare}).json()
+    assert tokens.decode(out["token"], kb.name).get("user", {}).get("email") is None
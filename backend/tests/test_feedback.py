@@ -0,0 +1,40 @@
+import sqlite3
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+
+def _daily(kb):
+    conn = sqlite3.connect(kb.db_file)
+    try:
+        return {row[:3]: row[3] for row in conn.execute(
+            "SELECT day, rating, category, n FROM faq_db_feedback_daily WHERE n > 0")}
+    finally:
+        conn.close()
+
+
+def _write(kb, sql, *params):
+    conn = sqlite3.connect(kb.db_file)
+    with conn:
+        conn.execute(sql, params)
+    conn.close()
+
+
+def test_updates_move_the_count(kb):
+    bot.ensure_feedback_table()
+    _write(kb, "INSERT INTO faq_db_chatbot_feedback (rating, category, created_at) VALUES (2, 'delivery', '2025-09-01 10:00:00')")
+    _write(kb, "INSERT INTO faq_db_chatbot_feedback (rating, category, created_at) VALUES (2, 'delivery', '2025-09-01 11:00:00')")
+    _write(kb, "UPDATE faq_db_chatbot_feedback SET rating = 5, category = NULL WHERE id = 1")
+    _write(kb, "UPDATE faq_db_chatbot_feedback SET created_at = '2025-09-02 09:00:00' WHERE id = 2")
+    _write(kb, "UPDATE faq_db_chatbot_feedback SET comment = 'thanks' WHERE id = 2")
+    assert _daily(kb) == {("2025-09-01", 5, ""): 1, ("2025-09-02", 2, "delivery"): 1}
+
+
+def test_counts_are_rebuilt_when_the_update_trigger_is_missing(kb):
+    bot.ensure_feedback_table()
+    _write(kb, "INSERT INTO faq_db_chatbot_feedback (rating, category, created_at) VALUES (4, 'app', '2025-09-01 10:00:00')")
+    # an older install: no UPDATE trigger, so an edit left the counts behind
+    _write(kb, "DROP TRIGGER trg_feedback_daily_update")
+    _write(kb, "UPDATE faq_db_chatbot_feedback SET rating = 1")
+    assert _daily(kb) == {("2025-09-01", 4, "app"): 1}
+    bot.ensure_feedback_analytics()
+    assert _daily(kb) == {("2025-09-01", 1, "app"): 1}
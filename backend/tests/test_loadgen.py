@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+loadgen = pytest.importorskip("loadgen")
+if loadgen.httpx is None:
+    pytest.skip("loadgen needs httpx", allow_module_level=True)
+
+
+class _Response:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class _TokenServer:
+    """Stands in for /chat with CONTEXT_TOKEN_SECRET set: state lives only in the token."""
+
+    def __init__(self):
+        self.bodies = []
+
+    async def post(self, url, json):
+        self.bodies.append(json)
+        turn = int(json["token"]) if "token" in json else 0
+        if turn == 2:
+            return _Response(400, {"detail": "Invalid context token: token expired"})
+        return _Response(200, {"reply": "ok", "context": {"waiting_for": "provide_email"}, "token": str(turn + 1)})
+
+
+def test_run_client_carries_the_token_like_chat_js(monkeypatch):
+    server = _TokenServer()
+    monkeypatch.setattr(loadgen, "SCRIPTS", {"s": ["a", "b", "c"]})
+    # the step ends once four requests have been sent
+    monkeypatch.setattr(loadgen.time, "perf_counter", lambda: float("inf") if len(server.bodies) >= 4 else 1.0)
+    result = loadgen.StepResult()
+    asyncio.run(loadgen.run_client(server, "/chat", "jane@example.com", ["s"], 1e9, 0.0, result))
+    assert server.bodies == [
+        {"message": "a", "context": {}},
+        {"message": "b", "token": "1"},
+        {"message": "c", "token": "2"},   # rejected: start over without the token
+        {"message": "a", "context": {}},
+    ]
+    assert result.errors == 1
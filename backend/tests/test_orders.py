@@ -0,0 +1,40 @@
+import sqlite3
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+from conftest import make_db
+
+
+def _write(path, sql, *params):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(sql, params)
+    conn.close()
+
+
+def test_order_writes_drop_the_cache_without_the_change_feed(kb):
+    open_orders, _ = bot.get_order_overview("jane@example.com")
+    assert {o.status for o in open_orders} == {"in_transit", "processing"}
+    bot.prefetch_order_summaries(open_orders)
+    assert set(kb.order_summaries) == {1, 2}
+
+    _write(kb.db_file, "UPDATE faq_db_orders SET status = 'delivered' WHERE id = 1")
+    assert [o.id for o in bot.get_order_overview("jane@example.com")[0]] == [2]
+    assert kb.order_summaries == {}
+
+
+def test_cache_survives_reads(kb):
+    bot.get_order_overview("bob@example.com")   # the first lookup creates indexes, itself a write
+    bot.get_order_overview("jane@example.com")
+    hit = kb.order_cache["jane@example.com"]
+    bot.get_order_overview("bob@example.com")
+    assert kb.order_cache["jane@example.com"] is hit
+
+
+def test_duplicate_emails_keep_all_their_orders(tmp_path):
+    path = make_db(str(tmp_path / "dup.db"))
+    _write(path, "INSERT INTO user_profile (id, name, email, created_at) VALUES (9, 'J', 'JANE@example.com', '')")
+    _write(path, "INSERT INTO faq_db_orders VALUES (9, 9, '184999', '2025-09-03 10:00:00', 'processing', NULL, NULL, NULL)")
+    with bot.use_kb(bot.KnowledgeBase("dup", path, str(tmp_path / "rules.json"))) as kb:
+        assert {o.id for o in bot.get_order_overview("jane@example.com")[0]} == {1, 2, 9}
+        assert bot.fetch_order_by_number("184999", "jane@example.com")[0].id == 9
+        assert kb.unique_emails is False
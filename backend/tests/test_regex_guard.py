@@ -0,0 +1,147 @@
+import json
+import sqlite3
+
+import pytest
+
+import FYP_chatbot_LEE_YEN_YEN as bot
+
+# Nested or overlapping quantifiers that backtrack exponentially on a near-miss
+CATASTROPHIC = [
+    r"(a+)+$",
+    r"(a|aa)+$",
+    r"^(a|a?)+$",
+    r"(x+x+)+y",
+    r"(\d+)*x",
+    r"(\w+\s?)+$",
+    r"(\w+\.?)+@",
+    r"(\s*,\s*)+$",
+    r"(\s*-\s*)+$",
+    r"(?:\s*/\s*)+$",
+    r"(,|\s*,)+$",
+    r"^(\w+\s*)+!$",   # the usual "!" terminator would match here
+    r"(.*)(.*)(.*)x",   # quartic
+    r"(.*),(.*),(.*)z",
+]
+
+# Patterns of the kind faq_db_pattern actually holds
+BENIGN = [
+    r"where is (\d{5,})",
+    r"\b(\d{5,})\b",
+    r"^(yes|yeah|sure)\b",
+    r"track.*order",
+    r"(?:where|when).*(?:order|parcel)",
+    r"\border\s*#?\s*(\d+)",
+    r"[\w.+-]+@[\w-]+\.[\w.]+",
+    r"\b(\w+)\s*,\s*(\w+)\b",
+    # bounded at REGEX_MAX_INPUT: quadratic or cubic, never exponential
+    r".*\b(\d{5,})\b.*",
+    r"(.*)order(.*)status",
+    r"(\w+)\s+(\w+)\s+order",
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_verdicts():
+    bot._regex_verdicts.clear()
+    yield
+    bot._regex_verdicts.clear()
+
+
+@pytest.mark.parametrize("pattern", CATASTROPHIC)
+def test_catastrophic_patterns_are_rejected(pattern):
+    error = bot.check_regex_rule(pattern)
+    assert error and error.startswith("too slow"), error
+
+
+@pytest.mark.parametrize("pattern", BENIGN)
+def test_benign_patterns_pass(pattern):
+    assert bot.check_regex_rule(pattern) is None
+
+
+def test_invalid_pattern_reports_compile_error():
+    assert "missing )" in bot.check_regex_rule(r"(unclosed")
+
+
+def test_pattern_alphabet_reads_escapes_and_punctuation():
+    words, puncts = bot._pattern_alphabet(r"^(\w+\s*)+!$")
+    assert words == ["a"]
+    assert puncts == ["!"]
+    assert bot._pattern_alphabet(r"order\s*#\.(\d+)") == (["order", "1"], ["#", "."])
+
+
+def _insert_patterns(kb, rows):
+    conn = sqlite3.connect(kb.db_file)
+    with conn:
+        conn.executemany("INSERT INTO faq_db_pattern (intent, type, pattern, weight) VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+
+
+def test_build_leaves_out_slow_regex(kb):
+    _insert_patterns(kb, [("track_order", "regex", r"where is (\d{5,})", 3.0),
+                          ("spam", "regex", r"(\s*,\s*)+$", 1.0)])
+    artifact = bot.build_rules_artifact()
+    assert [r["pattern"] for r in artifact["rules"]] == [r"where is (\d{5,})"]
+    assert artifact["invalid"][0]["intent"] == "spam"
+    assert artifact["version"] == bot.RULES_ARTIFACT_VERSION
+
+
+def test_build_records_the_benchmark(kb):
+    _insert_patterns(kb, [("track_order", "regex", r".*\b(\d{5,})\b.*", 3.0)])
+    cost = bot.build_rules_artifact()["rules"][0]["cost"]
+    assert 1.5 < cost["degree"] <= bot.REGEX_MAX_DEGREE
+    assert cost["chars"] == bot.REGEX_MAX_INPUT and cost["ms"] > 0
+
+
+def _artifact(cost_ms):
+    return {"source_hash": "x", "rules": [
+        {"intent": "track_order", "type": "regex", "pattern": r"where is (\d{5,})", "weight": 3.0,
+         "cost": {"degree": 1.0, "ms": cost_ms, "probe": "a", "chars": 500}},
+        {"intent": "spam", "type": "regex", "pattern": r"(a|aa)+$", "weight": 1.0},   # no cost: not re-timed
+    ]}
+
+
+def test_compile_trusts_the_artifact_and_reports_drift(kb, monkeypatch):
+    timed = []
+    monkeypatch.setattr(bot, "_time_search", lambda regex, text, repeat=1: timed.append(regex.pattern) or 1.0)
+    rules = bot.compile_rules(_artifact(cost_ms=1.0))
+    assert list(rules["by_intent"]) == ["track_order", "spam"]
+    assert rules["drifted"] == [] and timed == [r"where is (\d{5,})"]
+
+    rules = bot.compile_rules(_artifact(cost_ms=0.2))
+    assert list(rules["by_intent"]) == ["track_order", "spam"]   # still enabled
+    assert rules["drifted"] == [{"intent": "track_order", "pattern": r"where is (\d{5,})",
+                                 "built_ms": 0.2, "ms": 1.0}]
+
+
+def test_public_summary_has_counts_only(kb, monkeypatch):
+    monkeypatch.setitem(bot._KBS, "test", kb)
+    monkeypatch.setattr(bot, "_time_search", lambda regex, text, repeat=1: 1.0)
+    kb.rules = bot.compile_rules(_artifact(cost_ms=0.1))
+    summary = bot.get_regex_summary()["test"]
+    assert summary == {"rules": 2, "drifted": 1, "calls": 0, "total_ms": 0.0}
+    assert "where is" not in json.dumps(bot.get_regex_summary())
+    detail = bot.get_regex_stats()["test"]
+    assert {r["pattern"] for r in detail["slowest"]} == {r"where is (\d{5,})", r"(a|aa)+$"}
+    assert detail["drifted"][0]["intent"] == "track_order"
+
+
+def test_artifact_from_older_version_is_rebuilt(kb):
+    _insert_patterns(kb, [("spam", "regex", r"(\s*,\s*)+$", 1.0)])
+    rows = bot._fetch_rule_rows()
+    stale = {"version": 1, "source_hash": bot.rules_source_hash(rows), "built_at": "",
+             "rules": [{"intent": "spam", "type": "regex", "pattern": r"(\s*,\s*)+$", "weight": 1.0}],
+             "invalid": []}
+    with open(kb.rules_artifact_file, "w", encoding="utf-8") as f:
+        json.dump(stale, f)
+    assert bot.read_rules_artifact() is None
+    rules = bot.load_rules()
+    assert rules["by_intent"] == {}
+    with open(kb.rules_artifact_file, encoding="utf-8") as f:
+        assert json.load(f)["version"] == bot.RULES_ARTIFACT_VERSION
+
+
+def test_get_intent_caps_regex_input(kb, monkeypatch):
+    _insert_patterns(kb, [("track_order", "regex", r"where is (\d{5,})", 3.0)])
+    monkeypatch.setattr(bot, "preprocess_text", lambda text, persist=False: text.lower().split())
+    assert bot.get_intent("where is 184533") == ("track_order", "184533")
+    assert bot.get_intent("x" * bot.REGEX_MAX_INPUT + " where is 184533") == ("fallback", None)
@@ -1,5 +1,6 @@
 try {
   sessionStorage.removeItem("rb_ctx");
+  sessionStorage.removeItem("rb_token");
   sessionStorage.removeItem("rb_open");
   sessionStorage.removeItem("rb_greeted");
 } catch {}
@@ -8,15 +9,22 @@ try {
   const API_BASE = (window.API_BASE || "http://127.0.0.1:8000").replace(/\/+$/, "");
   const CHAT_URL = API_BASE + "/chat";
 
-  // Persist context across pages (so navigation doesn’t lose the chat)
+  // Persist context across pages (so navigation doesn’t lose the chat).
+  // If the API signs context tokens, the token carries the state and ctx is display-only.
   let ctx = {};
+  let token = null;
   try {
     const saved = sessionStorage.getItem("rb_ctx");
     if (saved) ctx = JSON.parse(saved);
+    token = sessionStorage.getItem("rb_token");
   } catch {}
 
   function saveCtx() {
-    try { sessionStorage.setItem("rb_ctx", JSON.stringify(ctx || {})); } catch {}
+    try {
+      sessionStorage.setItem("rb_ctx", JSON.stringify(ctx || {}));
+      if (token) sessionStorage.setItem("rb_token", token);
+      else sessionStorage.removeItem("rb_token");
+    } catch {}
   }
 
   // Build DOM
@@ -116,13 +124,25 @@ closeBtn.addEventListener("click", () => {
       const res = await fetch(CHAT_URL, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message, context: ctx }),
+        body: JSON.stringify(token ? { message, token } : { message, context: ctx }),
       });
       const data = await res.json();
       setTyping(false);
 
+      // expired/invalid token: start over with a fresh conversation
+      if (res.status === 400 && token) {
+        token = null;
+        ctx = {};
+        saveCtx();
+        addMsg("bot", "Your previous chat session expired. Please send that again.");
+        send.disabled = false;
+        input.focus();
+        return;
+      }
+
       // keep / persist context
       ctx = data.context || {};
+      token = data.token || null;
       saveCtx();
 
       addMsg("bot", data.reply || "(No reply)");